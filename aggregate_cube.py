@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+集計キューブモジュール
+マージ後のデータを 対象県 × 回答年月 × 年代 × 居住都道府県 ごとに集計した値
+（回答数、7つの満足度の合計と回答数、54のフラグ列の合計）をファイルに保存し、
+元のCSVファイルを読み込まずに、これらの組み合わせごとの平均・件数を求める機能を提供
+
+県ごとに集計済みの行数と、その行のフィンガープリントを連結したハッシュ値を保存し、
+次回の実行では集計済みの行が変わっていない県は追加された行だけを集計する
+（変更・削除された県は、その県の集計値だけを作り直す）
+
+ファイルの形式:
+  - マジックナンバー SURVCUBE（8バイト）
+  - ヘッダーJSONの長さ（uint32、リトルエンディアン）とヘッダーJSON（列の定義、次元の値の一覧、県ごとの集計状態）
+  - 各セルの次元の値の番号（セル数×4個のuint32）
+  - 各セルの集計値（セル数×集計値の数のfloat64）
+"""
+
+import argparse
+import array
+import csv
+import hashlib
+import json
+import re
+import struct
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from atomic_write import AtomicWriter
+from date_sort import DATE_COLUMN, DATE_PATTERN
+from fingerprint import FIELD_SEPARATOR, row_fingerprint
+
+DEFAULT_CUBE_PATH = Path("output_merge/survey_cube.bin")
+MAGIC = b"SURVCUBE"
+CUBE_VERSION = 1
+SOURCE_COLUMN = "対象県（富山/石川/福井）"
+MONTH_DIMENSION = "回答年月"
+DIMENSIONS = (SOURCE_COLUMN, MONTH_DIMENSION, "年代", "居住都道府県")
+SATISFACTION_COLUMNS = (
+    "交通の満足度",
+    "満足度（食べ物・料理）",
+    "満足度（宿泊施設）",
+    "満足度（買い物（工芸品・特産品など））",
+    "満足度（観光・体験）",
+    "満足度（旅行全体）",
+    "満足度（商品・サービス）",
+)
+# フラグ列（0/1）の範囲（最初の列と最後の列）
+FLAG_RANGES = (
+    ("自家用車", "県外から訪れていない（福井県在住）"),
+    ("タクシー", "レンタサイクル"),
+    ("宿でのんびり過ごす", "その他の目的"),
+    ("Facebook", "その他"),
+)
+NUMBER_PATTERN = re.compile(r"\s*(\d+(?:\.\d+)?)")
+
+
+def flag_columns(headers: List[str]) -> List[str]:
+    columns = []
+    for first, last in FLAG_RANGES:
+        if first in headers and last in headers:
+            columns.extend(headers[headers.index(first):headers.index(last) + 1])
+    return columns
+
+
+def year_month(value: str) -> str:
+    """回答日を「YYYY-MM」に変換（解析できない場合は空文字列）"""
+    match = DATE_PATTERN.search(value or "")
+    return f"{int(match.group(1)):04d}-{int(match.group(2)):02d}" if match else ""
+
+
+def headers_digest(headers: List[str]) -> str:
+    return hashlib.blake2b(FIELD_SEPARATOR.join(headers).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _little_endian(values: array.array) -> bytes:
+    if sys.byteorder != "little":
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_little_endian(typecode: str, data) -> array.array:
+    values = array.array(typecode)
+    values.frombytes(data)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+class AggregateCube:
+    """
+    集計キューブ
+    各セルの集計値は [回答数, 満足度の合計×7, 満足度の回答数×7, フラグの合計×フラグ列の数] の順
+    """
+
+    def __init__(self, satisfaction: Sequence[str] = SATISFACTION_COLUMNS, flags: Sequence[str] = (),
+                 headers_digest: str = ""):
+        self.satisfaction = list(satisfaction)
+        self.flags = list(flags)
+        self.headers_digest = headers_digest
+        self.cells: Dict[Tuple[str, ...], List[float]] = {}
+        # 県ごとの集計済みの行数と、その行のフィンガープリントを連結したハッシュ値
+        self.sources: Dict[str, dict] = {}
+
+    @property
+    def width(self) -> int:
+        return 1 + 2 * len(self.satisfaction) + len(self.flags)
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["AggregateCube"]:
+        """保存済みのキューブを読み込む（存在しない・形式が異なる場合はNone）"""
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if not data.startswith(MAGIC):
+            return None
+        (length,) = struct.unpack_from("<I", data, len(MAGIC))
+        position = len(MAGIC) + 4
+        header = json.loads(data[position:position + length].decode("utf-8"))
+        if header.get("version") != CUBE_VERSION or header.get("dimensions") != list(DIMENSIONS):
+            return None
+        position += length
+        cube = cls(header["satisfaction"], header["flags"], header["headers_digest"])
+        cube.sources = header["sources"]
+        cell_count = header["cells"]
+        codes = _from_little_endian("I", data[position:position + 4 * len(DIMENSIONS) * cell_count])
+        position += 4 * len(DIMENSIONS) * cell_count
+        values = _from_little_endian("d", data[position:position + 8 * cube.width * cell_count])
+        tables = header["values"]
+        for i in range(cell_count):
+            key = tuple(tables[d][codes[i * len(DIMENSIONS) + d]] for d in range(len(DIMENSIONS)))
+            cube.cells[key] = list(values[i * cube.width:(i + 1) * cube.width])
+        return cube
+
+    def save(self, path: Path) -> bool:
+        """キューブを保存（内容が同じ場合は書き込まない）し、書き込んだかを返す"""
+        keys = sorted(self.cells)
+        tables = [sorted({key[d] for key in keys}) for d in range(len(DIMENSIONS))]
+        lookup = [{value: code for code, value in enumerate(table)} for table in tables]
+        codes = array.array("I", (lookup[d][key[d]] for key in keys for d in range(len(DIMENSIONS))))
+        values = array.array("d", (value for key in keys for value in self.cells[key]))
+        header = json.dumps({
+            "version": CUBE_VERSION,
+            "dimensions": list(DIMENSIONS),
+            "satisfaction": self.satisfaction,
+            "flags": self.flags,
+            "headers_digest": self.headers_digest,
+            "sources": self.sources,
+            "cells": len(keys),
+            "values": tables,
+        }, ensure_ascii=False).encode("utf-8")
+        atomic = AtomicWriter(path, "wb")
+        with atomic as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<I", len(header)))
+            f.write(header)
+            f.write(_little_endian(codes))
+            f.write(_little_endian(values))
+        return atomic.changed
+
+    def _aggregator(self, headers: List[str]):
+        """1行を集計値に加算する関数"""
+        dimension_indexes = [headers.index(SOURCE_COLUMN), headers.index(DATE_COLUMN),
+                             headers.index(DIMENSIONS[2]), headers.index(DIMENSIONS[3])]
+        satisfaction_indexes = [headers.index(column) for column in self.satisfaction]
+        flag_indexes = [headers.index(column) for column in self.flags]
+        offset = 1 + len(satisfaction_indexes)
+        flag_offset = 1 + 2 * len(satisfaction_indexes)
+        width = self.width
+
+        def add(cells: Dict[Tuple[str, ...], List[float]], row: List[str]):
+            if len(row) < len(headers):
+                row = row + [""] * (len(headers) - len(row))
+            source, date, age, residence = (row[i] for i in dimension_indexes)
+            key = (source, year_month(date), age, residence)
+            cell = cells.get(key)
+            if cell is None:
+                cell = cells[key] = [0.0] * width
+            cell[0] += 1
+            for n, index in enumerate(satisfaction_indexes):
+                match = NUMBER_PATTERN.match(row[index])
+                if match:
+                    cell[1 + n] += float(match.group(1))
+                    cell[offset + n] += 1
+            for n, index in enumerate(flag_indexes):
+                if row[index].strip() == "1":
+                    cell[flag_offset + n] += 1
+        return add
+
+    def update(self, headers: List[str], rows: Iterable[List[str]]) -> dict:
+        """
+        マージ後のデータで集計値を更新する（rowsは県ごとの行の順番が前回と同じであること）
+        集計済みの行が変わっていない県は追加された行だけを集計し、変わった県は作り直す
+        列の構成が変わった場合はすべて作り直す
+        """
+        digest = headers_digest(headers)
+        flags = flag_columns(headers)
+        if digest != self.headers_digest or flags != self.flags or \
+                any(column not in headers for column in self.satisfaction):
+            self.flags = flags
+            self.satisfaction = [column for column in SATISFACTION_COLUMNS if column in headers]
+            self.headers_digest = digest
+            self.cells = {}
+            self.sources = {}
+        add = self._aggregator(headers)
+        source_index = headers.index(SOURCE_COLUMN)
+
+        # 県ごとの 行数, 行のハッシュ値, 前回集計済みの範囲のハッシュ値
+        progress: Dict[str, list] = {}
+        added: Dict[Tuple[str, ...], List[float]] = {}
+        added_rows = 0
+        for row in rows:
+            source = row[source_index] if source_index < len(row) else ""
+            state = progress.get(source)
+            if state is None:
+                previous = self.sources.get(source, {"rows": 0, "digest": hashlib.blake2b().hexdigest()})
+                state = progress[source] = [0, hashlib.blake2b(), previous["rows"], None]
+                if previous["rows"] == 0:
+                    state[3] = state[1].hexdigest()
+            count, row_digest, previous_rows = state[0], state[1], state[2]
+            row_digest.update(row_fingerprint(row).encode("ascii"))
+            state[0] = count + 1
+            if count + 1 == previous_rows:
+                state[3] = row_digest.hexdigest()
+            elif count >= previous_rows:
+                add(added, row)
+                added_rows += 1
+
+        # 集計済みの行が変わった・減った県と、なくなった県は作り直す
+        rebuild = {source for source, state in progress.items()
+                   if state[2] and state[3] != self.sources.get(source, {}).get("digest")}
+        removed = set(self.sources) - set(progress)
+        if rebuild or removed:
+            stale = rebuild | removed
+            self.cells = {key: cell for key, cell in self.cells.items() if key[0] not in stale}
+            added = {key: cell for key, cell in added.items() if key[0] not in rebuild}
+            added_rows = sum(state[0] - state[2] if source not in rebuild else state[0]
+                             for source, state in progress.items())
+            if rebuild:
+                for row in rows:
+                    if (row[source_index] if source_index < len(row) else "") in rebuild:
+                        add(added, row)
+
+        for key, values in added.items():
+            cell = self.cells.get(key)
+            if cell is None:
+                self.cells[key] = values
+            else:
+                for i, value in enumerate(values):
+                    cell[i] += value
+        self.sources = {source: {"rows": state[0], "digest": state[1].hexdigest()}
+                        for source, state in sorted(progress.items())}
+        return {"rows": sum(state[0] for state in progress.values()), "added": added_rows,
+                "rebuilt": sorted(rebuild), "cells": len(self.cells)}
+
+    def query(self, group_by: Sequence[str] = (), where: Optional[Dict[str, object]] = None) -> List[dict]:
+        """
+        group_byの次元ごとに集計した結果を返す（whereは 次元 → 値 または値のリスト）
+        各結果は 次元の値、"回答数"、"満足度"（列 → 平均、回答がなければNone）、"フラグ"（列 → 合計）を持つ
+        例: cube.query(["対象県（富山/石川/福井）", "年代"], {"回答年月": ["2024-04", "2024-05"]})
+        """
+        for dimension in list(group_by) + list(where or {}):
+            if dimension not in DIMENSIONS:
+                raise ValueError(f"未対応の次元です: {dimension}（{', '.join(DIMENSIONS)}）")
+        positions = [DIMENSIONS.index(dimension) for dimension in group_by]
+        conditions = []
+        for dimension, value in (where or {}).items():
+            allowed = {value} if isinstance(value, str) else set(value)
+            conditions.append((DIMENSIONS.index(dimension), allowed))
+
+        groups: Dict[Tuple[str, ...], List[float]] = {}
+        for key, cell in self.cells.items():
+            if all(key[position] in allowed for position, allowed in conditions):
+                group = tuple(key[position] for position in positions)
+                total = groups.get(group)
+                if total is None:
+                    groups[group] = list(cell)
+                else:
+                    for i, value in enumerate(cell):
+                        total[i] += value
+
+        count = len(self.satisfaction)
+        results = []
+        for group, total in sorted(groups.items()):
+            result = dict(zip(group_by, group))
+            result["回答数"] = int(total[0])
+            result["満足度"] = {column: total[1 + i] / total[1 + count + i] if total[1 + count + i] else None
+                             for i, column in enumerate(self.satisfaction)}
+            result["フラグ"] = {column: int(total[1 + 2 * count + i]) for i, column in enumerate(self.flags)}
+            results.append(result)
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="集計キューブから満足度の平均・フラグの件数を出力")
+    parser.add_argument("--cube", default=str(DEFAULT_CUBE_PATH), metavar="PATH",
+                        help=f"集計キューブのファイル（既定: {DEFAULT_CUBE_PATH}）")
+    parser.add_argument("--group-by", nargs="*", default=[], choices=DIMENSIONS, metavar="DIMENSION",
+                        help=f"集計する次元（{', '.join(DIMENSIONS)}）")
+    parser.add_argument("--where", action="append", default=[], metavar="DIMENSION=VALUE[,VALUE...]",
+                        help="次元の値で絞り込む（例: 年代=40代,50代）。複数指定可")
+    parser.add_argument("--flags", action="store_true", help="フラグ列の合計も出力する")
+    args = parser.parse_args()
+
+    cube = AggregateCube.load(Path(args.cube))
+    if cube is None:
+        print(f"エラー: 集計キューブ '{args.cube}' を読み込めません（merge_survey.py --cube で作成）", file=sys.stderr)
+        return 1
+    where = {}
+    for condition in args.where:
+        dimension, _, values = condition.partition("=")
+        where[dimension] = values.split(",")
+    try:
+        results = cube.query(args.group_by, where)
+    except ValueError as e:
+        print(f"エラー: {e}", file=sys.stderr)
+        return 1
+
+    writer = csv.writer(sys.stdout)
+    writer.writerow(args.group_by + ["回答数"] + [f"{column}（平均）" for column in cube.satisfaction]
+                    + (cube.flags if args.flags else []))
+    for result in results:
+        averages = ["" if value is None else f"{value:.3f}" for value in result["満足度"].values()]
+        writer.writerow([result[dimension] for dimension in args.group_by] + [result["回答数"]] + averages
+                        + (list(result["フラグ"].values()) if args.flags else []))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
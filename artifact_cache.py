@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+成果物キャッシュモジュール
+処理段階（変換・マージ・分割）ごとに、入力ファイルの内容と処理コードのハッシュ値をキーとして
+出力ファイルをローカルキャッシュに保存し、入力が変わっていなければ再利用する機能を提供
+ダウンロードはURLと前回の応答のETag・Last-Modifiedをキーとし、ダウンロード元で変更がなければ（304）
+既存の入力ファイルを再利用する（ETag・Last-Modifiedを download_validators.json に保存）
+
+ファイルの実体は内容のハッシュ値をファイル名として保存するため、複数のキャッシュエントリで
+同じ内容のファイル（変化しない過去の年の分割ファイルなど）は1つだけ保存される
+キャッシュの合計サイズが上限を超えた場合は、最後に使われた日時が古いエントリから削除する
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from atomic_write import AtomicWriter, file_digest
+
+DEFAULT_CACHE_DIR = Path(".cache/artifacts")
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+INDEX_NAME = "index.json"
+VALIDATORS_NAME = "download_validators.json"
+INDEX_VERSION = 1
+
+
+class ArtifactCache:
+    """内容アドレス方式の成果物キャッシュ"""
+
+    def __init__(self, cache_dir: Path = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.blob_dir = self.cache_dir / "blobs"
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+        self._entries: Dict[str, dict] = self._load_index()
+
+    def _load_index(self) -> Dict[str, dict]:
+        """キャッシュの索引を読み込み（存在しない・壊れている場合は空）"""
+        try:
+            with open(self.cache_dir / INDEX_NAME, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if index.get("version") != INDEX_VERSION:
+            return {}
+        return index.get("entries", {})
+
+    def _save_index(self):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with AtomicWriter(self.cache_dir / INDEX_NAME) as f:
+            json.dump({"version": INDEX_VERSION, "entries": self._entries}, f, ensure_ascii=False)
+
+    def _blob_path(self, digest: str) -> Path:
+        return self.blob_dir / digest[:2] / digest
+
+    @staticmethod
+    def compute_key(stage: str, inputs: List[Path]) -> str:
+        """処理段階名と入力ファイル（処理コードを含む）の内容からキャッシュキーを計算"""
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(stage.encode("utf-8"))
+        for path in inputs:
+            path = Path(path)
+            content = file_digest(path) if path.exists() else "missing"
+            digest.update(f"\0{path.as_posix()}\0{content}".encode("utf-8"))
+        return digest.hexdigest()
+
+    @staticmethod
+    def _collect_outputs(output_globs: List[str]) -> List[Path]:
+        files = []
+        for pattern in output_globs:
+            files.extend(p for p in sorted(Path(".").glob(pattern)) if p.is_file())
+        return files
+
+    def restore(self, key: str, output_globs: List[str]) -> bool:
+        """キャッシュから出力ファイルを復元（キャッシュにない場合はFalse）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not all(self._blob_path(f["blob"]).exists() for f in entry["files"]):
+                return False
+
+            # キャッシュにない古い出力ファイル（なくなった年の分割ファイルなど）を削除
+            cached_paths = {f["path"] for f in entry["files"]}
+            for path in self._collect_outputs(output_globs):
+                if path.as_posix() not in cached_paths:
+                    path.unlink()
+
+            for file_info in entry["files"]:
+                target = Path(file_info["path"])
+                with open(self._blob_path(file_info["blob"]), "rb") as src:
+                    with AtomicWriter(target, mode="wb") as dst:
+                        shutil.copyfileobj(src, dst)
+
+            entry["last_used"] = time.time()
+            self.hits += 1
+            self.bytes_saved += entry["size"]
+            self._save_index()
+            return True
+
+    def store(self, key: str, stage: str, output_globs: List[str]):
+        """出力ファイルをキャッシュに保存し、上限を超えた場合は古いエントリを削除"""
+        with self._lock:
+            files = []
+            total = 0
+            for path in self._collect_outputs(output_globs):
+                digest = file_digest(path)
+                blob = self._blob_path(digest)
+                if not blob.exists():
+                    blob.parent.mkdir(parents=True, exist_ok=True)
+                    temp_blob = blob.with_name(blob.name + ".tmp")
+                    shutil.copyfile(path, temp_blob)
+                    os.replace(temp_blob, blob)
+                size = path.stat().st_size
+                files.append({"path": path.as_posix(), "blob": digest, "size": size})
+                total += size
+
+            self._entries[key] = {"stage": stage, "files": files, "size": total, "last_used": time.time()}
+            self._evict(protect=key)
+            self._save_index()
+
+    def _stored_bytes(self) -> int:
+        """キャッシュに保存されているファイル実体の合計サイズ（重複を除く）"""
+        blobs = {}
+        for entry in self._entries.values():
+            for file_info in entry["files"]:
+                blobs[file_info["blob"]] = file_info["size"]
+        return sum(blobs.values())
+
+    def _evict(self, protect: Optional[str] = None):
+        """合計サイズが上限を超えている間、最後に使われた日時が古いエントリから削除"""
+        stored = self._stored_bytes()
+        for key in sorted(self._entries, key=lambda k: self._entries[k]["last_used"]):
+            if stored <= self.max_bytes:
+                break
+            if key == protect:
+                continue
+            del self._entries[key]
+            self.evicted += 1
+            stored = self._stored_bytes()
+
+        # どのエントリからも参照されなくなったファイル実体を削除
+        referenced = {f["blob"] for entry in self._entries.values() for f in entry["files"]}
+        if self.blob_dir.exists():
+            for blob in self.blob_dir.glob("*/*"):
+                if blob.name not in referenced and not blob.name.endswith(".tmp"):
+                    blob.unlink()
+
+    def run_stage(self, stage: str, inputs: List[Path], output_globs: List[str],
+                  action: Callable[[], bool]) -> bool:
+        """
+        処理段階をキャッシュ付きで実行
+        入力が同じ出力がキャッシュにあれば復元して処理を省略し、なければ実行して結果を保存する
+        """
+        key = self.compute_key(stage, inputs)
+        if self.restore(key, output_globs):
+            print(f"  キャッシュ: {stage} の出力を再利用しました")
+            return True
+
+        with self._lock:
+            self.misses += 1
+        success = action()
+        if success:
+            self.store(key, stage, output_globs)
+        return success
+
+    def load_validators(self) -> Dict[str, dict]:
+        """前回のダウンロードの応答のETag・Last-Modified（URL → 値、存在しない・壊れている場合は空）"""
+        try:
+            with open(self.cache_dir / VALIDATORS_NAME, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def record_download(self, validators: Dict[str, dict], not_modified: bool):
+        """ダウンロードの結果を記録してETag・Last-Modifiedを保存（変更がなかった場合はヒットとして数える）"""
+        with self._lock:
+            if not_modified:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            with AtomicWriter(self.cache_dir / VALIDATORS_NAME) as f:
+                json.dump(dict(validators), f, ensure_ascii=False, indent=1, sort_keys=True)
+
+    def summary(self) -> str:
+        """キャッシュの利用状況を表す文字列"""
+        return (f"ヒット {self.hits}件, ミス {self.misses}件, "
+                f"再利用したデータ {self.bytes_saved:,} バイト, 削除したエントリ {self.evicted}件, "
+                f"キャッシュサイズ {self._stored_bytes():,} / {self.max_bytes:,} バイト")
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+アトミック書き込みモジュール
+一時ファイルに書き込みながらハッシュを計算し、既存ファイルと内容が異なる場合だけ
+アトミックに置き換える機能を提供（内容が同じファイルは更新日時も含めて変更しない）
+"""
+
+import hashlib
+import io
+import os
+import tempfile
+from pathlib import Path
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(path: Path) -> str:
+    """ファイルの内容のハッシュ値を計算"""
+    digest = hashlib.blake2b()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class _HashingRawWriter(io.RawIOBase):
+    """書き込んだバイト列のハッシュ値とサイズを計算しながらファイルに書き込む"""
+
+    def __init__(self, raw):
+        self._raw = raw
+        self.digest = hashlib.blake2b()
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        written = self._raw.write(data)
+        self.digest.update(memoryview(data)[:written])
+        self.size += written
+        return written
+
+    def close(self):
+        if not self.closed:
+            self._raw.close()
+        super().close()
+
+
+class AtomicWriter:
+    """
+    内容が変わった場合だけファイルを置き換えるコンテキストマネージャ
+    with AtomicWriter(path) as f: でテキスト（既定）またはバイナリのファイルとして書き込む
+    終了後、changed属性で置き換えが行われたかを確認できる
+    """
+
+    def __init__(self, path, mode: str = "w", encoding: str = "utf-8", newline: str = ""):
+        if mode not in ("w", "wb"):
+            raise ValueError(f"未対応のモードです: {mode}")
+        self.path = Path(path)
+        self.mode = mode
+        self.encoding = encoding
+        self.newline = newline
+        self.changed = False
+        self.digest = None
+        self._temp_path = None
+        self._hashing = None
+        self._file = None
+
+    def __enter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_name = tempfile.mkstemp(prefix=f".{self.path.name}.", suffix=".tmp", dir=self.path.parent)
+        self._temp_path = Path(temp_name)
+        # mkstempは0600で作成するため、既存ファイルと同じ（なければ通常の）権限に揃える
+        mode = self.path.stat().st_mode & 0o777 if self.path.exists() else 0o644
+        os.chmod(self._temp_path, mode)
+        self._hashing = _HashingRawWriter(os.fdopen(fd, "wb"))
+        buffered = io.BufferedWriter(self._hashing, CHUNK_SIZE)
+        if self.mode == "wb":
+            self._file = buffered
+        else:
+            self._file = io.TextIOWrapper(buffered, encoding=self.encoding, newline=self.newline)
+        return self._file
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self._file.close()
+        except Exception:
+            self._temp_path.unlink(missing_ok=True)
+            raise
+        if exc_type is not None:
+            self._temp_path.unlink(missing_ok=True)
+            return False
+
+        self.digest = self._hashing.digest.hexdigest()
+        if (self.path.exists()
+                and self.path.stat().st_size == self._hashing.size
+                and file_digest(self.path) == self.digest):
+            # 内容が同じ場合は既存ファイルをそのまま残す
+            self._temp_path.unlink()
+            self.changed = False
+        else:
+            os.replace(self._temp_path, self.path)
+            self.changed = True
+        return False
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ベンチマークプログラム
+generate_survey.py で生成した合成データを作業ディレクトリに配置し、
+処理段階（前処理・convert_*_csv・マージ・年毎分割）ごとの処理速度（行/秒）とピークメモリを
+データ件数を変えて計測する
+
+各処理段階は別プロセスで実行し、instrumentation.py の計測結果（SURVEY_RUN_REPORT）を集計する
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from generate_survey import PREFECTURES, generate_inputs
+from instrumentation import CHILD_REPORT_ENV, TRACE_MEMORY_ENV
+from progress import PROGRESS_ENV
+
+REPO_DIR = Path(__file__).resolve().parent
+DEFAULT_WORK_DIR = Path(".cache/benchmark")
+DEFAULT_SCALES = [10000, 100000]
+
+
+def run_measured(command: List[str], cwd: Path, trace_memory: bool) -> List[dict]:
+    """コマンドを実行し、子プロセスが書き出した処理段階ごとの計測結果を返す"""
+    fd, report_path = tempfile.mkstemp(prefix="bench_", suffix=".json")
+    os.close(fd)
+    try:
+        env = dict(os.environ, **{CHILD_REPORT_ENV: report_path,
+                                  TRACE_MEMORY_ENV: "1" if trace_memory else "0",
+                                  PROGRESS_ENV: "off"})
+        result = subprocess.run(command, cwd=cwd, env=env, capture_output=True, text=True, encoding="utf-8")
+        if result.returncode != 0:
+            raise RuntimeError(f"{' '.join(command)} が失敗しました:\n{result.stderr.strip()}")
+        with open(report_path, "r", encoding="utf-8") as f:
+            return json.load(f).get("stages", [])
+    finally:
+        os.unlink(report_path)
+
+
+def merge_worker():
+    """作業ディレクトリでマージと年毎分割を実行（ベンチマークの子プロセス）"""
+    from instrumentation import RunReport
+    from merge_survey import CONVERSIONS, SurveyMerger
+
+    merger = SurveyMerger()
+    merger.report = RunReport.for_subprocess()
+    csv_files = [Path(conversion["output"]) for conversion in CONVERSIONS if Path(conversion["output"]).exists()]
+    if not merger.check_directories() or merger.merge_stage(csv_files) is None:
+        return 1
+    for csv_file in csv_files:
+        merger.split_converted_stage(csv_file)
+    return 0
+
+
+def summarize(stage: dict, rows: int) -> dict:
+    seconds = stage.get("wall_seconds") or 0
+    return {
+        "stage": stage["stage"],
+        "prefecture": stage.get("prefecture"),
+        "rows": rows,
+        "seconds": seconds,
+        "rows_per_second": rows / seconds if seconds else None,
+        "cpu_seconds": stage.get("cpu_seconds"),
+        "bytes_read": stage.get("bytes_read"),
+        "bytes_written": stage.get("bytes_written"),
+        "process_peak_rss_bytes": stage.get("process_peak_rss_bytes"),
+        "rss_growth_bytes": stage.get("rss_growth_bytes"),
+        "peak_traced_bytes": stage.get("peak_traced_bytes"),
+    }
+
+
+def run_scale(rows: int, prefectures: List[str], work_dir: Path, encoding: str,
+              seed: int, trace_memory: bool) -> List[dict]:
+    """1つのデータ件数でベンチマークを実行"""
+    workspace = work_dir / f"rows_{rows}"
+    if workspace.exists():
+        shutil.rmtree(workspace)
+    (workspace / "output").mkdir(parents=True)
+    for prefecture in prefectures:
+        (workspace / "output" / prefecture).mkdir()
+
+    start = time.perf_counter()
+    generate_inputs(workspace / "input", rows, prefectures, encoding, seed, mapping_dir=REPO_DIR / "input")
+    print(f"  データ生成: {time.perf_counter() - start:.2f}秒")
+
+    results = []
+    for prefecture in prefectures:
+        script = REPO_DIR / f"convert_{prefecture}.py"
+        for stage in run_measured([sys.executable, str(script)], workspace, trace_memory):
+            # 前処理の行数は変換の入力行数と同じ
+            results.append(summarize(stage, rows))
+    merge_stages = run_measured([sys.executable, str(Path(__file__).resolve()), "--merge-worker"],
+                                workspace, trace_memory)
+    for stage in merge_stages:
+        results.append(summarize(stage, stage.get("rows_in") or 0))
+    return results
+
+
+def format_bytes(value) -> str:
+    return f"{value / 1024 / 1024:8.1f}" if value else "       -"
+
+
+def print_results(rows: int, results: List[dict]):
+    print(f"\n  {'処理段階':<12} {'県':<9} {'行数':>10} {'時間(秒)':>9} {'行/秒':>10} {'最大RSS(MB)':>8} {'RSS増(MB)':>8} {'確保(MB)':>8}")
+    for r in results:
+        rate = f"{r['rows_per_second']:10,.0f}" if r["rows_per_second"] else "         -"
+        print(f"  {r['stage']:<12} {r['prefecture'] or '-':<9} {r['rows']:>10,} {r['seconds']:9.2f} {rate} "
+              f"{format_bytes(r['process_peak_rss_bytes'])} {format_bytes(r['rss_growth_bytes'])} "
+              f"{format_bytes(r['peak_traced_bytes'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="変換・マージ処理のベンチマーク")
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_SCALES, metavar="N",
+                        help=f"1県あたりの行数（複数指定可、既定: {' '.join(map(str, DEFAULT_SCALES))}）")
+    parser.add_argument("--prefectures", nargs="+", choices=PREFECTURES, default=PREFECTURES)
+    parser.add_argument("--encoding", choices=["utf-8", "utf-8-sig", "cp932"], default="utf-8",
+                        help="生成する入力CSVの文字コード")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", default=str(DEFAULT_WORK_DIR), metavar="DIR",
+                        help=f"作業ディレクトリ（既定: {DEFAULT_WORK_DIR}）")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="tracemallocで処理段階ごとのメモリ確保量のピークも計測する（処理は大幅に遅くなる）")
+    parser.add_argument("--output", default=None, metavar="PATH", help="計測結果をJSONファイルに保存する")
+    parser.add_argument("--keep", action="store_true", help="作業ディレクトリを削除せずに残す")
+    parser.add_argument("--merge-worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.merge_worker:
+        return merge_worker()
+
+    work_dir = Path(args.work_dir).resolve()
+    all_results: Dict[int, List[dict]] = {}
+    for rows in args.rows:
+        print(f"=== {rows:,} 行/県 ===")
+        all_results[rows] = run_scale(rows, args.prefectures, work_dir, args.encoding, args.seed,
+                                      args.trace_memory)
+        print_results(rows, all_results[rows])
+        print()
+        if not args.keep:
+            shutil.rmtree(work_dir / f"rows_{rows}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"encoding": args.encoding, "seed": args.seed, "trace_memory": args.trace_memory,
+                       "scales": {str(rows): results for rows, results in all_results.items()}},
+                      f, ensure_ascii=False, indent=1)
+        print(f"計測結果を '{args.output}' に保存しました")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ビットマップ索引モジュール
+マージ後のファイル（merged_survey.csv）の値の種類が少ない列（0/1のフラグ列、対象県・年代などの選択肢）について、
+列の値ごとに「その値を持つ行」を1行1ビットで表したビットマップを作成し、
+「Instagram AND 新幹線 AND 温泉や露天風呂」のような条件に合う行の件数・行番号を、CSVファイルを読み込まずに求める機能を提供
+
+条件式:
+  - 列名=値        例: 年代=40代, "対象県（富山/石川/福井）"=石川
+  - 列名           値が1の行（フラグ列）。例: Instagram
+  - AND / OR / NOT と括弧（優先順位は NOT, AND, OR の順）
+  - 空白・括弧・=を含む列名や値は "..." で囲む
+
+ビットマップは行番号 i のビットを i ビット目とする整数として扱い（AND/OR/NOTは整数のビット演算）、
+ファイルには列の値ごとにzlibで圧縮して保存する（まばらなフラグ列は小さくなる）
+"""
+
+import argparse
+import csv
+import json
+import re
+import struct
+import sys
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from atomic_write import AtomicWriter
+from row_index import IndexedCSV, file_signature, signature_matches
+
+DEFAULT_INDEX_PATH = Path("output_merge/bitmap_index.bin")
+DEFAULT_CSV_PATH = Path("output_merge/merged_survey.csv")
+MAGIC = b"SURVBMP1"
+INDEX_VERSION = 1
+# 値の種類がこれより多い列（日付・自由記述など）は索引を作成しない
+MAX_CARDINALITY = 64
+# まとめて処理する行数（8の倍数）
+CHUNK_ROWS = 65536
+FLAG_VALUE = "1"
+KEYWORDS = ("AND", "OR", "NOT")
+TOKEN_PATTERN = re.compile(r'\s*(?:(\()|(\))|((?:"[^"]*"|[^\s()"])+))')
+
+
+if hasattr(int, "bit_count"):
+    # Python 3.10以降
+    popcount = int.bit_count
+else:
+    def popcount(value: int) -> int:
+        return bin(value).count("1")
+
+
+def _chunks(rows: Iterable[List[str]], size: int) -> Iterable[List[List[str]]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def build_bitmaps(headers: List[str], rows: Iterable[List[str]],
+                  max_cardinality: int = MAX_CARDINALITY) -> Tuple[int, Dict[str, Dict[str, bytearray]]]:
+    """値の種類が少ない列の、値ごとのビットマップ（リトルエンディアンのバイト列）を作成"""
+    bitmaps: Dict[int, Dict[str, bytearray]] = {index: {} for index in range(len(headers))}
+    row_count = 0
+    for chunk in _chunks(rows, CHUNK_ROWS):
+        chunk_bytes = (len(chunk) + 7) // 8
+        offset = row_count // 8
+        for index in list(bitmaps):
+            values = bitmaps[index]
+            positions: Dict[str, List[int]] = {}
+            for i, row in enumerate(chunk):
+                positions.setdefault(row[index] if index < len(row) else "", []).append(i)
+            if len(values.keys() | positions.keys()) > max_cardinality:
+                # 値の種類が多い列は索引を作成しない
+                del bitmaps[index]
+                continue
+            for value, found in positions.items():
+                bits = bytearray(chunk_bytes)
+                for i in found:
+                    bits[i >> 3] |= 1 << (i & 7)
+                bitmap = values.get(value)
+                if bitmap is None:
+                    # 前のまとまりに現れなかった値は0で埋める
+                    bitmap = values[value] = bytearray(offset)
+                bitmap.extend(bits)
+            for value, bitmap in values.items():
+                if value not in positions:
+                    bitmap.extend(bytes(chunk_bytes))
+        row_count += len(chunk)
+    return row_count, {headers[index]: values for index, values in bitmaps.items()}
+
+
+def write_index(path: Path, headers: List[str], rows: Iterable[List[str]], csv_path: Path = DEFAULT_CSV_PATH,
+                max_cardinality: int = MAX_CARDINALITY) -> dict:
+    """ビットマップ索引を作成して保存"""
+    row_count, bitmaps = build_bitmaps(headers, rows, max_cardinality)
+    entries = []
+    blobs = []
+    position = 0
+    for column, values in bitmaps.items():
+        for value in sorted(values):
+            blob = zlib.compress(bytes(values[value]), 6)
+            entries.append([column, value, position, len(blob)])
+            blobs.append(blob)
+            position += len(blob)
+    # 行の内容を読み込むマージ後のファイルと、索引を作成した時点のファイルの内容が一致するかの確認用
+    signature = file_signature(csv_path) if Path(csv_path).exists() else None
+    header = json.dumps({"version": INDEX_VERSION, "rows": row_count, "csv": Path(csv_path).as_posix(),
+                         "csv_signature": signature, "headers": headers, "entries": entries},
+                        ensure_ascii=False).encode("utf-8")
+    atomic = AtomicWriter(path, "wb")
+    with atomic as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        for blob in blobs:
+            f.write(blob)
+    return {"rows": row_count, "columns": len(bitmaps), "bitmaps": len(entries), "changed": atomic.changed}
+
+
+class BitmapIndex:
+    """ビットマップ索引の読み込みと条件式の評価"""
+
+    def __init__(self, path: Path = DEFAULT_INDEX_PATH):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            data = f.read()
+        if not data.startswith(MAGIC):
+            raise ValueError(f"'{self.path}' はビットマップ索引ではありません")
+        (length,) = struct.unpack_from("<I", data, len(MAGIC))
+        position = len(MAGIC) + 4
+        header = json.loads(data[position:position + length].decode("utf-8"))
+        if header.get("version") != INDEX_VERSION:
+            raise ValueError(f"'{self.path}' の形式のバージョンが異なります。作成し直してください")
+        self._data = memoryview(data)[position + length:]
+        self.rows: int = header["rows"]
+        self.csv_path = Path(header["csv"])
+        self.csv_signature = header.get("csv_signature")
+        self.headers: List[str] = header["headers"]
+        self.entries: Dict[str, Dict[str, Tuple[int, int]]] = {}
+        for column, value, offset, size in header["entries"]:
+            self.entries.setdefault(column, {})[value] = (offset, size)
+        self.all_rows = (1 << self.rows) - 1
+        self._cache: Dict[Tuple[str, str], int] = {}
+
+    def columns(self) -> List[str]:
+        return list(self.entries)
+
+    def values(self, column: str) -> List[str]:
+        return list(self.entries.get(column, {}))
+
+    def bitmap(self, column: str, value: str) -> int:
+        """列が値と等しい行のビットマップ（値が現れない場合は0）"""
+        if column not in self.entries:
+            raise ValueError(f"列 '{column}' の索引がありません（値の種類が{MAX_CARDINALITY}を超える列・存在しない列）")
+        key = (column, value)
+        if key not in self._cache:
+            location = self.entries[column].get(value)
+            if location is None:
+                self._cache[key] = 0
+            else:
+                offset, size = location
+                self._cache[key] = int.from_bytes(zlib.decompress(self._data[offset:offset + size]), "little")
+        return self._cache[key]
+
+    def evaluate(self, expression: str) -> int:
+        """条件式に合う行のビットマップ"""
+        return _Parser(self, expression).parse()
+
+    def count(self, expression: str) -> int:
+        return popcount(self.evaluate(expression))
+
+    def count_by(self, expression: str, column: str) -> Dict[str, int]:
+        """条件式に合う行の件数を、列の値ごとに求める（例: 県ごと）"""
+        if column not in self.entries:
+            raise ValueError(f"列 '{column}' の索引がありません（値の種類が{MAX_CARDINALITY}を超える列・存在しない列）")
+        matched = self.evaluate(expression)
+        counts = {value: popcount(matched & self.bitmap(column, value)) for value in self.values(column)}
+        return {value: count for value, count in counts.items() if count}
+
+    @staticmethod
+    def row_ids(bitmap: int, limit: Optional[int] = None) -> List[int]:
+        """ビットマップの行番号（0始まり、ヘッダー行を除く）を小さい順に返す"""
+        ids = []
+        data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+        for position, byte in enumerate(data):
+            if not byte:
+                continue
+            for bit in range(8):
+                if byte >> bit & 1:
+                    ids.append(position * 8 + bit)
+                    if limit is not None and len(ids) >= limit:
+                        return ids
+        return ids
+
+    def fetch_rows(self, ids: List[int]) -> List[List[str]]:
+        """行番号の行をマージ後のファイルから読み込む（行オフセット索引を使う）"""
+        if not signature_matches(self.csv_path, self.csv_signature):
+            raise ValueError(f"'{self.csv_path}' が索引の作成後に変更されています。索引を作成し直してください")
+        with IndexedCSV(self.csv_path) as indexed:
+            return [indexed.rows(i, i + 1)[0] for i in ids]
+
+
+class _Parser:
+    """条件式の再帰下降パーサー（解析しながらビットマップを計算する）"""
+
+    def __init__(self, index: BitmapIndex, expression: str):
+        self.index = index
+        self.tokens = self._tokenize(expression)
+        self.position = 0
+
+    @staticmethod
+    def _tokenize(expression: str) -> List[str]:
+        tokens = []
+        position = 0
+        expression = expression.strip()
+        while position < len(expression):
+            match = TOKEN_PATTERN.match(expression, position)
+            if not match or match.end() == position:
+                raise ValueError(f"条件式を解析できません: {expression[position:]}")
+            tokens.append(match.group(1) or match.group(2) or match.group(3))
+            position = match.end()
+            while position < len(expression) and expression[position].isspace():
+                position += 1
+        return tokens
+
+    def _peek(self) -> Optional[str]:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def _next(self) -> str:
+        token = self._peek()
+        if token is None:
+            raise ValueError("条件式が途中で終わっています")
+        self.position += 1
+        return token
+
+    def parse(self) -> int:
+        if not self.tokens:
+            return self.index.all_rows
+        result = self._or()
+        if self._peek() is not None:
+            raise ValueError(f"条件式の '{self._peek()}' を解析できません")
+        return result
+
+    def _or(self) -> int:
+        result = self._and()
+        while self._peek() is not None and self._peek().upper() == "OR":
+            self._next()
+            result |= self._and()
+        return result
+
+    def _and(self) -> int:
+        result = self._not()
+        while self._peek() is not None and self._peek().upper() == "AND":
+            self._next()
+            result &= self._not()
+        return result
+
+    def _not(self) -> int:
+        if self._peek() is not None and self._peek().upper() == "NOT":
+            self._next()
+            return self.index.all_rows ^ self._not()
+        return self._atom()
+
+    def _atom(self) -> int:
+        token = self._next()
+        if token == "(":
+            result = self._or()
+            if self._next() != ")":
+                raise ValueError("括弧が閉じられていません")
+            return result
+        if token == ")" or token.upper() in KEYWORDS:
+            raise ValueError(f"条件式の '{token}' の位置が正しくありません")
+        column, value = self._term(token)
+        return self.index.bitmap(column, value)
+
+    @staticmethod
+    def _term(token: str) -> Tuple[str, str]:
+        """「列名=値」または「列名」（値は1）を分解（"..."で囲んだ部分の=は区切りとみなさない）"""
+        parts = re.findall(r'"[^"]*"|=|[^"=]+', token)
+        if "=" in parts:
+            split = parts.index("=")
+            column, value = "".join(parts[:split]), "".join(parts[split + 1:])
+        else:
+            column, value = token, FLAG_VALUE
+        return column.replace('"', ""), value.replace('"', "")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ビットマップ索引で条件に合う行を数える")
+    parser.add_argument("expression", nargs="?", default="",
+                        help='条件式（例: "Instagram AND 新幹線 AND 温泉や露天風呂"、省略時はすべての行）')
+    parser.add_argument("--index", default=str(DEFAULT_INDEX_PATH), metavar="PATH",
+                        help=f"ビットマップ索引のファイル（既定: {DEFAULT_INDEX_PATH}）")
+    parser.add_argument("--by", default=None, metavar="COLUMN", help="件数を集計する列（例: 対象県（富山/石川/福井））")
+    parser.add_argument("--show", type=int, default=0, metavar="N", help="条件に合う先頭N行をCSV形式で出力する")
+    parser.add_argument("--list", action="store_true", help="索引のある列と値の種類の数を出力する")
+    args = parser.parse_args()
+
+    try:
+        index = BitmapIndex(Path(args.index))
+    except (OSError, ValueError) as e:
+        print(f"エラー: ビットマップ索引を読み込めません（merge_survey.py --bitmap-index で作成）: {e}", file=sys.stderr)
+        return 1
+    if args.list:
+        for column in index.columns():
+            print(f"{column}: {len(index.values(column))} 種類")
+        return 0
+
+    try:
+        start = time.perf_counter()
+        matched = index.evaluate(args.expression)
+        counts = index.count_by(args.expression, args.by) if args.by else None
+        elapsed = time.perf_counter() - start
+    except ValueError as e:
+        print(f"エラー: {e}", file=sys.stderr)
+        return 1
+    try:
+        # マージ後のファイルが索引の作成後に変更されている場合は行を読み込まない
+        rows = index.fetch_rows(index.row_ids(matched, args.show)) if args.show else []
+    except (OSError, ValueError) as e:
+        print(f"エラー: {e}（merge_survey.py --bitmap-index で作成）", file=sys.stderr)
+        return 1
+
+    print(f"該当 {popcount(matched):,} 行 / {index.rows:,} 行 ({elapsed * 1000:.1f}ミリ秒)")
+    if counts is not None:
+        for value, count in sorted(counts.items(), key=lambda item: -item[1]):
+            print(f"  {value or '（空欄）'}: {count:,}")
+    if args.show:
+        writer = csv.writer(sys.stdout)
+        writer.writerow(index.headers)
+        writer.writerows(rows)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+変更データキャプチャ（CDC）モジュール
+マージ後の行ごとに行キーと内容のフィンガープリントを計算して前回の実行時の状態と比較し、
+追加・削除・変更された行だけを差分ファイル（delta_{日付}.csv）に出力する機能を提供
+
+  - 行キー:   対象県・アンケート回答日と、同じ県・回答日の中での出現順から計算（8バイト）
+  - 内容:     行の全列の値から計算（8バイト）
+  - 状態:     行キーの順に並べた（行キー, 内容）の配列（1行16バイト）をバイナリファイルに保存
+
+同じ県・回答日の行の途中に行が挿入・削除された場合は、それ以降の行が「変更」として出力される
+差分ファイルの1列目は変更種別（added / changed / removed）、2列目は行キー（16進）で、
+removed の行は行キーだけを出力する（下流では行キーで削除する）
+"""
+
+import array
+import csv
+import hashlib
+import json
+import struct
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from atomic_write import AtomicWriter
+from fingerprint import FIELD_SEPARATOR
+
+DEFAULT_STATE_PATH = Path(".cache/cdc/state.bin")
+DEFAULT_DELTA_DIR = Path("output_merge/delta")
+MAGIC = b"SURVCDC1"
+STATE_VERSION = 1
+KEY_COLUMNS = ("対象県（富山/石川/福井）", "アンケート回答日")
+CHANGE_COLUMN = "変更種別"
+ROW_KEY_COLUMN = "行キー"
+ADDED, CHANGED, REMOVED = "added", "changed", "removed"
+
+
+def hash64(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _to_bytes(values: array.array) -> bytes:
+    if sys.byteorder != "little":
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_bytes(data: bytes) -> array.array:
+    values = array.array("Q")
+    values.frombytes(data)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+def row_fingerprints(headers: List[str], rows: Iterable[List[str]]) -> Tuple[array.array, array.array]:
+    """行ごとの行キーと内容のフィンガープリント（行の順）"""
+    key_indexes = [headers.index(column) for column in KEY_COLUMNS if column in headers]
+    occurrences: Dict[tuple, int] = {}
+    keys = array.array("Q")
+    contents = array.array("Q")
+    for row in rows:
+        identity = tuple(row[i] if i < len(row) else "" for i in key_indexes)
+        occurrence = occurrences.get(identity, 0) + 1
+        occurrences[identity] = occurrence
+        keys.append(hash64(FIELD_SEPARATOR.join(identity + (str(occurrence),))))
+        contents.append(hash64(FIELD_SEPARATOR.join(row)))
+    return keys, contents
+
+
+class ChangeState:
+    """前回の実行時の行キーと内容のフィンガープリント（行キーの順）"""
+
+    def __init__(self, keys: array.array, contents: array.array, headers_digest: str, created_at: str = None):
+        self.keys = keys
+        self.contents = contents
+        self.headers_digest = headers_digest
+        self.created_at = created_at
+
+    @classmethod
+    def from_rows(cls, keys: array.array, contents: array.array, headers: List[str]) -> "ChangeState":
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        return cls(array.array("Q", (keys[i] for i in order)), array.array("Q", (contents[i] for i in order)),
+                   headers_digest(headers), datetime.now().isoformat(timespec="seconds"))
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["ChangeState"]:
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if not data.startswith(MAGIC):
+            return None
+        (length,) = struct.unpack_from("<I", data, len(MAGIC))
+        position = len(MAGIC) + 4
+        header = json.loads(data[position:position + length].decode("utf-8"))
+        if header.get("version") != STATE_VERSION:
+            return None
+        position += length
+        size = header["rows"] * 8
+        keys = _from_bytes(data[position:position + size])
+        contents = _from_bytes(data[position + size:position + 2 * size])
+        return cls(keys, contents, header["headers_digest"], header.get("created_at"))
+
+    def save(self, path: Path):
+        header = json.dumps({"version": STATE_VERSION, "rows": len(self.keys), "created_at": self.created_at,
+                             "headers_digest": self.headers_digest}).encode("utf-8")
+        with AtomicWriter(path, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<I", len(header)))
+            f.write(header)
+            f.write(_to_bytes(self.keys))
+            f.write(_to_bytes(self.contents))
+
+
+def headers_digest(headers: List[str]) -> str:
+    return hashlib.blake2b(FIELD_SEPARATOR.join(headers).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def compare(previous: ChangeState, current: ChangeState) -> Tuple[set, set, List[int]]:
+    """行キーの順に並んだ2つの状態を突き合わせ、追加・変更された行キーと、削除された行キーを返す"""
+    added, changed, removed = set(), set(), []
+    i = j = 0
+    old_keys, old_contents = previous.keys, previous.contents
+    new_keys, new_contents = current.keys, current.contents
+    while i < len(old_keys) or j < len(new_keys):
+        if j >= len(new_keys) or (i < len(old_keys) and old_keys[i] < new_keys[j]):
+            removed.append(old_keys[i])
+            i += 1
+        elif i >= len(old_keys) or new_keys[j] < old_keys[i]:
+            added.add(new_keys[j])
+            j += 1
+        else:
+            if old_contents[i] != new_contents[j]:
+                changed.add(new_keys[j])
+            i += 1
+            j += 1
+    return added, changed, removed
+
+
+def capture_changes(headers: List[str], rows: Iterable[List[str]], state_path: Path = DEFAULT_STATE_PATH,
+                    delta_dir: Path = DEFAULT_DELTA_DIR, run_date: Optional[str] = None) -> dict:
+    """
+    前回の状態と比較して差分ファイルを出力し、状態を更新する
+    rowsは2回読み込む（フィンガープリントの計算と、追加・変更された行の出力）
+    前回の状態がない場合は状態の保存だけを行う
+    """
+    run_date = run_date or datetime.now().strftime("%Y-%m-%d")
+    keys, contents = row_fingerprints(headers, rows)
+    current = ChangeState.from_rows(keys, contents, headers)
+    previous = ChangeState.load(state_path)
+    result = {"rows": len(keys), "added": 0, "changed": 0, "removed": 0, "baseline": previous is None,
+              "schema_changed": False, "path": None}
+
+    if previous is not None:
+        result["schema_changed"] = previous.headers_digest != current.headers_digest
+        added, changed, removed = compare(previous, current)
+        result.update(added=len(added), changed=len(changed), removed=len(removed))
+        if added or changed or removed:
+            result["path"] = write_delta(headers, rows, keys, added, changed, removed, delta_dir, run_date)
+
+    current.save(state_path)
+    return result
+
+
+def write_delta(headers: List[str], rows: Iterable[List[str]], keys: array.array, added: set, changed: set,
+                removed: List[int], delta_dir: Path, run_date: str) -> Path:
+    """差分ファイルを出力（同じ日に複数回実行した場合は追記する）"""
+    delta_dir.mkdir(parents=True, exist_ok=True)
+    path = delta_dir / f"delta_{run_date}.csv"
+    new_file = not path.exists()
+    with open(path, "a", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow([CHANGE_COLUMN, ROW_KEY_COLUMN] + headers)
+        # 追加・変更された行はマージ後のファイルの順に出力
+        for key, row in zip(keys, rows):
+            if key in added:
+                writer.writerow([ADDED, f"{key:016x}"] + row)
+            elif key in changed:
+                writer.writerow([CHANGED, f"{key:016x}"] + row)
+        for key in removed:
+            writer.writerow([REMOVED, f"{key:016x}"] + [""] * len(headers))
+    return path
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+列統計モジュール
+年毎の分割ファイルへの振り分けと同じ走査で列ごとの統計を計算し、
+分割ファイルごとの小さなJSON（{ファイル名}.stats.json）に保存する機能を提供
+
+  - 空欄の件数と割合
+  - 値の種類の数（種類が少ない間は正確に数え、多くなるとHyperLogLogによる推定に切り替える）
+  - 出現回数の多い値（種類が多い列はMisra-Gries法による推定。回数は実際より最大 top_error 少ない）
+  - 日付・数値の列の最小値・最大値
+
+ハッシュ値はblake2bで計算するため、同じデータからは同じ統計のファイルができる（内容が同じ場合は書き込まない）
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import math
+import sys
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from atomic_write import AtomicWriter
+from date_sort import DATE_COLUMN, date_sort_key
+
+STATS_SUFFIX = ".stats.json"
+STATS_VERSION = 1
+# 正確に数える値の種類の上限（超えるとHyperLogLog・Misra-Gries法に切り替える）
+EXACT_LIMIT = 1000
+HLL_PRECISION = 12
+TOP_K = 10
+HEAVY_HITTERS = 100
+
+
+def stats_path(csv_path) -> Path:
+    csv_path = Path(csv_path)
+    return csv_path.with_name(csv_path.name + STATS_SUFFIX)
+
+
+def hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def as_number(value: str) -> Optional[float]:
+    try:
+        number = float(value)
+    except ValueError:
+        return None
+    return number if math.isfinite(number) else None
+
+
+class HyperLogLog:
+    """値の種類の数の推定（2^precision個のレジスタ、標準誤差は約 1.04/sqrt(2^precision)）"""
+
+    def __init__(self, precision: int = HLL_PRECISION):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(self.size)
+        self._rest_bits = 64 - precision
+
+    def add(self, value: str):
+        x = hash64(value)
+        index = x >> self._rest_bits
+        rest = x & ((1 << self._rest_bits) - 1)
+        rank = self._rest_bits - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def estimate(self) -> int:
+        m = self.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            # 値の種類が少ない場合は線形計数で補正
+            return round(m * math.log(m / zeros))
+        return round(raw)
+
+
+class HeavyHitters:
+    """出現回数の多い値の推定（Misra-Gries法、候補数が上限の2倍を超えたらまとめて減算する）"""
+
+    def __init__(self, capacity: int = HEAVY_HITTERS):
+        self.capacity = capacity
+        self.counts: Dict[str, int] = {}
+        # 減算した合計（推定した回数と実際の回数の差の上限）
+        self.error = 0
+
+    def add(self, value: str, count: int = 1):
+        self.counts[value] = self.counts.get(value, 0) + count
+        if len(self.counts) > 2 * self.capacity:
+            self._prune()
+
+    def _prune(self):
+        threshold = sorted(self.counts.values(), reverse=True)[self.capacity]
+        self.error += threshold
+        self.counts = {value: count - threshold for value, count in self.counts.items() if count > threshold}
+
+    def top(self, k: int) -> List[list]:
+        return [[value, count] for value, count in sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))[:k]]
+
+
+class ColumnProfile:
+    """1列の統計"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.empty = 0
+        self.exact: Optional[Counter] = Counter()
+        self.hll: Optional[HyperLogLog] = None
+        self.heavy: Optional[HeavyHitters] = None
+        # 推定に切り替えた後の日付・数値の最小値・最大値（切り替え前は値の一覧から求める）
+        self.is_date = name == DATE_COLUMN
+        self.numeric = True
+        self.min_value: Optional[str] = None
+        self.max_value: Optional[str] = None
+        self._min_key = self._max_key = None
+
+    def add(self, value: str):
+        if not value.strip():
+            self.empty += 1
+            return
+        if self.exact is not None:
+            self.exact[value] += 1
+            if len(self.exact) > EXACT_LIMIT:
+                self._switch_to_sketches()
+            return
+        self.hll.add(value)
+        self.heavy.add(value)
+        self._observe_range(value)
+
+    def _switch_to_sketches(self):
+        self.hll = HyperLogLog()
+        self.heavy = HeavyHitters()
+        for value, count in self.exact.items():
+            self.hll.add(value)
+            self.heavy.add(value, count)
+            self._observe_range(value)
+        self.exact = None
+
+    def _range_key(self, value: str):
+        if self.is_date:
+            # 解析できない日付は範囲に含めない
+            key = date_sort_key(value)
+            return key if key[0] == 0 else None
+        if self.numeric:
+            number = as_number(value)
+            if number is None:
+                self.numeric = False
+            return number
+        return None
+
+    def _observe_range(self, value: str):
+        key = self._range_key(value)
+        if key is None:
+            return
+        if self._min_key is None or key < self._min_key:
+            self._min_key, self.min_value = key, value
+        if self._max_key is None or key > self._max_key:
+            self._max_key, self.max_value = key, value
+
+    def summary(self, rows: int) -> dict:
+        if self.exact is not None:
+            for value in self.exact:
+                self._observe_range(value)
+            values = set(self.exact)
+            distinct = len(values)
+            top = [[value, count] for value, count in sorted(self.exact.items(), key=lambda item: (-item[1], item[0]))[:TOP_K]]
+            top_error = 0
+        else:
+            values = None
+            distinct = self.hll.estimate()
+            top = self.heavy.top(TOP_K)
+            top_error = self.heavy.error
+
+        if self.is_date and self._min_key is not None:
+            column_type = "date"
+        elif values is not None and values <= {"0", "1"}:
+            column_type = "flag"
+        elif self.numeric and self._min_key is not None:
+            column_type = "number"
+        else:
+            column_type = "text"
+        result = {
+            "name": self.name,
+            "type": column_type,
+            "empty": self.empty,
+            "empty_rate": round(self.empty / rows, 4) if rows else 0,
+            "distinct": distinct,
+            "distinct_approx": values is None,
+            "top": top,
+            "top_error": top_error,
+        }
+        if column_type in ("date", "number"):
+            result["min"], result["max"] = self.min_value, self.max_value
+        return result
+
+
+class PartitionProfile:
+    """1つの分割ファイルの全列の統計"""
+
+    def __init__(self, headers: List[str]):
+        self.headers = list(headers)
+        self.columns = [ColumnProfile(name) for name in headers]
+        self.rows = 0
+
+    def add(self, row: List[str]):
+        self.rows += 1
+        columns = self.columns
+        for i, value in enumerate(row[:len(columns)]):
+            columns[i].add(value)
+        # 列が足りない行は空欄として数える
+        for column in columns[len(row):]:
+            column.empty += 1
+
+    def to_dict(self, file_name: str) -> dict:
+        return {"version": STATS_VERSION, "file": file_name, "rows": self.rows,
+                "columns": [column.summary(self.rows) for column in self.columns]}
+
+    def write(self, csv_path: Path) -> bool:
+        """統計のファイルを保存し、書き込んだかを返す"""
+        path = stats_path(csv_path)
+        atomic = AtomicWriter(path)
+        with atomic as f:
+            json.dump(self.to_dict(Path(csv_path).name), f, ensure_ascii=False, indent=1)
+            f.write("\n")
+        return atomic.changed
+
+
+def read_stats(csv_path) -> Optional[dict]:
+    try:
+        with open(stats_path(csv_path), "r", encoding="utf-8") as f:
+            stats = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return stats if stats.get("version") == STATS_VERSION else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分割ファイルの列統計を表示")
+    parser.add_argument("paths", nargs="+", help="CSVファイル（例: output_merge/merged_survey_2024.csv）")
+    parser.add_argument("--build", action="store_true", help="統計のファイルがない場合はCSVファイルから作成する")
+    args = parser.parse_args()
+
+    for csv_path in args.paths:
+        stats = read_stats(csv_path)
+        if stats is None and args.build:
+            with open(csv_path, "r", encoding="utf-8-sig", newline="") as f:
+                reader = csv.reader(f)
+                profile = PartitionProfile(next(reader))
+                for row in reader:
+                    profile.add(row)
+            profile.write(Path(csv_path))
+            stats = read_stats(csv_path)
+        if stats is None:
+            print(f"{csv_path}: 統計のファイルがありません（--build で作成）")
+            continue
+        print(f"{csv_path}: {stats['rows']:,} 行")
+        for column in stats["columns"]:
+            distinct = f"{'約' if column['distinct_approx'] else ''}{column['distinct']:,}"
+            line = f"  {column['name']} [{column['type']}] 空欄 {column['empty_rate']:.1%}, 種類 {distinct}"
+            if "min" in column:
+                line += f", 範囲 {column['min']} 〜 {column['max']}"
+            if column["top"]:
+                line += f", 最多 {column['top'][0][0][:20]}（{column['top'][0][1]:,}）"
+            print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
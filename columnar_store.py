@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+列指向バイナリストアモジュール
+マージ後の統一スキーマのデータを列ごとのバイナリファイルとして保存し、
+必要な列だけを読み込むための軽量なリーダーを提供
+
+保存形式:
+  - フラグ列（値がすべて0/1）: 1行1ビットのパック済みビット配列
+  - 満足度などのスコア列（値がすべて空/1〜5）: int8配列（空は0）
+  - その他の列: 辞書エンコーディング（値の一覧 + 符号なし整数のコード配列）
+"""
+
+import array
+import json
+import mmap
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+MANIFEST_NAME = "manifest.json"
+FORMAT_VERSION = 1
+
+FLAG_VALUES = frozenset(("0", "1"))
+SCORE_VALUES = frozenset(("", "1", "2", "3", "4", "5"))
+
+
+def _classify_values(distinct: set) -> str:
+    """列に現れる値の集合から保存形式（flag/score/dict）を判定"""
+    if not distinct:
+        return "dict"
+    if distinct <= FLAG_VALUES:
+        return "flag"
+    if distinct <= SCORE_VALUES and distinct != {""}:
+        return "score"
+    return "dict"
+
+
+def infer_column_type(values: List[str]) -> str:
+    """列の値から保存形式を判定"""
+    return _classify_values(set(values))
+
+
+def infer_column_types(headers: List[str], row_groups: Iterable[List[List[str]]]) -> List[str]:
+    """全パーティションを通して各列の保存形式を判定（パーティション間で型を揃えるため）"""
+    distinct: List[set] = [set() for _ in headers]
+    for rows in row_groups:
+        for row in rows:
+            for index, values in enumerate(distinct):
+                values.add(row[index] if index < len(row) else "")
+    return [_classify_values(values) for values in distinct]
+
+
+def pack_flags(values: List[str]) -> bytes:
+    """0/1文字列のリストを1行1ビット（LSBファースト）のバイト列に変換"""
+    if not values:
+        return b""
+    nbytes = (len(values) + 7) // 8
+    bits = "".join(values)[::-1]
+    return int(bits, 2).to_bytes(nbytes, "little")
+
+
+def unpack_flags(data, count: int) -> List[int]:
+    """パック済みビット配列を0/1の整数リストに戻す"""
+    if count == 0:
+        return []
+    bits = format(int.from_bytes(data, "little"), f"0{len(data) * 8}b")[::-1]
+    return [1 if bit == "1" else 0 for bit in bits[:count]]
+
+
+def _code_typecode(dictionary_size: int) -> str:
+    """辞書サイズに応じたコード配列の型コードを選択"""
+    if dictionary_size <= 0xFF:
+        return "B"
+    if dictionary_size <= 0xFFFF:
+        return "H"
+    return "I"
+
+
+def _to_little_endian(values: array.array) -> bytes:
+    """配列をリトルエンディアンのバイト列に変換"""
+    if sys.byteorder == "big" and values.itemsize > 1:
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+class ColumnarWriter:
+    """列指向バイナリストアの書き込みクラス"""
+
+    def __init__(self, output_dir: Path):
+        self.output_dir = Path(output_dir)
+        self.headers: Optional[List[str]] = None
+        self.partitions: List[dict] = []
+        self.bytes_written = 0
+
+    def write_partition(self, name: str, headers: List[str], rows: List[List[str]],
+                        column_types: Optional[List[str]] = None) -> dict:
+        """
+        1パーティション（例: 1年分）の行データを列ごとに書き込み
+        column_typesを省略した場合はこのパーティションの値から保存形式を判定
+        """
+        if self.headers is None:
+            self.headers = list(headers)
+        elif list(headers) != self.headers:
+            raise ValueError(f"パーティション '{name}' のヘッダーが既存のパーティションと異なります")
+
+        partition_dir = self.output_dir / name
+        partition_dir.mkdir(parents=True, exist_ok=True)
+
+        row_count = len(rows)
+        columns = []
+        for index, header in enumerate(headers):
+            values = [row[index] if index < len(row) else "" for row in rows]
+            column_type = column_types[index] if column_types else infer_column_type(values)
+            file_name = f"c{index:03d}.bin"
+            column_info = {"name": header, "type": column_type, "file": file_name}
+
+            if column_type == "flag":
+                payload = pack_flags(values)
+            elif column_type == "score":
+                payload = _to_little_endian(array.array("b", [int(v) if v else 0 for v in values]))
+            else:
+                dictionary: Dict[str, int] = {}
+                codes = [dictionary.setdefault(v, len(dictionary)) for v in values]
+                typecode = _code_typecode(len(dictionary))
+                payload = _to_little_endian(array.array(typecode, codes))
+                dict_file = f"c{index:03d}.dict.json"
+                with open(partition_dir / dict_file, "w", encoding="utf-8") as f:
+                    json.dump(list(dictionary), f, ensure_ascii=False)
+                column_info["dict_file"] = dict_file
+                column_info["typecode"] = typecode
+
+            with open(partition_dir / file_name, "wb") as f:
+                f.write(payload)
+            self.bytes_written += len(payload)
+            columns.append(column_info)
+
+        partition = {"name": name, "rows": row_count, "columns": columns}
+        self.partitions = [p for p in self.partitions if p["name"] != name]
+        self.partitions.append(partition)
+        return partition
+
+    def close(self) -> Path:
+        """マニフェストを書き込んで保存を確定"""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        manifest = {
+            "version": FORMAT_VERSION,
+            "headers": self.headers or [],
+            "partitions": sorted(self.partitions, key=lambda p: p["name"]),
+        }
+        manifest_path = self.output_dir / MANIFEST_NAME
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        return manifest_path
+
+
+class ColumnarReader:
+    """列指向バイナリストアの読み込みクラス（必要な列だけをメモリマップで読み込む）"""
+
+    def __init__(self, store_dir: Path):
+        self.store_dir = Path(store_dir)
+        with open(self.store_dir / MANIFEST_NAME, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") != FORMAT_VERSION:
+            raise ValueError(f"未対応の列指向ストアのバージョンです: {manifest.get('version')}")
+        self.headers: List[str] = manifest["headers"]
+        self.partitions: List[dict] = manifest["partitions"]
+
+    @property
+    def partition_names(self) -> List[str]:
+        """パーティション名の一覧"""
+        return [p["name"] for p in self.partitions]
+
+    def row_count(self, partitions: Optional[Iterable[str]] = None) -> int:
+        """指定パーティションの合計行数"""
+        return sum(p["rows"] for p in self._select_partitions(partitions))
+
+    def _select_partitions(self, partitions: Optional[Iterable[str]]) -> List[dict]:
+        if partitions is None:
+            return self.partitions
+        wanted = {str(name) for name in partitions}
+        return [p for p in self.partitions if p["name"] in wanted]
+
+    def _read_payload(self, path: Path, decode):
+        """列ファイルをメモリマップして値を取り出す（空ファイルは通常読み込み）"""
+        with open(path, "rb") as f:
+            if path.stat().st_size == 0:
+                return decode(b"")
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                view = memoryview(mm)
+                try:
+                    return decode(view)
+                finally:
+                    view.release()
+
+    def _read_column(self, partition: dict, column: dict) -> list:
+        path = self.store_dir / partition["name"] / column["file"]
+        row_count = partition["rows"]
+        column_type = column["type"]
+
+        if column_type == "flag":
+            return self._read_payload(path, lambda buf: unpack_flags(buf, row_count))
+
+        if column_type == "score":
+            return [v if v else None for v in self._read_payload(path, lambda buf: buf.cast("b").tolist() if buf else [])]
+
+        typecode = column["typecode"]
+
+        def decode_codes(buf):
+            if not buf:
+                return []
+            if sys.byteorder == "big" and typecode != "B":
+                codes = array.array(typecode, bytes(buf))
+                codes.byteswap()
+                return codes.tolist()
+            return buf.cast(typecode).tolist()
+
+        codes = self._read_payload(path, decode_codes)
+        with open(self.store_dir / partition["name"] / column["dict_file"], "r", encoding="utf-8") as f:
+            dictionary = json.load(f)
+        return [dictionary[code] for code in codes]
+
+    def read_columns(self, columns: List[str], partitions: Optional[Iterable[str]] = None) -> Dict[str, list]:
+        """
+        指定した列だけを読み込み、列名→値リストの辞書を返す
+        フラグ列は0/1の整数、スコア列は整数（空はNone）、その他は文字列
+        """
+        missing = [c for c in columns if c not in self.headers]
+        if missing:
+            raise KeyError(f"列指向ストアに存在しない列です: {missing}")
+
+        result: Dict[str, list] = {name: [] for name in columns}
+        for partition in self._select_partitions(partitions):
+            by_name = {c["name"]: c for c in partition["columns"]}
+            for name in columns:
+                result[name].extend(self._read_column(partition, by_name[name]))
+        return result
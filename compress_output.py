@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+出力ファイル圧縮モジュール
+生成したCSVファイルをgzip/xz形式で並列に圧縮する機能を提供
+"""
+
+import gzip
+import lzma
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional
+
+from atomic_write import AtomicWriter
+
+# 圧縮形式ごとの拡張子と既定の圧縮レベル
+CODECS = {
+    "gzip": {"suffix": ".gz", "default_level": 6},
+    "xz": {"suffix": ".xz", "default_level": 6},
+}
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def _open_compressed(fileobj, codec: str, level: int):
+    """圧縮形式に応じた書き込み用ファイルオブジェクトを開く"""
+    if codec == "gzip":
+        # mtimeとファイル名を固定して、同じ内容からは同じバイト列を生成する
+        return gzip.GzipFile(filename="", mode="wb", compresslevel=level, fileobj=fileobj, mtime=0)
+    if codec == "xz":
+        return lzma.LZMAFile(fileobj, "wb", preset=level)
+    raise ValueError(f"未対応の圧縮形式です: {codec}")
+
+
+def compress_file(source: Path, codec: str = "gzip", level: Optional[int] = None) -> dict:
+    """1ファイルを圧縮し、圧縮率と処理時間を返す"""
+    if codec not in CODECS:
+        raise ValueError(f"未対応の圧縮形式です: {codec}")
+    if level is None:
+        level = CODECS[codec]["default_level"]
+
+    source = Path(source)
+    target = source.with_name(source.name + CODECS[codec]["suffix"])
+
+    start = time.perf_counter()
+    # 圧縮結果が既存ファイルと同じ場合は置き換えない
+    atomic = AtomicWriter(target, mode="wb")
+    with atomic as raw:
+        with _open_compressed(raw, codec, level) as compressed:
+            with open(source, "rb") as src:
+                shutil.copyfileobj(src, compressed, CHUNK_SIZE)
+    elapsed = time.perf_counter() - start
+
+    original_size = source.stat().st_size
+    compressed_size = target.stat().st_size
+    return {
+        "source": source,
+        "target": target,
+        "original_size": original_size,
+        "compressed_size": compressed_size,
+        "ratio": compressed_size / original_size if original_size else 0.0,
+        "seconds": elapsed,
+        "changed": atomic.changed,
+    }
+
+
+def compress_files(sources: List[Path], codec: str = "gzip", level: Optional[int] = None,
+                   workers: Optional[int] = None) -> List[dict]:
+    """
+    複数ファイルをスレッドプールで並列に圧縮
+    zlib/lzmaは圧縮中にGILを解放するため、スレッドでも複数コアを利用できる
+    """
+    if not sources:
+        return []
+    if workers is None:
+        workers = min(len(sources), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        return list(executor.map(lambda source: compress_file(source, codec, level), sources))
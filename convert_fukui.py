@@ -1,9 +1,15 @@
 import csv
 import json
 import os
+import sys
 import codecs
 import re
 from datetime import datetime
+from incremental import ConversionCheckpoint
+from instrumentation import RunReport, file_size
+from progress import Progress, read_bytes
+from unmapped import UnmappedTracker
+from validation import RowValidator, SchemaViolation, validation_mode
 
 def process_fukui_csv(input_file_path):
     """
@@ -14,8 +20,7 @@ def process_fukui_csv(input_file_path):
     """
     try:
         # バイナリモードでファイルを読み込み
-        with open(input_file_path, 'rb') as f:
-            content_bytes = f.read()
+        content_bytes = read_bytes(input_file_path, "前処理 fukui")
         
         # BOMを除去
         if content_bytes.startswith(b'\xef\xbb\xbf'):
@@ -278,7 +283,12 @@ def check_information_source_flags(information_source):
     
     return result
 
-def convert_fukui_csv():
+def convert_fukui_csv(incremental=False, validate="count"):
+    """
+    CSV変換処理
+    incremental=Trueの場合は前回変換済みのレコードをスキップし、追加分だけを追記する
+    validateは変換後の行の検証モード（count/quarantine/fail/off、validation.py）
+    """
     # ファイルパス
     input_csv = "input/fukui/fukui_formatted.csv"
     mapping_json = "input/fukui/column_mapping_fukui.json"
@@ -311,15 +321,28 @@ def convert_fukui_csv():
     if reader is None:
         raise UnicodeDecodeError("すべてのエンコーディングでCSVファイルの読み込みに失敗しました")
     
-    # 出力CSVを作成
-    with open(output_csv, 'w', encoding='utf-8', newline='') as f:
+    # 差分変換の場合は変換済みのレコードをスキップ
+    checkpoint = ConversionCheckpoint("fukui", mapping_json, __file__, output_csv, validate)
+    start_index = checkpoint.resume_index(rows) if incremental else 0
+    # 追記の場合は追記前のサイズを書き込みバイト数から除く
+    output_offset = file_size(output_csv) if start_index > 0 else 0
+    
+    # 対応表・キーワードに当てはまらなかった回答
+    unmapped = UnmappedTracker("fukui")
+    
+    # 出力CSVを作成（全件変換は内容が変わった場合だけ置き換え、差分変換は末尾に追記）
+    with checkpoint.open_output(start_index, output_headers) as f, \
+            Progress("変換 fukui", len(rows) - start_index) as progress, \
+            RowValidator("fukui", output_headers, validate, start_index) as validator:
         writer = csv.writer(f)
         
-        # ヘッダー行を書き込み
-        writer.writerow(output_headers)
+        # ヘッダー行を書き込み（追記の場合は不要）
+        if start_index == 0:
+            writer.writerow(output_headers)
         
         # データ行を処理
-        for row in rows:
+        for row in rows[start_index:]:
+            progress.update()
             # 空行をスキップ（すべての値が空の行）
             if all(not str(v).strip() for v in row.values()):
                 continue
@@ -384,7 +407,7 @@ def convert_fukui_csv():
                 # 満足度項目の処理
                 elif header in ["交通の満足度", 
                                "満足度（食べ物・料理）", "満足度（宿泊施設）", 
-                               "満足度（買い物（工芸品・特産品など））", "満足度買い物（観光・体験）", 
+                               "満足度（買い物（工芸品・特産品など））", "満足度（観光・体験）", 
                                "満足度（旅行全体）", "満足度（商品・サービス）"]:
                     # マッピングから対応する入力項目名を取得
                     input_field = mapping[header]
@@ -396,6 +419,7 @@ def convert_fukui_csv():
                         # 入力CSVに項目が存在する場合は満足度を数値に変換
                         value = row[input_field]
                         converted_value = convert_satisfaction_to_number(value)
+                        unmapped.satisfaction(header, value, converted_value)
                         output_row.append(converted_value)
                     else:
                         # 入力CSVに項目が存在しない場合は空文字を出力
@@ -413,17 +437,41 @@ def convert_fukui_csv():
                         
                         # 「アンケート回答日」の場合は日付形式を統一
                         if header == "アンケート回答日":
-                            value = format_date_string(value)
+                            formatted = format_date_string(value)
+                            unmapped.date(value, formatted)
+                            value = formatted
                         
                         output_row.append(value)
                     else:
                         # 入力CSVに項目が存在しない場合は空文字を出力
                         output_row.append("")
             
+            # どのフラグのキーワードにも当てはまらなかった選択肢を数える
+            unmapped.choices("目的", row.get(mapping["目的"], ""), parse_purpose_flags)
+            unmapped.choices("交通手段１（目的地まで）", row.get(mapping["交通手段１（目的地まで）"], ""),
+                             parse_transport_flags)
+            unmapped.choices("交通手段２（目的地から）", row.get(mapping["交通手段２（目的地から）"], ""),
+                             parse_transport2_flags)
+            unmapped.choices("情報源", row.get('情報収集ALL', ''), check_information_source_flags,
+                             fallback="その他")
+            
+            # 統一スキーマに違反した行はモードに応じて数える・退避する・変換を中止する
+            if not validator.accept(output_row):
+                continue
             writer.writerow(output_row)
+            checkpoint.observe(output_row)
+    
+    # 次回の差分変換のためにチェックポイントを保存
+    checkpoint.save(rows)
     
+    unmapped.print_summary()
     print(f"変換完了: {output_csv}")
     print(f"出力行数: {len(rows)}")
+    if start_index > 0:
+        print(f"差分変換行数: {len(rows) - start_index}")
+    
+    return {"rows_in": len(rows), "rows_out": len(rows) - start_index - len(validator.quarantined),
+            "validation": validator.summary(), "unmapped": unmapped.summary(), "bytes_read": file_size(input_csv), "bytes_written": file_size(output_csv) - output_offset}
 
 def main():
     """
@@ -431,9 +479,16 @@ def main():
     """
     # 福井CSVファイルの前処理を実行
     input_csv = "input/fukui/fukui.csv"
+    # マージプログラムから実行された場合は処理段階ごとの計測結果を書き出す
+    report = RunReport.for_subprocess()
     if os.path.exists(input_csv):
         print("福井CSVファイルの前処理を開始します...")
-        if process_fukui_csv(input_csv):
+        with report.stage("preprocess", "fukui") as stage:
+            processed = process_fukui_csv(input_csv)
+            report.add(bytes_read=file_size(input_csv),
+                       bytes_written=file_size("input/fukui/fukui_formatted.csv"))
+            stage["status"] = "ok" if processed else "failed"
+        if processed:
             print("福井CSVファイルの前処理が完了しました。")
         else:
             print("福井CSVファイルの前処理に失敗しました。")
@@ -444,7 +499,17 @@ def main():
     
     # CSV変換を実行
     print("CSV変換を開始します...")
-    convert_fukui_csv()
+    with report.stage("convert", "fukui") as stage:
+        try:
+            result = convert_fukui_csv(incremental="--incremental" in sys.argv[1:],
+                                        validate=validation_mode(sys.argv[1:]))
+        except SchemaViolation as e:
+            print(f"検証エラー: {e}", file=sys.stderr)
+            stage["status"] = "failed"
+            sys.exit(1)
+        stage["validation"] = result.pop("validation")
+        stage["unmapped"] = result.pop("unmapped")
+        report.add(**result)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,8 +1,14 @@
 import csv
 import json
 import os
+import sys
 import codecs
 from datetime import datetime
+from incremental import ConversionCheckpoint
+from instrumentation import RunReport, file_size
+from progress import Progress, read_bytes
+from unmapped import UnmappedTracker
+from validation import RowValidator, SchemaViolation, validation_mode
 
 def remove_unwanted_linebreaks(input_file_path):
     """
@@ -10,18 +16,14 @@ def remove_unwanted_linebreaks(input_file_path):
     """
     try:
         # バイナリモードでファイルを読み込み（改行コードを正規化しない）
-        with open(input_file_path, 'rb') as f:
-            content_bytes = f.read()
+        content_bytes = read_bytes(input_file_path, "前処理 ishikawa")
         
         # デバッグ情報：バイナリレベルでの改行コードの数を確認
         lf_count = content_bytes.count(b'\n')
         cr_count = content_bytes.count(b'\r')
         
-        # CRLFの数を正しくカウント
-        crlf_count = 0
-        for i in range(len(content_bytes) - 1):
-            if content_bytes[i] == ord('\r') and content_bytes[i + 1] == ord('\n'):
-                crlf_count += 1
+        # CRLFの数を正しくカウント（CRLFは重ならないため、count()の結果と同じ）
+        crlf_count = content_bytes.count(b'\r\n')
         
         # 単独のCRとLFの数を計算
         standalone_cr = cr_count - crlf_count
@@ -324,7 +326,12 @@ def check_information_source_flags(information_source):
     
     return result
 
-def convert_ishikawa_csv():
+def convert_ishikawa_csv(incremental=False, validate="count"):
+    """
+    CSV変換処理
+    incremental=Trueの場合は前回変換済みのレコードをスキップし、追加分だけを追記する
+    validateは変換後の行の検証モード（count/quarantine/fail/off、validation.py）
+    """
     # ファイルパス
     input_csv = "input/ishikawa/ishikawa_formatted.csv"
     mapping_json = "input/ishikawa/column_mapping_ishikawa.json"
@@ -357,15 +364,28 @@ def convert_ishikawa_csv():
     if reader is None:
         raise UnicodeDecodeError("すべてのエンコーディングでCSVファイルの読み込みに失敗しました")
     
-    # 出力CSVを作成
-    with open(output_csv, 'w', encoding='utf-8', newline='') as f:
+    # 差分変換の場合は変換済みのレコードをスキップ
+    checkpoint = ConversionCheckpoint("ishikawa", mapping_json, __file__, output_csv, validate)
+    start_index = checkpoint.resume_index(rows) if incremental else 0
+    # 追記の場合は追記前のサイズを書き込みバイト数から除く
+    output_offset = file_size(output_csv) if start_index > 0 else 0
+    
+    # 対応表・キーワードに当てはまらなかった回答
+    unmapped = UnmappedTracker("ishikawa")
+    
+    # 出力CSVを作成（全件変換は内容が変わった場合だけ置き換え、差分変換は末尾に追記）
+    with checkpoint.open_output(start_index, output_headers) as f, \
+            Progress("変換 ishikawa", len(rows) - start_index) as progress, \
+            RowValidator("ishikawa", output_headers, validate, start_index) as validator:
         writer = csv.writer(f)
         
-        # ヘッダー行を書き込み
-        writer.writerow(output_headers)
+        # ヘッダー行を書き込み（追記の場合は不要）
+        if start_index == 0:
+            writer.writerow(output_headers)
         
         # データ行を処理
-        for row in rows:
+        for row in rows[start_index:]:
+            progress.update()
             output_row = []
             
             for header in output_headers:
@@ -426,7 +446,7 @@ def convert_ishikawa_csv():
                 # 満足度項目の処理
                 elif header in ["交通の満足度", 
                                "満足度（食べ物・料理）", "満足度（宿泊施設）", 
-                               "満足度（買い物（工芸品・特産品など））", "満足度買い物（観光・体験）", 
+                               "満足度（買い物（工芸品・特産品など））", "満足度（観光・体験）", 
                                "満足度（旅行全体）", "満足度（商品・サービス）"]:
                     # マッピングから対応する入力項目名を取得
                     input_field = mapping[header]
@@ -438,6 +458,7 @@ def convert_ishikawa_csv():
                         # 入力CSVに項目が存在する場合は満足度を数値に変換
                         value = row[input_field]
                         converted_value = convert_satisfaction_to_number(value)
+                        unmapped.satisfaction(header, value, converted_value)
                         output_row.append(converted_value)
                     else:
                         # 入力CSVに項目が存在しない場合は空文字を出力
@@ -455,7 +476,9 @@ def convert_ishikawa_csv():
                         
                         # 「アンケート回答日」の場合は日付形式を統一
                         if header == "アンケート回答日":
-                            value = format_date_string(value)
+                            formatted = format_date_string(value)
+                            unmapped.date(value, formatted)
+                            value = formatted
                         # 「年代」の場合は生まれた年から年代を計算
                         elif header == "年代":
                             # アンケート回答日を取得
@@ -484,10 +507,32 @@ def convert_ishikawa_csv():
                         # 入力CSVに項目が存在しない場合は空文字を出力
                         output_row.append("")
             
+            # どのフラグのキーワードにも当てはまらなかった選択肢を数える
+            unmapped.choices("目的", row.get(mapping["目的"], ""), parse_purpose_flags)
+            unmapped.choices("交通手段１（目的地まで）", row.get(mapping["交通手段１（目的地まで）"], ""),
+                             parse_transport_flags)
+            unmapped.choices("交通手段２（目的地から）", row.get(mapping["交通手段２（目的地から）"], ""),
+                             parse_transport2_flags)
+            unmapped.choices("情報源", row.get('今回   当施設   を訪れる際に参考にした情報源は何ですか？（複数選択可）', ''), check_information_source_flags,
+                             fallback="その他")
+            
+            # 統一スキーマに違反した行はモードに応じて数える・退避する・変換を中止する
+            if not validator.accept(output_row):
+                continue
             writer.writerow(output_row)
+            checkpoint.observe(output_row)
+    
+    # 次回の差分変換のためにチェックポイントを保存
+    checkpoint.save(rows)
     
+    unmapped.print_summary()
     print(f"変換完了: {output_csv}")
     print(f"出力行数: {len(rows)}")
+    if start_index > 0:
+        print(f"差分変換行数: {len(rows) - start_index}")
+    
+    return {"rows_in": len(rows), "rows_out": len(rows) - start_index - len(validator.quarantined),
+            "validation": validator.summary(), "unmapped": unmapped.summary(), "bytes_read": file_size(input_csv), "bytes_written": file_size(output_csv) - output_offset}
 
 def main():
     """
@@ -495,9 +540,16 @@ def main():
     """
     # 不要な改行コードの削除を実行
     input_csv = "input/ishikawa/ishikawa.csv"
+    # マージプログラムから実行された場合は処理段階ごとの計測結果を書き出す
+    report = RunReport.for_subprocess()
     if os.path.exists(input_csv):
         print("不要な改行コードの削除を開始します...")
-        if remove_unwanted_linebreaks(input_csv):
+        with report.stage("preprocess", "ishikawa") as stage:
+            removed = remove_unwanted_linebreaks(input_csv)
+            report.add(bytes_read=file_size(input_csv),
+                       bytes_written=file_size("input/ishikawa/ishikawa_formatted.csv"))
+            stage["status"] = "ok" if removed else "failed"
+        if removed:
             print("不要な改行コードの削除が完了しました。")
         else:
             print("不要な改行コードの削除に失敗しました。")
@@ -507,7 +559,17 @@ def main():
     
     # CSV変換を実行
     print("CSV変換を開始します...")
-    convert_ishikawa_csv()
+    with report.stage("convert", "ishikawa") as stage:
+        try:
+            result = convert_ishikawa_csv(incremental="--incremental" in sys.argv[1:],
+                                        validate=validation_mode(sys.argv[1:]))
+        except SchemaViolation as e:
+            print(f"検証エラー: {e}", file=sys.stderr)
+            stage["status"] = "failed"
+            sys.exit(1)
+        stage["validation"] = result.pop("validation")
+        stage["unmapped"] = result.pop("unmapped")
+        report.add(**result)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,9 +1,14 @@
 import csv
 import json
 import os
+import sys
 import codecs
-import shutil
 from datetime import datetime
+from incremental import ConversionCheckpoint
+from instrumentation import RunReport, file_size
+from progress import Progress, copy_file
+from unmapped import UnmappedTracker
+from validation import RowValidator, SchemaViolation, validation_mode
 
 def convert_satisfaction_to_number(satisfaction_str):
     """
@@ -274,7 +279,7 @@ def copy_toyama_csv():
     
     try:
         if os.path.exists(source_file):
-            shutil.copy2(source_file, target_file)
+            copy_file(source_file, target_file, "前処理 toyama")
             print(f"ファイルコピー完了: {source_file} -> {target_file}")
             return True
         else:
@@ -284,7 +289,12 @@ def copy_toyama_csv():
         print(f"ファイルコピーエラー: {e}")
         return False
 
-def convert_toyama_csv():
+def convert_toyama_csv(incremental=False, validate="count"):
+    """
+    CSV変換処理
+    incremental=Trueの場合は前回変換済みのレコードをスキップし、追加分だけを追記する
+    validateは変換後の行の検証モード（count/quarantine/fail/off、validation.py）
+    """
     # ファイルパス
     input_csv = "input/toyama/toyama_formatted.csv"
     mapping_json = "input/toyama/column_mapping_toyama.json"
@@ -303,15 +313,28 @@ def convert_toyama_csv():
         input_headers = reader.fieldnames
         rows = list(reader)
 
-    # 出力CSVを作成
-    with open(output_csv, 'w', encoding='utf-8', newline='') as f:
+    # 差分変換の場合は変換済みのレコードをスキップ
+    checkpoint = ConversionCheckpoint("toyama", mapping_json, __file__, output_csv, validate)
+    start_index = checkpoint.resume_index(rows) if incremental else 0
+    # 追記の場合は追記前のサイズを書き込みバイト数から除く
+    output_offset = file_size(output_csv) if start_index > 0 else 0
+    
+    # 対応表・キーワードに当てはまらなかった回答
+    unmapped = UnmappedTracker("toyama")
+    
+    # 出力CSVを作成（全件変換は内容が変わった場合だけ置き換え、差分変換は末尾に追記）
+    with checkpoint.open_output(start_index, output_headers) as f, \
+            Progress("変換 toyama", len(rows) - start_index) as progress, \
+            RowValidator("toyama", output_headers, validate, start_index) as validator:
         writer = csv.writer(f)
         
-        # ヘッダー行を書き込み
-        writer.writerow(output_headers)
+        # ヘッダー行を書き込み（追記の場合は不要）
+        if start_index == 0:
+            writer.writerow(output_headers)
         
         # データ行を処理
-        for row in rows:
+        for row in rows[start_index:]:
+            progress.update()
             output_row = []
             
             for header in output_headers:
@@ -388,6 +411,7 @@ def convert_toyama_csv():
                         # 入力CSVに項目が存在する場合は満足度を数値に変換
                         value = row[input_field]
                         converted_value = convert_satisfaction_to_number(value)
+                        unmapped.satisfaction(header, value, converted_value)
                         output_row.append(converted_value)
                     else:
                         # 入力CSVに項目が存在しない場合は空文字を出力
@@ -405,7 +429,9 @@ def convert_toyama_csv():
                         
                         # 「アンケート回答日」の場合は日付形式を統一
                         if header == "アンケート回答日":
-                            value = format_date_string(value)
+                            formatted = format_date_string(value)
+                            unmapped.date(value, formatted)
+                            value = formatted
                         # 性別の場合は男性→男、女性→女に変換
                         elif header == "性別":
                             value = convert_gender(value)
@@ -418,18 +444,48 @@ def convert_toyama_csv():
                         # 入力CSVに項目が存在しない場合は空文字を出力
                         output_row.append("")
             
+            # どのフラグのキーワードにも当てはまらなかった選択肢を数える
+            unmapped.choices("目的", row.get(mapping["目的"], ""), parse_purpose_flags)
+            unmapped.choices("交通手段１（目的地まで）", row.get(mapping["交通手段１（目的地まで）"], ""),
+                             parse_transport_flags)
+            unmapped.choices("交通手段２（目的地から）", row.get(mapping["交通手段２（目的地から）"], ""),
+                             parse_transport2_flags)
+            unmapped.choices("情報源", format_information_source(row), check_information_source_flags,
+                             fallback="その他")
+            
+            # 統一スキーマに違反した行はモードに応じて数える・退避する・変換を中止する
+            if not validator.accept(output_row):
+                continue
             writer.writerow(output_row)
+            checkpoint.observe(output_row)
     
+    # 次回の差分変換のためにチェックポイントを保存
+    checkpoint.save(rows)
+    
+    unmapped.print_summary()
     print(f"変換完了: {output_csv}")
     print(f"出力行数: {len(rows)}")
+    if start_index > 0:
+        print(f"差分変換行数: {len(rows) - start_index}")
+    
+    return {"rows_in": len(rows), "rows_out": len(rows) - start_index - len(validator.quarantined),
+            "validation": validator.summary(), "unmapped": unmapped.summary(), "bytes_read": file_size(input_csv), "bytes_written": file_size(output_csv) - output_offset}
 
 def main():
     """
     メイン処理
     """
+    # マージプログラムから実行された場合は処理段階ごとの計測結果を書き出す
+    report = RunReport.for_subprocess()
+    
     # ファイルコピーを実行
     print("富山CSVファイルのコピーを開始します...")
-    if copy_toyama_csv():
+    with report.stage("preprocess", "toyama") as stage:
+        copied = copy_toyama_csv()
+        report.add(bytes_read=file_size("input/toyama/toyama.csv"),
+                   bytes_written=file_size("input/toyama/toyama_formatted.csv"))
+        stage["status"] = "ok" if copied else "failed"
+    if copied:
         print("富山CSVファイルのコピーが完了しました。")
     else:
         print("富山CSVファイルのコピーに失敗しました。")
@@ -437,7 +493,17 @@ def main():
     
     # CSV変換を実行
     print("CSV変換を開始します...")
-    convert_toyama_csv()
+    with report.stage("convert", "toyama") as stage:
+        try:
+            result = convert_toyama_csv(incremental="--incremental" in sys.argv[1:],
+                                        validate=validation_mode(sys.argv[1:]))
+        except SchemaViolation as e:
+            print(f"検証エラー: {e}", file=sys.stderr)
+            stage["status"] = "failed"
+            sys.exit(1)
+        stage["validation"] = result.pop("validation")
+        stage["unmapped"] = result.pop("unmapped")
+        report.add(**result)
 
 if __name__ == "__main__":
     main()
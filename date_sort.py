@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+日付順出力モジュール
+マージ後のファイルをアンケート回答日の順に出力するための、外部マージソート（k-wayマージ）の機能と、
+日付順に出力したファイルから期間を指定して読み込む機能（期間の終わりを過ぎたら読み込みを止める）を提供
+
+変換後のデータは県ごとにほぼ日付順に並んでいるため、日付順になっている県のデータはそのまま使い、
+なっていない場合だけ一定の大きさに区切ってソートしたラン（RowBuffer）を作り、すべてをheapq.mergeで結合する
+同じ日時の行は、マージ前のファイルの順番（富山・石川・福井）と各ファイル内の順番を保つ
+"""
+
+import argparse
+import csv
+import heapq
+import re
+import sys
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from spill import MemoryBudget, estimate_row_size
+
+DATE_COLUMN = "アンケート回答日"
+# 例: 2023/04/28 21:25:52, 2025/5/4 00:00:00, 2024-01-05
+DATE_PATTERN = re.compile(r'(\d{4})[/-](\d{1,2})[/-](\d{1,2})(?:\D+(\d{1,2}):(\d{1,2})(?::(\d{1,2}))?)?')
+# メモリ上限がない場合のソートの単位（行数）
+DEFAULT_CHUNK_ROWS = 1000000
+
+SortKey = Tuple[int, ...]
+
+
+def date_sort_key(value: str) -> SortKey:
+    """日付文字列の並び順のキー（解析できない日付は最後）"""
+    match = DATE_PATTERN.search(value or "")
+    if not match:
+        return (1,)
+    return (0,) + tuple(int(part or 0) for part in match.groups())
+
+
+def range_end_key(value: str) -> SortKey:
+    """期間の終わりのキー（日付だけを指定した場合はその日のすべての時刻を含む）"""
+    match = DATE_PATTERN.search(value)
+    if match and match.group(4) is None:
+        # 時は最大23のため、24はその日の最後の時刻より後で翌日より前になる
+        return (0,) + tuple(int(part) for part in match.groups()[:3]) + (24,)
+    return date_sort_key(value)
+
+
+def row_key(date_column_index: int) -> Callable[[List[str]], SortKey]:
+    def key(row: List[str]) -> SortKey:
+        return date_sort_key(row[date_column_index] if date_column_index < len(row) else "")
+    return key
+
+
+def is_sorted(rows: Iterable[List[str]], key: Callable[[List[str]], SortKey]) -> bool:
+    previous = None
+    for row in rows:
+        current = key(row)
+        if previous is not None and current < previous:
+            return False
+        previous = current
+    return True
+
+
+def sorted_runs(rows: Iterable[List[str]], key: Callable[[List[str]], SortKey],
+                budget: Optional[MemoryBudget] = None) -> List[Iterable[List[str]]]:
+    """
+    行データを一定の大きさに区切ってソートしたランのリストを返す
+    メモリ上限がある場合は上限の1/4ごとに区切り、ランはRowBufferに格納する（上限を超えると一時ファイルに退避）
+    """
+    runs = []
+    chunk: List[List[str]] = []
+    chunk_bytes = 0
+    limit = budget.max_bytes // 4 if budget else None
+
+    def finish_chunk():
+        chunk.sort(key=key)
+        if budget:
+            run = budget.buffer()
+            run.extend(chunk)
+            runs.append(run)
+        else:
+            runs.append(list(chunk))
+        chunk.clear()
+
+    for row in rows:
+        chunk.append(row)
+        if limit:
+            chunk_bytes += estimate_row_size(row)
+            if chunk_bytes >= limit:
+                finish_chunk()
+                chunk_bytes = 0
+        elif len(chunk) >= DEFAULT_CHUNK_ROWS:
+            finish_chunk()
+    if chunk:
+        finish_chunk()
+    return runs
+
+
+def merge_sorted(sources: List[Iterable[List[str]]], key: Callable[[List[str]], SortKey],
+                 budget: Optional[MemoryBudget] = None) -> Iterator[List[str]]:
+    """
+    複数の行データを日付順に結合（k-wayマージ）
+    日付順になっていない行データは、ソートしたランに分けてから結合する
+    """
+    runs: List[Iterable[List[str]]] = []
+    # ソートのために作成したラン（結合後に一時ファイルを削除する）
+    created = []
+    for rows in sources:
+        if is_sorted(rows, key):
+            runs.append(rows)
+        else:
+            chunks = sorted_runs(rows, key, budget)
+            created.extend(chunks)
+            runs.extend(chunks)
+    try:
+        # heapq.mergeは同じキーの行を渡したランの順番で返す（安定）
+        yield from heapq.merge(*runs, key=key)
+    finally:
+        for run in created:
+            if hasattr(run, "close"):
+                run.close()
+
+
+def read_date_range(path, start: Optional[str] = None, end: Optional[str] = None) -> Iterator[List[str]]:
+    """
+    日付順に出力したCSVファイル（--sort-by-date）から、回答日がstart以上end以下の行を読み込む
+    endは日付だけを指定した場合はその日の終わりまでを含み、endを過ぎた時点で読み込みを止める
+    """
+    start_key = date_sort_key(start) if start else None
+    end_key = range_end_key(end) if end else None
+    with open(path, "r", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        headers = next(reader)
+        key = row_key(headers.index(DATE_COLUMN))
+        for row in reader:
+            current = key(row)
+            if end_key is not None and current > end_key:
+                break
+            if start_key is not None and current < start_key:
+                continue
+            yield row
+
+
+def main():
+    parser = argparse.ArgumentParser(description="日付順に出力したマージ後ファイルから期間を指定して行を出力")
+    parser.add_argument("path", help="日付順に出力したCSVファイル（例: output_merge/merged_survey.csv）")
+    parser.add_argument("--from", dest="start", default=None, metavar="DATE", help="開始日（例: 2024/04/01）")
+    parser.add_argument("--to", dest="end", default=None, metavar="DATE", help="終了日（この日を含む）")
+    args = parser.parse_args()
+
+    with open(args.path, "r", encoding="utf-8-sig") as f:
+        headers = next(csv.reader(f))
+    writer = csv.writer(sys.stdout)
+    writer.writerow(headers)
+    writer.writerows(read_date_range(args.path, args.start, args.end))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
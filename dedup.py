@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+重複回答の除去モジュール
+マージ後の行から、正規化した内容が同じ行（2件目以降）を除去する機能を提供
+（福井県の年度ファイルの期間の重なりや、石川県のシートの再エクスポートによる重複）
+
+  1. 走査: 読み込んだ県ごとのデータの各行の正規化後のダイジェスト（16バイト）をBloomフィルターに追加し、
+           追加前に「含まれている可能性がある」と判定された行のダイジェストだけを候補として記録
+  2. 除去: マージしながら、候補のダイジェストを持つ行だけを正規化後の値で先に出現した行と完全に比較し、
+           同じなら除去（マージ後のデータを読み直さない）
+
+対象県の列も比較するため、重複は同じ県の中にしかない。Bloomフィルターは県ごとに読み込んだ行数で
+偽陽性率0.1%になる大きさ（1行あたり約1.8バイト、1000万行で約17MB）で作成して走査後に破棄し、
+すべての行のダイジェストを保持する場合（数百MB）に比べてメモリ使用量を抑える
+"""
+
+import functools
+import hashlib
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Sized
+
+from date_sort import DATE_COLUMN, DATE_PATTERN
+from fingerprint import FIELD_SEPARATOR
+
+DEFAULT_ERROR_RATE = 0.001
+SOURCE_COLUMN = "対象県（富山/石川/福井）"
+WHITESPACE = re.compile(r"\s+")
+
+
+class BloomFilter:
+    """16バイトのダイジェストを要素とするBloomフィルター（前半・後半の8バイトから各ハッシュ位置を計算）"""
+
+    def __init__(self, capacity: int, error_rate: float = DEFAULT_ERROR_RATE):
+        capacity = max(capacity, 1)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    @property
+    def memory_bytes(self) -> int:
+        return len(self.bits)
+
+    def _positions(self, digest: bytes) -> Iterator[int]:
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:16], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, digest: bytes) -> bool:
+        """要素を追加し、追加前に含まれている可能性があったかを返す"""
+        present = True
+        bits = self.bits
+        for position in self._positions(digest):
+            byte, mask = position >> 3, 1 << (position & 7)
+            if not bits[byte] & mask:
+                present = False
+                bits[byte] |= mask
+        self.count += 1
+        return present
+
+
+# 選択肢や0/1のフラグなど同じ値が繰り返し現れるため、正規化の結果を再利用する
+@functools.lru_cache(maxsize=65536)
+def normalize_value(value: str) -> str:
+    """全角・半角の違いと前後・連続する空白の違いをなくす"""
+    return WHITESPACE.sub(" ", unicodedata.normalize("NFKC", value)).strip()
+
+
+def normalize_date(value: str) -> str:
+    """日付の表記の違いをなくす（例: 2025/5/4 0:00 → 2025-05-04 00:00:00）"""
+    match = DATE_PATTERN.search(value or "")
+    if not match:
+        return normalize_value(value)
+    year, month, day, hour, minute, second = (int(part or 0) for part in match.groups())
+    return f"{year:04d}-{month:02d}-{day:02d} {hour:02d}:{minute:02d}:{second:02d}"
+
+
+class DuplicateFilter:
+    """
+    マージ後の行から重複回答を除去する
+    県ごとのデータを scan() で走査してから、マージしながら filter() で除去する
+    """
+
+    def __init__(self, headers: List[str], error_rate: float = DEFAULT_ERROR_RATE):
+        self.error_rate = error_rate
+        self.date_index = headers.index(DATE_COLUMN) if DATE_COLUMN in headers else None
+        self.source_index = headers.index(SOURCE_COLUMN) if SOURCE_COLUMN in headers else None
+        self.candidates = set()
+        self.dropped: Counter = Counter()
+        # 候補のダイジェスト → 先に出現した行の正規化後の値、出現回数
+        self._first_seen: Dict[bytes, List[List[str]]] = {}
+        self._occurrences: Counter = Counter()
+        self.scanned_rows = 0
+        self.bloom_bytes = 0
+        self.bloom_hashes = 0
+
+    def normalize(self, row: List[str]) -> List[str]:
+        normalized = [normalize_value(value) for value in row]
+        if self.date_index is not None and self.date_index < len(row):
+            normalized[self.date_index] = normalize_date(row[self.date_index])
+        return normalized
+
+    @staticmethod
+    def digest(normalized: List[str]) -> bytes:
+        return hashlib.blake2b(FIELD_SEPARATOR.join(normalized).encode("utf-8"), digest_size=16).digest()
+
+    def scan(self, rows: Sized):
+        """1県の読み込んだデータの行数でBloomフィルターを作成し、重複の候補を記録する（マージの前に呼ぶ）"""
+        bloom = BloomFilter(len(rows), self.error_rate)
+        for row in rows:
+            digest = self.digest(self.normalize(row))
+            if bloom.add(digest):
+                self.candidates.add(digest)
+        self.scanned_rows += bloom.count
+        self.bloom_bytes = max(self.bloom_bytes, bloom.memory_bytes)
+        self.bloom_hashes = bloom.hashes
+
+    def filter(self, rows: Iterable[List[str]]) -> Iterator[List[str]]:
+        """重複回答（2件目以降）を除いた行を返す（マージしながら使う。候補は走査済みの県のもの）"""
+        candidates = self.candidates
+        first_seen = self._first_seen
+        occurrences = self._occurrences
+        for row in rows:
+            normalized = self.normalize(row)
+            digest = self.digest(normalized)
+            if digest not in candidates:
+                yield row
+                continue
+            # 候補の行だけを正規化後の値で完全に比較（ダイジェストの衝突にも対応）
+            occurrences[digest] += 1
+            seen = first_seen.setdefault(digest, [])
+            if normalized in seen:
+                self.dropped[self.source_of(row)] += 1
+                continue
+            seen.append(normalized)
+            yield row
+
+    def source_of(self, row: List[str]) -> str:
+        if self.source_index is not None and self.source_index < len(row) and row[self.source_index]:
+            return row[self.source_index]
+        return "不明"
+
+    def summary(self) -> List[str]:
+        lines = [f"重複として除去: {sum(self.dropped.values())} 行"]
+        for source, count in self.dropped.most_common():
+            lines.append(f"  {source}: {count} 行")
+        # Bloomフィルターの偽陽性（先に同じダイジェストの行がなかった候補）
+        false_positives = sum(1 for digest in self.candidates if self._occurrences[digest] <= 1)
+        lines.append(f"Bloomフィルター 最大 {self.bloom_bytes / 1024:,.1f}KB "
+                     f"（県ごとの行数で偽陽性率{self.error_rate:.1%}、ハッシュ{self.bloom_hashes}個、"
+                     f"走査 {self.scanned_rows:,} 行）, "
+                     f"候補 {len(self.candidates)} 件（重複でなかったもの {false_positives} 件）")
+        return lines
@@ -3,6 +3,9 @@
 """
 データダウンロードモジュール
 各県のアンケートデータを自動的にダウンロードする機能を提供
+
+validatorsを指定した場合は、前回の応答のETag・Last-Modifiedを使った条件付きリクエスト
+（If-None-Match / If-Modified-Since）で取得し、変更がなければ（304 Not Modified）既存のファイルをそのまま使う
 """
 
 import csv
@@ -11,22 +14,84 @@ import re
 import shutil
 import tempfile
 import traceback
+import urllib.error
 import urllib.request
 from pathlib import Path
+from typing import Dict
+
+from progress import Progress
+
+CHUNK_SIZE = 256 * 1024
+
+# ダウンロード元（富山: Box、石川: GoogleスプレッドシートのCSVエクスポート、福井: GitHub APIのファイル一覧）
+# GoogleスプレッドシートのURL: https://docs.google.com/spreadsheets/d/1riK_ufkmF6Ql7Tujwlm22FtHOLz7hwUzf6Zi6JAG_QI/edit?gid=0#gid=0
+SOURCE_URLS = {
+    "toyama": "https://toyama-pref.box.com/shared/static/6tpwiv96wzngxsk3rio1t1vi1dhordnn.csv",
+    "ishikawa": "https://docs.google.com/spreadsheets/d/1riK_ufkmF6Ql7Tujwlm22FtHOLz7hwUzf6Zi6JAG_QI/export?format=csv&gid=0",
+    "fukui": "https://api.github.com/repos/code4fukui/fukui-kanko-survey/contents/fiscalyearly",
+}
 
 
 class DataDownloader:
     """データダウンロードクラス"""
     
+    def __init__(self, urls: Dict[str, str] = None, validators: Dict[str, dict] = None):
+        # 県名 → ダウンロード元（テスト用のサーバーなどに置き換える場合に指定）
+        self.urls = dict(SOURCE_URLS, **(urls or {}))
+        # URL → 前回の応答のETag・Last-Modified（Noneの場合は条件付きリクエストを使わない）
+        self.validators = validators
+        # 条件付きリクエストで変更がなかった（304）URL
+        self.not_modified = set()
+    
+    def open_url(self, req: urllib.request.Request, output_path: Path):
+        """
+        リクエストを送信して応答を返す
+        出力先が既にあり、前回の応答のETag・Last-Modifiedがある場合は条件付きリクエストにし、
+        変更がない（304 Not Modified）場合はNoneを返す
+        """
+        url = req.full_url
+        validator = self.validators.get(url) if self.validators is not None and output_path.exists() else None
+        if validator:
+            if validator.get("etag"):
+                req.add_header('If-None-Match', validator["etag"])
+            if validator.get("last_modified"):
+                req.add_header('If-Modified-Since', validator["last_modified"])
+        try:
+            response = urllib.request.urlopen(req, timeout=30)
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and validator:
+                self.not_modified.add(url)
+                return None
+            raise
+        if self.validators is not None:
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            if etag or last_modified:
+                self.validators[url] = {"etag": etag, "last_modified": last_modified}
+            else:
+                self.validators.pop(url, None)
+        return response
+    
     def download_file(self, url: str, output_path: Path) -> bool:
-        """URLからファイルをダウンロード"""
+        """URLからファイルをダウンロード（条件付きリクエストで変更がない場合は既存のファイルを残す）"""
         try:
             print(f"  ダウンロード中: {url}")
             req = urllib.request.Request(url)
             req.add_header('User-Agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36')
             
-            with urllib.request.urlopen(req, timeout=30) as response:
-                data = response.read()
+            response = self.open_url(req, output_path)
+            if response is None:
+                print(f"  ✓ 変更なし: {output_path}")
+                return True
+            with response:
+                # 受信したバイト数の進捗を表示（Content-Lengthがない場合は残り時間なし）
+                length = response.headers.get('Content-Length')
+                chunks = []
+                with Progress(f"ダウンロード {output_path.name}", int(length) if length else None, "bytes") as progress:
+                    for chunk in iter(lambda: response.read(CHUNK_SIZE), b''):
+                        chunks.append(chunk)
+                        progress.update(len(chunk))
+                data = b''.join(chunks)
                 output_path.parent.mkdir(parents=True, exist_ok=True)
                 with open(output_path, 'wb') as f:
                     f.write(data)
@@ -39,34 +104,34 @@ class DataDownloader:
     def download_toyama_data(self) -> bool:
         """富山のデータをダウンロード"""
         print("\n=== 富山県データのダウンロード ===")
-        url = "https://toyama-pref.box.com/shared/static/6tpwiv96wzngxsk3rio1t1vi1dhordnn.csv"
         output_path = Path("input/toyama/toyama.csv")
-        return self.download_file(url, output_path)
+        return self.download_file(self.urls["toyama"], output_path)
     
     def download_ishikawa_data(self) -> bool:
         """石川のデータをダウンロード（GoogleスプレッドシートからCSV形式で）"""
         print("\n=== 石川県データのダウンロード ===")
-        # GoogleスプレッドシートのCSVエクスポートURL
-        # https://docs.google.com/spreadsheets/d/1riK_ufkmF6Ql7Tujwlm22FtHOLz7hwUzf6Zi6JAG_QI/edit?gid=0#gid=0
-        spreadsheet_id = "1riK_ufkmF6Ql7Tujwlm22FtHOLz7hwUzf6Zi6JAG_QI"
-        gid = "0"
-        url = f"https://docs.google.com/spreadsheets/d/{spreadsheet_id}/export?format=csv&gid={gid}"
         output_path = Path("input/ishikawa/ishikawa.csv")
-        return self.download_file(url, output_path)
+        return self.download_file(self.urls["ishikawa"], output_path)
     
     def download_fukui_data(self) -> bool:
         """福井のデータをダウンロード（GitHubリポジトリから2023年以降のCSVを取得してマージ）"""
         print("\n=== 福井県データのダウンロード ===")
         try:
             # GitHub APIを使用してfiscalyearlyフォルダ内のファイル一覧を取得
-            api_url = "https://api.github.com/repos/code4fukui/fukui-kanko-survey/contents/fiscalyearly"
+            api_url = self.urls["fukui"]
             print(f"  GitHub APIからファイル一覧を取得中: {api_url}")
+            output_path = Path("input/fukui/fukui.csv")
             
             req = urllib.request.Request(api_url)
             req.add_header('Accept', 'application/vnd.github.v3+json')
             req.add_header('User-Agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36')
             
-            with urllib.request.urlopen(req, timeout=30) as response:
+            # ファイル一覧に変更がなければ（いずれのファイルも更新されていなければ）マージ済みのファイルを使う
+            response = self.open_url(req, output_path)
+            if response is None:
+                print(f"  ✓ 変更なし: {output_path}")
+                return True
+            with response:
                 files_data = json.loads(response.read().decode('utf-8'))
             
             # 2023年以降のCSVファイルをフィルタリング
@@ -111,7 +176,6 @@ class DataDownloader:
             
             # CSVファイルをマージ
             print(f"  {len(downloaded_files)}件のCSVファイルをマージ中...")
-            output_path = Path("input/fukui/fukui.csv")
             output_path.parent.mkdir(parents=True, exist_ok=True)
             
             merged_headers = None
@@ -159,6 +223,12 @@ class DataDownloader:
             # 一時ディレクトリを削除
             shutil.rmtree(temp_dir)
             
+            # 一部の年度のダウンロードに失敗した場合は、ファイル一覧のETag・Last-Modifiedを破棄して
+            # 次回は一覧が変わっていなくても全年度を取得し直す（変更なし（304）のまま取得されなくなるのを防ぐ）
+            if len(downloaded_files) < len(csv_files) and self.validators is not None:
+                self.validators.pop(api_url, None)
+                print(f"  警告: {len(csv_files) - len(downloaded_files)}件の年度のダウンロードに失敗しました。次回に取得し直します。")
+            
             return True
             
         except Exception as e:
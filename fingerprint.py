@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+行フィンガープリントモジュール
+統一スキーマの行から安定したハッシュ値を計算する機能を提供
+"""
+
+import hashlib
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+# 列の区切りに使う文字（CSVの値に現れない制御文字）
+FIELD_SEPARATOR = "\x1f"
+
+
+def row_fingerprint(row: List[str]) -> str:
+    """行の全列の値から16バイトのフィンガープリント（16進文字列）を計算"""
+    joined = FIELD_SEPARATOR.join(str(value) for value in row)
+    return hashlib.blake2b(joined.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def occurrence_fingerprints(rows: Iterable[List[str]]) -> Iterator[Tuple[str, List[str]]]:
+    """
+    行ごとのフィンガープリントを返す
+    まったく同じ内容の行が複数ある場合は「#2」「#3」…を付加して区別する
+    """
+    seen: Dict[str, int] = {}
+    for row in rows:
+        fingerprint = row_fingerprint(row)
+        count = seen.get(fingerprint, 0) + 1
+        seen[fingerprint] = count
+        if count > 1:
+            fingerprint = f"{fingerprint}#{count}"
+        yield fingerprint, row
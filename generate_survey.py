@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+合成アンケートデータ生成プログラム
+富山県・石川県・福井県の入力CSVと同じ形式（列名は column_mapping_*.json の入力項目名）の
+ダミーデータを任意の件数で生成する（性能測定用）
+
+実データの特徴を再現する
+  - 県ごとの日付形式（富山: yyyy/MM/dd、石川: MM/dd/yyyy hh:mm:ss、福井: yyyy-MM-dd hh:mm:ss）
+  - 複数選択の回答（目的・交通手段・情報源）をカンマ区切りで連結した文字列
+  - 改行・カンマ・ダブルクォートを含む自由記述
+  - 文字コード（UTF-8、BOM付きUTF-8、CP932）と改行コード（CRLF）
+  - 福井県の先頭列の6桁の会員ID
+"""
+
+import argparse
+import csv
+import json
+import random
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List
+
+PREFECTURES = ["toyama", "ishikawa", "fukui"]
+
+# 県ごとの変換スクリプトが読み込める文字コード
+ENCODINGS = {
+    "toyama": ["utf-8", "utf-8-sig"],
+    "ishikawa": ["utf-8", "utf-8-sig", "cp932"],
+    "fukui": ["utf-8", "utf-8-sig", "cp932"],
+}
+
+# 変換後の列名に対応しないが、変換スクリプトが参照する入力項目
+EXTRA_COLUMNS = {
+    "toyama": ["情報源（デジタル）", "情報源（デジタル以外）"],
+    "ishikawa": [],
+    "fukui": [],
+}
+
+DATE_FORMATS = {
+    "toyama": "%Y/%m/%d",
+    "ishikawa": "%m/%d/%Y %H:%M:%S",
+    "fukui": "%Y-%m-%d %H:%M:%S",
+}
+
+# 複数選択の回答の区切り文字
+SEPARATORS = {"toyama": ", ", "ishikawa": ", ", "fukui": ","}
+
+PURPOSES = [
+    "宿でのんびり過ごす", "温泉や露天風呂", "地元の美味しいものを食べる", "花見や紅葉などの自然鑑賞",
+    "名所、旧跡の観光", "テーマパーク（遊園地、動物園、博物館など）", "買い物、アウトレット",
+    "お祭りやイベントへの参加・見物", "スポーツ観戦や芸能鑑賞（コンサート等）",
+    "アウトドア（海水浴、釣り、登山など）", "まちあるき、都市散策", "各種体験（手作り、果物狩りなど）",
+    "スキー・スノボ、マリンスポーツ", "その他スポーツ（ゴルフ、テニスなど）", "ドライブ・ツーリング",
+    "友人・親戚を尋ねる", "出張など仕事関係", "その他",
+]
+TRANSPORTS = ["自家用車", "レンタカー", "新幹線", "在来線", "飛行機", "旅行会社ツアーバス", "高速バス"]
+LOCAL_TRANSPORTS = ["自家用車", "タクシー", "路線バス", "徒歩", "レンタサイクル", "在来線"]
+DIGITAL_SOURCES = [
+    "Facebook", "Google", "Googleマップ", "Instagram", "TikTok", "X（旧Twitter）", "YouTube",
+    "SNS広告", "ブログ", "まとめサイト", "デジタルニュースサイト", "宿泊予約Webサイト",
+]
+OTHER_SOURCES = [
+    "TV・ラジオ番組やCM", "新聞・雑誌・ガイドブック", "旅行会社", "友人・知人", "地元の人",
+    "観光パンフレット・ポスター", "観光案内所", "観光展・物産展", "宿泊施設",
+]
+RESIDENCES = [
+    "東京都", "神奈川県", "埼玉県", "千葉県", "大阪府", "京都府", "兵庫県", "愛知県", "岐阜県",
+    "長野県", "新潟県", "富山県", "石川県", "福井県", "北海道", "福岡県", "海外",
+]
+AGE_GROUPS = ["10代", "20代", "30代", "40代", "50代", "60代", "70代", "80代以上"]
+INCOMES = ["300万円未満", "300〜500万円未満", "500〜700万円未満", "700〜1000万円未満", "1000万円以上", "回答しない"]
+COMPANIONS = ["一人", "夫婦・パートナー", "家族（子供連れ）", "家族（大人のみ）", "友人・知人", "職場の同僚"]
+NIGHTS = ["日帰り", "1泊", "2泊", "3泊", "4泊以上"]
+AMOUNTS = [
+    "1,000円未満", "1,000円以上3,000円未満", "3,000円以上5,000円未満", "5,000円以上10,000円未満",
+    "10,000円以上30,000円未満", "30,000円以上50,000円未満", "50,000円以上",
+]
+AREAS = ["富山市", "高岡市", "金沢市", "加賀市", "七尾市", "福井市", "坂井市", "敦賀市", "小浜市", "永平寺町"]
+REVISIT = ["ぜひ訪れたい", "機会があれば訪れたい", "わからない", "訪れたくない"]
+VISIT_COUNTS = ["初めて", "2回目", "3〜5回目", "6回以上"]
+SATISFACTION = {
+    "toyama": ["大いに満足", "満足", "普通", "不満", "大いに不満"],
+    "ishikawa": ["とても満足", "満足", "どちらでもない", "不満", "とても不満"],
+    "fukui": ["とても満足", "満足", "どちらでもない", "不満", "とても不満"],
+}
+FREE_TEXT_PHRASES = [
+    "海鮮がとても美味しかった", "駅からの二次交通が分かりにくい", "また家族で来たいと思います",
+    "駐車場が少なく、週末は混雑していた", "スタッフの方の対応が丁寧でした",
+    "「おすすめ」の案内がもっとあると嬉しい", "雨の日でも楽しめる施設が欲しい",
+    "キャッシュレス決済に対応してほしい", "景色が素晴らしかった", '案内板の"駐車場"の表示が小さい', "特になし",
+]
+
+# 自由記述として扱う変換後の列
+FREE_TEXT_HEADERS = {
+    "自由意見", "満足度理由", "満足度理由(サービス)", "不便に感じたこと・困ったこと", "交通の満足度の理由",
+    "最も幸せを感じた食べ物", "最も幸せを感じた観光・体験",
+    "上記名称リストにない場合について、具体的にお答えください。(前)",
+    "上記名称リストにない場合について、具体的にお答えください。(後)",
+}
+AMOUNT_HEADERS = {"交通費", "飲食費", "宿泊費", "買い物費", "観光費", "施設orエリア消費総額"}
+SATISFACTION_HEADERS = {
+    "交通の満足度", "満足度（食べ物・料理）", "満足度（宿泊施設）", "満足度（買い物（工芸品・特産品など））",
+    "満足度（観光・体験）", "満足度（旅行全体）", "満足度（商品・サービス）",
+}
+
+
+def input_columns(prefecture: str, mapping_dir: Path = Path("input")) -> List[str]:
+    """列マッピングJSONから入力CSVの列名（重複を除く）を取得"""
+    mapping_json = Path(mapping_dir) / prefecture / f"column_mapping_{prefecture}.json"
+    with open(mapping_json, "r", encoding="utf-8") as f:
+        mapping = json.load(f)
+    columns = list(dict.fromkeys([v for v in mapping.values() if v] + EXTRA_COLUMNS[prefecture]))
+    if prefecture == "fukui":
+        # 福井県の前処理は先頭の会員IDを行の区切りとして扱う
+        columns.remove("会員ID")
+        columns.insert(0, "会員ID")
+    return columns
+
+
+class SurveyGenerator:
+    """1県分の合成アンケートデータ"""
+
+    def __init__(self, prefecture: str, rows: int, seed: int = 0,
+                 start: datetime = datetime(2023, 4, 1), end: datetime = datetime(2025, 12, 31),
+                 multiline_ratio: float = 0.1, mapping_dir: Path = Path("input")):
+        if prefecture not in PREFECTURES:
+            raise ValueError(f"未対応の県です: {prefecture}")
+        self.prefecture = prefecture
+        self.rows = rows
+        self.random = random.Random(f"{seed}:{prefecture}")
+        self.start = start
+        self.span = (end - start).total_seconds()
+        self.multiline_ratio = multiline_ratio
+        self.separator = SEPARATORS[prefecture]
+
+        with open(Path(mapping_dir) / prefecture / f"column_mapping_{prefecture}.json", "r", encoding="utf-8") as f:
+            mapping = json.load(f)
+        self.columns = input_columns(prefecture, mapping_dir)
+        # 入力項目名 → 変換後の列名（同じ入力項目が複数の列に対応する場合は最初の列）
+        unified = {}
+        for header, column in mapping.items():
+            if column:
+                unified.setdefault(column, header)
+        self._generators = [self._value_generator(column, unified.get(column, column)) for column in self.columns]
+
+    def _choice(self, values: List[str]) -> Callable[[int], str]:
+        choice = self.random.choice
+        return lambda i: choice(values)
+
+    def _multi(self, values: List[str], max_count: int = 4) -> Callable[[int], str]:
+        rng = self.random
+        return lambda i: self.separator.join(rng.sample(values, rng.randint(1, max_count)))
+
+    def _date(self, i: int) -> datetime:
+        # 行番号順に回答日が進む（実データは回答日順に追記される）
+        offset = self.span * i / max(self.rows - 1, 1)
+        return self.start + timedelta(seconds=int(offset) - int(offset) % 60 + self.random.randint(0, 59))
+
+    def _free_text(self, i: int) -> str:
+        rng = self.random
+        roll = rng.random()
+        if roll < 0.3:
+            return ""
+        sentences = rng.sample(FREE_TEXT_PHRASES, rng.randint(1, 3))
+        if roll < 0.3 + self.multiline_ratio:
+            return "\n".join(sentences)
+        return "。".join(sentences)
+
+    def _value_generator(self, column: str, header: str) -> Callable[[int], str]:
+        rng = self.random
+        prefecture = self.prefecture
+        if header == "アンケート回答日":
+            date_format = DATE_FORMATS[prefecture]
+            return lambda i: self._date(i).strftime(date_format)
+        if header == "会員ID":
+            return lambda i: str(100000 + rng.randint(0, 899999))
+        if header == "生まれ年" or (header == "年代" and prefecture == "ishikawa"):
+            return lambda i: str(rng.randint(1940, 2008))
+        if header == "回答時の年齢":
+            return lambda i: str(rng.randint(15, 85))
+        if header == "回答月":
+            return lambda i: self._date(i).strftime("%Y-%m")
+        if header == "目的":
+            return self._multi(PURPOSES)
+        if header == "交通手段１（目的地まで）":
+            return self._multi(TRANSPORTS, 2)
+        if header == "交通手段２（目的地から）":
+            return self._multi(LOCAL_TRANSPORTS, 2)
+        if header == "情報源":
+            return self._multi(DIGITAL_SOURCES + OTHER_SOURCES)
+        if column == "情報源（デジタル）":
+            return self._multi(DIGITAL_SOURCES, 3)
+        if column == "情報源（デジタル以外）":
+            return self._multi(OTHER_SOURCES, 2)
+        if header in SATISFACTION_HEADERS:
+            return self._choice(SATISFACTION[prefecture])
+        if header in AMOUNT_HEADERS:
+            return self._choice(AMOUNTS)
+        if header in FREE_TEXT_HEADERS:
+            return self._free_text
+        if header == "居住都道府県":
+            return self._choice(RESIDENCES)
+        if header == "性別":
+            return self._choice(["男性", "女性", "回答しない"])
+        if header == "年代":
+            return self._choice(AGE_GROUPS)
+        if header == "世帯年収":
+            return self._choice(INCOMES)
+        if header == "同伴者":
+            return self._choice(COMPANIONS)
+        if header.startswith("宿泊数"):
+            return self._choice(NIGHTS)
+        if "宿泊" in header or "エリア" in header or "場所" in header or header.endswith("宿泊先"):
+            return self._choice(AREAS)
+        if header == "おすすめ度" or header == "NPS":
+            return lambda i: str(rng.randint(0, 10))
+        if header == "再訪意向":
+            return self._choice(REVISIT)
+        if "訪問回数" in header or "来県回数" in header:
+            return self._choice(VISIT_COUNTS)
+        if header == "UA(UserAgent)":
+            return self._choice([
+                "Mozilla/5.0 (iPhone; CPU iPhone OS 17_5 like Mac OS X) AppleWebKit/605.1.15",
+                "Mozilla/5.0 (Linux; Android 14) AppleWebKit/537.36 Chrome/126.0 Mobile Safari/537.36",
+            ])
+        return self._choice([f"{header}の選択肢{n}" for n in range(1, 6)] + [""])
+
+    def iter_rows(self) -> Iterator[List[str]]:
+        """データ行を1行ずつ生成（全件をメモリに保持しない）"""
+        generators = self._generators
+        for i in range(self.rows):
+            yield [generate(i) for generate in generators]
+
+    def write(self, path: Path, encoding: str = "utf-8") -> Dict[str, int]:
+        """入力CSVを書き出し、行数とバイト数を返す"""
+        if encoding not in ENCODINGS[self.prefecture]:
+            raise ValueError(f"{self.prefecture} の変換スクリプトは {encoding} に対応していません"
+                             f"（対応: {', '.join(ENCODINGS[self.prefecture])}）")
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding=encoding, newline="") as f:
+            writer = csv.writer(f, lineterminator="\r\n")
+            writer.writerow(self.columns)
+            writer.writerows(self.iter_rows())
+        return {"rows": self.rows, "bytes": path.stat().st_size}
+
+
+def generate_inputs(output_dir: Path, rows: int, prefectures: List[str] = PREFECTURES,
+                    encoding: str = "utf-8", seed: int = 0,
+                    mapping_dir: Path = Path("input")) -> Dict[str, Dict[str, int]]:
+    """
+    output_dir/{県名}/{県名}.csv に合成データを生成し、列マッピングJSONもコピーする
+    （output_dirを変換スクリプトの input/ として使える）
+    """
+    results = {}
+    for prefecture in prefectures:
+        target_dir = Path(output_dir) / prefecture
+        target_dir.mkdir(parents=True, exist_ok=True)
+        mapping_name = f"column_mapping_{prefecture}.json"
+        source_mapping = Path(mapping_dir) / prefecture / mapping_name
+        if source_mapping.resolve() != (target_dir / mapping_name).resolve():
+            (target_dir / mapping_name).write_bytes(source_mapping.read_bytes())
+        generator = SurveyGenerator(prefecture, rows, seed, mapping_dir=mapping_dir)
+        # 指定した文字コードに対応していない県はUTF-8で出力
+        prefecture_encoding = encoding if encoding in ENCODINGS[prefecture] else "utf-8"
+        results[prefecture] = generator.write(target_dir / f"{prefecture}.csv", prefecture_encoding)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="合成アンケートデータ生成プログラム")
+    parser.add_argument("--rows", type=int, default=10000, help="1県あたりの行数（既定: 10000）")
+    parser.add_argument("--output-dir", required=True, metavar="DIR",
+                        help="出力先（{県名}/{県名}.csv を作成。実データを上書きしないよう input/ 以外を指定）")
+    parser.add_argument("--prefectures", nargs="+", choices=PREFECTURES, default=PREFECTURES)
+    parser.add_argument("--encoding", choices=["utf-8", "utf-8-sig", "cp932"], default="utf-8",
+                        help="文字コード（富山県はcp932に対応していないためUTF-8で出力）")
+    parser.add_argument("--seed", type=int, default=0, help="乱数のシード（同じ値なら同じデータを生成）")
+    args = parser.parse_args()
+
+    if Path(args.output_dir).resolve() == Path("input").resolve():
+        parser.error("実データを上書きしないよう input/ 以外を指定してください")
+
+    results = generate_inputs(Path(args.output_dir), args.rows, args.prefectures, args.encoding, args.seed)
+    for prefecture, result in results.items():
+        print(f"{prefecture}: {result['rows']:,} 行, {result['bytes']:,} バイト")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
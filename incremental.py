@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+差分変換モジュール
+県ごとの変換済みレコード数・レコードのフィンガープリント・アンケート回答日の最大値を
+チェックポイントとして保存し、次回の変換では追加されたレコードだけを変換する機能を提供
+
+以下の場合は全件を再変換する
+  - チェックポイントまたは変換後ファイルが存在しない
+  - 列マッピングJSON、変換スクリプト、変換スクリプトが使う共通モジュール（CONVERTER_MODULES）、
+    または検証モード（--validate）が変更された
+  - 変換済みの範囲のレコードが変更・削除された
+  - 変換後ファイルのサイズがチェックポイント保存時と異なる
+"""
+
+import hashlib
+import json
+import re
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from atomic_write import AtomicWriter, file_digest
+from fingerprint import row_fingerprint
+
+CHECKPOINT_DIR = Path(".cache/checkpoints")
+CHECKPOINT_VERSION = 1
+DATE_COLUMN = "アンケート回答日"
+# 変換スクリプトが（間接的に）使う共通モジュール（変換スクリプトと同じディレクトリ）
+CONVERTER_MODULES = ["atomic_write.py", "fingerprint.py", "incremental.py", "instrumentation.py", "profiling.py",
+                     "progress.py", "validation.py", "unmapped.py", "column_stats.py", "date_sort.py", "spill.py"]
+
+
+def code_digest(script_path, validate: str) -> str:
+    """変換スクリプト・共通モジュールの内容と検証モードのハッシュ値"""
+    script_path = Path(script_path)
+    digest = hashlib.blake2b()
+    for path in [script_path] + [script_path.parent / name for name in CONVERTER_MODULES]:
+        digest.update(f"{path.name}\0{file_digest(path) if path.exists() else ''}\0".encode("utf-8"))
+    digest.update(f"validate={validate}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def records_digest(rows: List[Dict[str, str]], count: int) -> str:
+    """先頭count件のレコードのフィンガープリントを連結したハッシュ値を計算"""
+    digest = hashlib.blake2b()
+    for row in rows[:count]:
+        digest.update(row_fingerprint(list(row.values())).encode("ascii"))
+    return digest.hexdigest()
+
+
+class ConversionCheckpoint:
+    """県ごとの変換チェックポイント"""
+
+    def __init__(self, source: str, mapping_json: str, script_path: str, output_csv: str,
+                 validate: str = "count", checkpoint_dir: Path = CHECKPOINT_DIR):
+        self.source = source
+        self.output_csv = Path(output_csv)
+        self.path = Path(checkpoint_dir) / f"{source}.json"
+        self.mapping_hash = file_digest(Path(mapping_json))
+        # 変換スクリプトだけでなく共通モジュール・検証モードが変わった場合も変換結果が変わりうる
+        self.code_hash = code_digest(script_path, validate)
+        self.high_water_mark = ""
+        self._date_index: Optional[int] = None
+
+    def load(self) -> Optional[dict]:
+        """保存済みのチェックポイントを読み込み（存在しない・壊れている場合はNone）"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if state.get("version") != CHECKPOINT_VERSION:
+            return None
+        return state
+
+    def resume_index(self, rows: List[Dict[str, str]]) -> int:
+        """
+        変換を再開するレコードの位置を返す（0の場合は全件を再変換）
+        理由を表示して全件再変換にフォールバックする
+        """
+        state = self.load()
+        reason = None
+        if state is None:
+            reason = "チェックポイントがありません"
+        elif not self.output_csv.exists():
+            reason = f"変換後ファイル {self.output_csv} がありません"
+        elif state["mapping_hash"] != self.mapping_hash:
+            reason = "列マッピングJSONが変更されました"
+        elif state["code_hash"] != self.code_hash:
+            reason = "変換スクリプト・共通モジュールまたは検証モードが変更されました"
+        elif self.output_csv.stat().st_size != state["output_size"]:
+            reason = "変換後ファイルがチェックポイント保存後に変更されました"
+        elif len(rows) < state["record_count"]:
+            reason = "入力レコード数が減少しました"
+        elif state["record_count"] and (
+                row_fingerprint(list(rows[state["record_count"] - 1].values())) != state["last_fingerprint"]
+                or records_digest(rows, state["record_count"]) != state["records_digest"]):
+            reason = "変換済みのレコードが変更されました"
+
+        if reason:
+            print(f"差分変換: {reason}。全件を変換します。")
+            return 0
+
+        self.high_water_mark = state.get("high_water_mark", "")
+        print(f"差分変換: 変換済み {state['record_count']} 件をスキップします"
+              f"（回答日の最大値: {self.high_water_mark or 'なし'}）")
+        return state["record_count"]
+
+    def open_output(self, start_index: int, output_headers: List[str]):
+        """
+        変換後ファイルを開く
+        全件変換の場合はアトミックに書き換え、差分変換の場合は末尾に追記する
+        """
+        self._date_index = output_headers.index(DATE_COLUMN) if DATE_COLUMN in output_headers else None
+        if start_index == 0:
+            self.high_water_mark = ""
+            return AtomicWriter(self.output_csv)
+        return open(self.output_csv, "a", encoding="utf-8", newline="")
+
+    def observe(self, output_row: list):
+        """変換した行のアンケート回答日で最大値（ハイウォーターマーク）を更新"""
+        if self._date_index is None:
+            return
+        value = str(output_row[self._date_index])
+        # yyyy/MM/dd hh:mm:ss 形式に正規化された日付のみ比較対象とする
+        if re.match(r"\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2}$", value) and value > self.high_water_mark:
+            self.high_water_mark = value
+
+    def save(self, rows: List[Dict[str, str]]):
+        """変換が完了した時点のチェックポイントを保存"""
+        count = len(rows)
+        state = {
+            "version": CHECKPOINT_VERSION,
+            "source": self.source,
+            "record_count": count,
+            "last_fingerprint": row_fingerprint(list(rows[count - 1].values())) if count else "",
+            "records_digest": records_digest(rows, count),
+            "high_water_mark": self.high_water_mark,
+            "open_year": int(self.high_water_mark[:4]) if self.high_water_mark else None,
+            "mapping_hash": self.mapping_hash,
+            "code_hash": self.code_hash,
+            "output_size": self.output_csv.stat().st_size,
+            "updated_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with AtomicWriter(self.path) as f:
+            json.dump(state, f, ensure_ascii=False, indent=1)
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+計測モジュール
+処理段階・県ごとの経過時間、CPU時間、入出力行数、読み書きしたバイト数、メモリ使用量を記録し、
+機械可読な実行レポート（run_report.json）として出力する機能を提供
+
+変換スクリプトは別プロセスで実行されるため、環境変数 SURVEY_RUN_REPORT で指定されたファイルに
+子プロセス側の計測結果を書き出し、親プロセスのレポートに取り込む
+profilerを設定した場合は、処理段階ごとにプロファイルも記録する（profiling.py）
+
+メモリ使用量はプロセス全体の値のため、並行に実行中の処理段階（--pipeline）の分も含む
+  - process_peak_rss_bytes: 処理段階の終了時点までのプロセスの最大常駐メモリ（減ることはない）
+  - rss_growth_bytes:       処理段階の間に最大常駐メモリが増えた量（それまでの最大を超えなければ0）
+  - peak_traced_bytes:      処理段階の間のPythonのメモリ確保量のピーク（tracemalloc）
+"""
+
+import atexit
+import json
+import os
+import platform
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from atomic_write import AtomicWriter
+from profiling import StageProfiler
+
+try:
+    import resource
+except ImportError:  # Windowsでは利用できない
+    resource = None
+
+REPORT_VERSION = 2
+CHILD_REPORT_ENV = "SURVEY_RUN_REPORT"
+TRACE_MEMORY_ENV = "SURVEY_TRACE_MEMORY"
+COUNTERS = ("rows_in", "rows_out", "bytes_read", "bytes_written")
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """プロセスの最大常駐メモリ（RSS）をバイト数で返す（取得できない場合はNone）"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOSはバイト単位、Linuxはキロバイト単位
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def file_size(path) -> int:
+    """ファイルサイズ（存在しない場合は0）"""
+    try:
+        return Path(path).stat().st_size
+    except OSError:
+        return 0
+
+
+class RunReport:
+    """実行レポート"""
+
+    def __init__(self, trace_memory: bool = False, child_report_path: Optional[str] = None):
+        self.trace_memory = trace_memory
+        self.child_report_path = child_report_path
+        self.stages: List[dict] = []
+        # 処理段階ごとのプロファイラ（Noneの場合はプロファイルしない）
+        self.profiler: Optional[StageProfiler] = None
+        self.started_at = datetime.now()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # 計測中の処理段階 → 処理段階の間のtracemallocのピーク（リセット前の分）
+        self._traced_peaks: Dict[int, int] = {}
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @classmethod
+    def for_subprocess(cls) -> "RunReport":
+        """
+        変換スクリプト（子プロセス）用のレポート
+        親プロセスから計測を指示された場合のみ、途中で終了した場合も含めて終了時に書き出す
+        """
+        path = os.environ.get(CHILD_REPORT_ENV)
+        trace_memory = os.environ.get(TRACE_MEMORY_ENV) == "1"
+        report = cls(trace_memory=bool(path) and trace_memory, child_report_path=path)
+        report.profiler = StageProfiler.from_env()
+        if path:
+            atexit.register(report.save_child_report)
+        return report
+
+    def _fold_traced_peak(self):
+        """
+        tracemallocのピークを計測中のすべての処理段階に反映してからリセット（self._lockを取得して呼び出す）
+        ピークはプロセス全体で1つのため、リセットで並行・入れ子の処理段階のピークが失われないようにする
+        """
+        peak = tracemalloc.get_traced_memory()[1]
+        for key, value in self._traced_peaks.items():
+            self._traced_peaks[key] = max(value, peak)
+        tracemalloc.reset_peak()
+
+    def _stack(self) -> List[dict]:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def stage(self, name: str, prefecture: Optional[str] = None, profile: bool = True):
+        """
+        処理段階を計測するコンテキストマネージャ（計測値の辞書を返す）
+        profile=Falseの場合はプロファイルしない（子プロセスの完了を待つだけの処理段階など）
+        """
+        record = {"stage": name, "prefecture": prefecture, "status": "ok"}
+        record.update({counter: 0 for counter in COUNTERS})
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        stack.append(record)
+
+        if self.trace_memory:
+            with self._lock:
+                self._fold_traced_peak()
+                self._traced_peaks[id(record)] = 0
+        rss_start = peak_rss_bytes()
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        record["start_offset_seconds"] = round(wall_start - self._start, 4)
+        profiler = self.profiler.profile(name, prefecture) if self.profiler and profile else nullcontext()
+        try:
+            with profiler:
+                yield record
+        except BaseException:
+            record["status"] = "failed"
+            raise
+        finally:
+            record["wall_seconds"] = round(time.perf_counter() - wall_start, 4)
+            # 子プロセスのCPU時間はスレッドのCPU時間に含まれないため加算する
+            record["cpu_seconds"] = round(time.thread_time() - cpu_start + record.get("child_cpu_seconds", 0), 4)
+            rss_end = peak_rss_bytes()
+            record["process_peak_rss_bytes"] = rss_end
+            record["rss_growth_bytes"] = rss_end - rss_start if rss_end is not None else None
+            if self.trace_memory:
+                with self._lock:
+                    record["peak_traced_bytes"] = max(self._traced_peaks.pop(id(record)),
+                                                      tracemalloc.get_traced_memory()[1])
+            stack.pop()
+            with self._lock:
+                if parent is not None:
+                    parent.setdefault("substages", []).append(record)
+                else:
+                    self.stages.append(record)
+
+    def run(self, name: str, prefecture: Optional[str], func: Callable[[], bool], profile: bool = True) -> bool:
+        """関数を処理段階として計測しながら実行し、戻り値がFalseの場合は失敗として記録"""
+        with self.stage(name, prefecture, profile) as record:
+            success = func()
+            if not success:
+                record["status"] = "failed"
+            return success
+
+    def add(self, **counters):
+        """現在のスレッドで計測中の処理段階に行数・バイト数を加算（計測中でなければ何もしない）"""
+        stack = self._stack()
+        if not stack:
+            return
+        record = stack[-1]
+        for key, value in counters.items():
+            if key not in COUNTERS:
+                raise KeyError(f"未知の計測項目です: {key}")
+            record[key] += value
+
+    def attach_child_report(self, path: Path):
+        """子プロセスが書き出した計測結果を、現在計測中の処理段階のサブ段階として取り込む"""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                child = json.load(f)
+        except (OSError, ValueError):
+            return
+        stages = child.get("stages", [])
+        stack = self._stack()
+        if stack:
+            # 子プロセスの行数・バイト数・CPU時間を親の処理段階に合算
+            record = stack[-1]
+            record.setdefault("substages", []).extend(stages)
+            for key in COUNTERS:
+                record[key] += sum(s.get(key) or 0 for s in stages)
+            record["child_cpu_seconds"] = sum(s.get("cpu_seconds") or 0 for s in stages)
+        else:
+            with self._lock:
+                self.stages.extend(stages)
+
+    def to_dict(self, success: Optional[bool] = None, mode: Optional[str] = None) -> dict:
+        def total(records: List[dict], key: str):
+            return sum(r.get(key) or 0 for r in records)
+
+        return {
+            "version": REPORT_VERSION,
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "wall_seconds": round(time.perf_counter() - self._start, 4),
+            "mode": mode,
+            "success": success,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "trace_memory": self.trace_memory,
+            "peak_rss_bytes": peak_rss_bytes(),
+            "totals": {key: total(self.stages, key) for key in ("wall_seconds", "cpu_seconds") + COUNTERS},
+            "stages": self.stages,
+        }
+
+    def write(self, path: Path, success: Optional[bool] = None, mode: Optional[str] = None) -> Path:
+        """レポートをJSONファイルに書き出し"""
+        path = Path(path)
+        with AtomicWriter(path) as f:
+            json.dump(self.to_dict(success, mode), f, ensure_ascii=False, indent=1)
+        return path
+
+    def save_child_report(self):
+        """子プロセスの計測結果を、親プロセスから指定されたファイルに書き出す"""
+        if self.child_report_path:
+            self.write(Path(self.child_report_path))
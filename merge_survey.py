@@ -6,58 +6,234 @@ convert_toyama.py, convert_ishikawa.py, convert_fukui.pyを順に実行し、
 その結果のCSVファイルをマージするプログラム
 """
 
+import argparse
 import csv
+import json
 import os
 import sys
-import subprocess
 import re
 import shutil
+import tempfile
+import time
 from datetime import datetime
 from pathlib import Path
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Optional
 from download_data import DataDownloader
+from columnar_store import ColumnarWriter, infer_column_types
+from sqlite_export import SQLiteExporter
+from change_capture import DEFAULT_STATE_PATH, capture_changes
+from aggregate_cube import AggregateCube
+from bitmap_index import write_index as write_bitmap_index
+from text_index import TextIndex
+from column_stats import PartitionProfile, stats_path
+from compress_output import CODECS, compress_files
+from atomic_write import AtomicWriter
+from artifact_cache import ArtifactCache, DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES
+from pipeline_dag import PipelineScheduler
+from instrumentation import RunReport, CHILD_REPORT_ENV, TRACE_MEMORY_ENV, file_size
+from profiling import MODES as PROFILE_MODES, DEFAULT_INTERVAL as DEFAULT_PROFILE_INTERVAL, StageProfiler
+from progress import Progress, ProgressDisplay, run_subprocess, set_display, write_rows
+from spill import MemoryBudget, RowBuffer
+from date_sort import DATE_COLUMN, merge_sorted, row_key
+from dedup import DuplicateFilter
+from incremental import CONVERTER_MODULES
+from row_index import build_index, read_index
+from validation import DEFAULT_MODE as DEFAULT_VALIDATION_MODE, VALIDATION_MODES
+from unmapped import CATEGORIES as UNMAPPED_CATEGORIES, collect_summaries
+from watch import SourceWatcher, parse_intervals
+
+# 年毎に分割したファイル（およびその圧縮版・行オフセット索引・列統計）のファイル名
+YEAR_PARTITION_PATTERN = re.compile(r'_(\d{4})\.csv(\.(gz|xz|idx|stats\.json))?$')
+
+# 各県の変換スクリプトと入出力ファイル（inputsはキャッシュキーの計算に使う入力）
+CONVERSIONS = [
+    {
+        "name": "toyama",
+        "script": "convert_toyama.py",
+        "inputs": ["input/toyama/toyama.csv", "input/toyama/column_mapping_toyama.json"],
+        "output": "output/toyama/toyama_converted.csv",
+    },
+    {
+        "name": "ishikawa",
+        "script": "convert_ishikawa.py",
+        "inputs": ["input/ishikawa/ishikawa.csv", "input/ishikawa/column_mapping_ishikawa.json"],
+        "output": "output/ishikawa/ishikawa_converted.csv",
+    },
+    {
+        "name": "fukui",
+        "script": "convert_fukui.py",
+        "inputs": ["input/fukui/fukui.csv", "input/fukui/column_mapping_fukui.json"],
+        "output": "output/fukui/fukui_converted.csv",
+    },
+]
+
+# マージ・分割処理のコード（処理コードのバージョンとしてキャッシュキーに含める。
+# 変換処理は変換スクリプトとincremental.CONVERTER_MODULES）
+MERGE_MODULES = ["merge_survey.py", "atomic_write.py", "spill.py", "date_sort.py", "row_index.py",
+                 "dedup.py", "column_stats.py"]
+
+
+def parse_size(value: str) -> int:
+    """「256MB」「1GB」のようなサイズ指定をバイト数に変換"""
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMGT]?)(?:i?B)?\s*', value, re.IGNORECASE)
+    if not match:
+        raise argparse.ArgumentTypeError(f"サイズの指定が正しくありません: {value}")
+    units = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+    return int(float(match.group(1)) * units[match.group(2).upper()])
 
 class SurveyMerger:
-    def __init__(self, input_dir: str = "output", output_dir: str = "output_merge"):
+    def __init__(self, input_dir: str = "output", output_dir: str = "output_merge",
+                 columnar: bool = False, sqlite_path: str = None,
+                 compress: str = None, compress_level: int = None, compress_workers: int = None,
+                 incremental: bool = False, cache: bool = False,
+                 cache_dir: str = None, cache_max_bytes: int = None, trace_memory: bool = False,
+                 profile: str = None, profile_dir: str = None, profile_interval: float = None,
+                 max_memory: int = None, sort_by_date: bool = False, delta_dir: str = None,
+                 dedup: bool = False, cube_path: str = None, bitmap_index_path: str = None,
+                 text_index_path: str = None, column_stats: bool = False,
+                 validate: str = DEFAULT_VALIDATION_MODE, source_urls: Dict[str, str] = None):
         self.input_dir = Path(input_dir)
         self.output_dir = Path(output_dir)
-        self.downloader = DataDownloader()
+        # source_urlsは県名 → ダウンロード元（テスト用のサーバーなどに置き換える場合）
+        self.downloader = DataDownloader(source_urls)
+        self.downloads = {
+            "toyama": self.downloader.download_toyama_data,
+            "ishikawa": self.downloader.download_ishikawa_data,
+            "fukui": self.downloader.download_fukui_data,
+        }
+        # 列指向バイナリストアを出力するか
+        self.columnar = columnar
+        # SQLiteデータベースの出力先（Noneの場合は出力しない）
+        self.sqlite_path = Path(sqlite_path) if sqlite_path else None
+        # 圧縮形式（gzip/xz、Noneの場合は圧縮しない）、圧縮レベル、並列数
+        self.compress = compress
+        self.compress_level = compress_level
+        self.compress_workers = compress_workers
+        # 前回のチェックポイント以降に追加されたレコードだけを変換するか
+        self.incremental = incremental
+        # 変換後の行の検証モード（count/quarantine/fail/off）
+        self.validate = validate
+        # 成果物キャッシュ（Noneの場合は使わない）
+        self.cache = None
+        if cache:
+            self.cache = ArtifactCache(Path(cache_dir) if cache_dir else DEFAULT_CACHE_DIR,
+                                       cache_max_bytes or DEFAULT_MAX_BYTES)
+            # ダウンロードは前回の応答のETag・Last-Modifiedによる条件付きリクエストで、変更がなければ既存の入力を使う
+            self.downloader.validators = self.cache.load_validators()
+        # 処理段階・県ごとの計測（trace_memory=Trueの場合はtracemallocでPythonのメモリ確保量も計測）
+        self.report = RunReport(trace_memory)
+        # 処理段階ごとのプロファイル（cprofile/sample、Noneの場合はプロファイルしない）
+        if profile:
+            self.report.profiler = StageProfiler(
+                profile, Path(profile_dir) if profile_dir else self.output_dir / "profile",
+                "merge_survey", profile_interval or DEFAULT_PROFILE_INTERVAL)
+            self.report.profiler.clear()
+        # マージ・年毎分割で保持する行データのメモリ使用量の上限（Noneの場合は上限なし）
+        self.budget = MemoryBudget(max_memory) if max_memory else None
+        # マージ後のファイル（年毎の分割ファイルを含む）をアンケート回答日の順に出力するか
+        self.sort_by_date = sort_by_date
+        # 前回の実行からの差分ファイルの出力先（Noneの場合は出力しない）
+        self.delta_dir = Path(delta_dir) if delta_dir else None
+        # 正規化した内容が同じ重複回答（2件目以降）をマージ時に除去するか
+        self.dedup = dedup
+        # 集計キューブの出力先（Noneの場合は出力しない）
+        self.cube_path = Path(cube_path) if cube_path else None
+        # ビットマップ索引の出力先（Noneの場合は出力しない）
+        self.bitmap_index_path = Path(bitmap_index_path) if bitmap_index_path else None
+        # 自由記述の全文索引の出力先（Noneの場合は出力しない）
+        self.text_index_path = Path(text_index_path) if text_index_path else None
+        # 年毎の分割ファイルごとの列統計（{ファイル名}.stats.json）を出力するか
+        self.column_stats = column_stats
+        
+    def download_all_data(self) -> bool:
+        """3県のデータを順にダウンロード"""
+        print("=== データダウンロード ===")
+        results = [self.download_prefecture(conversion) for conversion in CONVERSIONS]
+        return all(results)
+    
+    def download_prefecture(self, conversion: dict) -> bool:
+        """1県のデータをダウンロード"""
+        def download() -> bool:
+            url = self.downloader.urls[conversion["name"]]
+            self.downloader.not_modified.discard(url)
+            success = self.downloads[conversion["name"]]()
+            not_modified = url in self.downloader.not_modified
+            if success and not not_modified:
+                self.report.add(bytes_written=file_size(conversion["inputs"][0]))
+            if self.cache and self.downloader.validators is not None:
+                if not success:
+                    # 途中で失敗した場合は次回に全体を取得し直す
+                    self.downloader.validators.pop(url, None)
+                self.cache.record_download(self.downloader.validators, success and not_modified)
+            return success
         
+        return self.report.run("download", conversion["name"], download)
+    
     def run_conversion_scripts(self) -> bool:
         """3つの変換スクリプトを順に実行"""
-        scripts = [
-            "convert_toyama.py",
-            "convert_ishikawa.py", 
-            "convert_fukui.py"
-        ]
-        
         print("=== 変換スクリプトの実行 ===")
         
-        for script in scripts:
-            print(f"\n{script} を実行中...")
-            try:
-                # スクリプトを実行
-                result = subprocess.run([sys.executable, script], 
-                                      capture_output=True, 
-                                      text=True, 
-                                      encoding='utf-8')
-                
-                if result.returncode == 0:
-                    print(f"✓ {script} が正常に完了しました")
-                    if result.stdout:
-                        print(f"  出力: {result.stdout.strip()}")
-                else:
-                    print(f"✗ {script} でエラーが発生しました")
-                    if result.stderr:
-                        print(f"  エラー: {result.stderr.strip()}")
-                    return False
-                    
-            except Exception as e:
-                print(f"✗ {script} の実行に失敗しました: {e}")
+        for conversion in CONVERSIONS:
+            if not self.convert_prefecture(conversion):
                 return False
         
         print("\n✓ すべての変換スクリプトが正常に完了しました")
         return True
+    
+    def convert_prefecture(self, conversion: dict) -> bool:
+        """1県の変換スクリプトを実行（キャッシュが有効な場合は入力が同じなら再利用）"""
+        script = conversion["script"]
+        print(f"\n{script} を実行中...")
+        
+        def convert() -> bool:
+            if self.cache:
+                # 入力データ・列マッピング・変換コードが前回と同じなら変換後ファイルを再利用
+                inputs = [Path(p) for p in conversion["inputs"] + [script] + CONVERTER_MODULES]
+                # 違反した行を退避する場合は変換後ファイルの内容が異なるため別の処理段階としてキャッシュする
+                stage = f"convert:{conversion['name']}" + (":quarantine" if self.validate == "quarantine" else "")
+                return self.cache.run_stage(stage, inputs,
+                                            [conversion["output"]],
+                                            lambda: self.run_conversion_script(script))
+            return self.run_conversion_script(script)
+        
+        # 変換処理は変換スクリプト側でプロファイルする（親プロセスは完了を待つだけのため対象外）
+        return self.report.run("convert", conversion["name"], convert, profile=False)
+    
+    def run_conversion_script(self, script: str) -> bool:
+        """変換スクリプトを1つ実行（スクリプト内の処理段階ごとの計測結果を取り込む）"""
+        fd, child_report = tempfile.mkstemp(prefix="run_report_", suffix=".json")
+        os.close(fd)
+        try:
+            # スクリプトを実行
+            command = [sys.executable, script]
+            if self.incremental:
+                command.append("--incremental")
+            command.extend(["--validate", self.validate])
+            env = dict(os.environ, **{CHILD_REPORT_ENV: child_report,
+                                      TRACE_MEMORY_ENV: "1" if self.report.trace_memory else "0"})
+            if self.report.profiler:
+                # 変換スクリプト内の処理段階も同じ出力先にプロファイルさせる
+                env.update(self.report.profiler.child_env())
+            # 実行中の進捗は変換スクリプトから受け取って表示する
+            result = run_subprocess(command, env, source=script)
+            self.report.attach_child_report(Path(child_report))
+            
+            if result.returncode == 0:
+                print(f"✓ {script} が正常に完了しました")
+                if result.stdout:
+                    print(f"  出力: {result.stdout.strip()}")
+                return True
+            else:
+                print(f"✗ {script} でエラーが発生しました")
+                if result.stderr:
+                    print(f"  エラー: {result.stderr.strip()}")
+                return False
+                
+        except Exception as e:
+            print(f"✗ {script} の実行に失敗しました: {e}")
+            return False
+        finally:
+            os.unlink(child_report)
         
     def check_directories(self) -> bool:
         """ディレクトリの存在確認"""
@@ -72,9 +248,11 @@ class SurveyMerger:
         return True
     
     def find_csv_files(self) -> List[Path]:
-        """outputフォルダ配下のCSVファイルを再帰的に検索"""
+        """outputフォルダ配下のCSVファイルを再帰的に検索（年毎の分割ファイルは除く）"""
         csv_files = []
         for file_path in self.input_dir.rglob("*.csv"):
+            if YEAR_PARTITION_PATTERN.search(file_path.name):
+                continue
             csv_files.append(file_path)
         
         if not csv_files:
@@ -87,14 +265,25 @@ class SurveyMerger:
         
         return csv_files
     
+    def new_row_buffer(self):
+        """行データの格納先（メモリ上限を指定した場合は上限を超えると一時ファイルに退避するRowBuffer）"""
+        return self.budget.buffer() if self.budget else []
+    
+    def release_rows(self, rows) -> None:
+        """使い終わった行データの一時ファイルを削除"""
+        if isinstance(rows, RowBuffer):
+            rows.close()
+    
     def read_csv_data(self, file_path: Path) -> Tuple[List[str], List[List[str]]]:
         """CSVファイルのヘッダーとデータを読み込み（BOM対応）"""
         try:
             with open(file_path, 'r', encoding='utf-8-sig') as f:
                 reader = csv.reader(f)
                 headers = next(reader)
-                data = list(reader)
-                return headers, data
+                data = self.new_row_buffer()
+                data.extend(reader)
+            self.report.add(bytes_read=file_size(file_path))
+            return headers, data
         except Exception as e:
             print(f"エラー: ファイル '{file_path}' の読み込みに失敗しました: {e}")
             return [], []
@@ -104,26 +293,135 @@ class SurveyMerger:
         if not csv_files:
             return False
         
+        merged = self.merge_stage(csv_files)
+        if merged is None:
+            return False
+        
+        # 各変換後のCSVファイルも年毎に分割
+        self.split_converted_csv_files()
+        
+        return self.export_outputs(merged)
+    
+    def merge_stage(self, csv_files: List[Path],
+                    loaded: Dict[Path, Tuple[List[str], List[List[str]]]] = None) -> Optional[dict]:
+        """
+        CSVファイルをマージして年ごとに分割
+        loadedには読み込み済みのファイルのヘッダーとデータを渡せる
+        マージ後のヘッダーとデータ（キャッシュから復元した場合は空）を返し、失敗した場合はNone
+        """
+        merged = {}
+        
+        def merge_and_split() -> bool:
+            base_headers, merged_data = self.collect_merged_data(csv_files, loaded)
+            if not base_headers:
+                return False
+            merged["headers"], merged["data"] = base_headers, merged_data
+            return self.write_merged_outputs(base_headers, merged_data)
+        
+        def merge_stage_action() -> bool:
+            if self.cache:
+                # 変換後ファイルとマージ処理のコードが前回と同じならマージ結果を再利用
+                inputs = sorted(csv_files) + [Path(p) for p in MERGE_MODULES]
+                output_globs = [f"{self.output_dir.as_posix()}/merged_survey.csv",
+                                f"{self.output_dir.as_posix()}/merged_survey_*.csv",
+                                f"{self.output_dir.as_posix()}/merged_survey_*.csv.idx",
+                                f"{self.output_dir.as_posix()}/merged_survey_*.csv.stats.json"]
+                # 日付順に出力する場合・重複を除去する場合・列統計を出力する場合は出力内容が異なるため
+                # 別の処理段階としてキャッシュする
+                stage = "merge" + (":sorted" if self.sort_by_date else "") + (":dedup" if self.dedup else "") \
+                    + (":stats" if self.column_stats else "")
+                return self.cache.run_stage(stage, inputs, output_globs, merge_and_split)
+            return merge_and_split()
+        
+        success = self.report.run("merge", None, merge_stage_action)
+        return merged if success else None
+    
+    def export_outputs(self, merged: dict) -> bool:
+        """マージ後のデータから追加の出力（列指向ストア・SQLite・集計キューブ・索引・差分ファイル・圧縮ファイル）を作成"""
+        # 圧縮ファイル以外の出力にはマージ後のデータが必要
+        # （キャッシュからマージ結果を復元した場合はマージ後のファイルから読み込む）
+        needs_data = (self.columnar, self.sqlite_path, self.cube_path, self.bitmap_index_path,
+                      self.text_index_path, self.delta_dir)
+        if any(needs_data) and "data" not in merged:
+            merged["headers"], merged["data"] = self.read_csv_data(self.output_dir / "merged_survey.csv")
+        
+        # 列指向バイナリストアを出力
+        if self.columnar:
+            self.report.run("columnar", None, lambda: self.export_columnar(merged["headers"], merged["data"]))
+        
+        # SQLiteデータベースを差分更新
+        if self.sqlite_path:
+            self.report.run("sqlite", None, lambda: self.export_sqlite(merged["headers"], merged["data"]))
+        
+        # 集計キューブを差分更新
+        if self.cube_path:
+            self.report.run("cube", None, lambda: self.export_cube(merged["headers"], merged["data"]))
+        
+        # フラグ列・選択肢の列のビットマップ索引を作成
+        if self.bitmap_index_path:
+            self.report.run("bitmap_index", None,
+                            lambda: self.export_bitmap_index(merged["headers"], merged["data"]))
+        
+        # 自由記述の全文索引を差分更新
+        if self.text_index_path:
+            self.report.run("text_index", None, lambda: self.export_text_index(merged["headers"], merged["data"]))
+        
+        # 前回の実行からの追加・削除・変更行を差分ファイルに出力
+        if self.delta_dir:
+            self.report.run("delta", None, lambda: self.export_delta(merged["headers"], merged["data"]))
+        
+        # 出力ファイルの圧縮版を作成
+        if self.compress:
+            self.report.run("compress", None, self.compress_outputs)
+        
+        return True
+    
+    def collect_merged_data(self, csv_files: List[Path],
+                            loaded: Dict[Path, Tuple[List[str], List[List[str]]]] = None
+                            ) -> Tuple[List[str], List[List[str]]]:
+        """CSVファイルを読み込んでヘッダーとマージしたデータを返す（loadedにあるファイルは読み込まない）"""
+        loaded = loaded or {}
+        
         # 最初のファイルのヘッダーを基準とする
         first_file = csv_files[0]
-        base_headers, base_data = self.read_csv_data(first_file)
+        base_headers, base_data = loaded.get(first_file) or self.read_csv_data(first_file)
         
         if not base_headers:
             print(f"エラー: 最初のファイル '{first_file}' の読み込みに失敗しました。")
-            return False
+            return [], []
         
         print(f"基準ヘッダー: {base_headers}")
         
         # マージされたデータを格納
-        merged_data = []
+        merged_data = self.new_row_buffer()
+        
+        # 日付順に出力する場合は、すべてのファイルを読み込んでから日付順に結合する
+        sort_key = None
+        if self.sort_by_date:
+            if DATE_COLUMN in base_headers:
+                sort_key = row_key(base_headers.index(DATE_COLUMN))
+            else:
+                print(f"警告: '{DATE_COLUMN}' カラムが見つかりません。日付順に並べ替えずにマージします。")
+        sources = []
+        # 重複を除去する場合は、県ごとのデータを走査して重複の候補を記録し、マージしながら除去する
+        duplicates = DuplicateFilter(base_headers) if self.dedup else None
+        deduplicate = duplicates.filter if duplicates else iter
         
-        # 最初のファイルのデータを追加
-        merged_data.extend(base_data)
-        print(f"'{first_file.name}' から {len(base_data)} 行を追加")
+        # 最初のファイルのデータを追加（解放すると行数が0になるため先に数える）
+        rows = len(base_data)
+        if duplicates:
+            duplicates.scan(base_data)
+        if sort_key:
+            sources.append(base_data)
+        else:
+            merged_data.extend(deduplicate(base_data))
+            self.release_rows(base_data)
+        self.report.add(rows_in=rows)
+        print(f"'{first_file.name}' から {rows} 行を追加")
         
         # 残りのファイルのデータを追加
         for file_path in csv_files[1:]:
-            headers, data = self.read_csv_data(file_path)
+            headers, data = loaded.get(file_path) or self.read_csv_data(file_path)
             
             if not headers:
                 print(f"警告: ファイル '{file_path}' の読み込みに失敗しました。スキップします。")
@@ -137,25 +435,48 @@ class SurveyMerger:
                 print("  スキップします。")
                 continue
             
-            merged_data.extend(data)
-            print(f"'{file_path.name}' から {len(data)} 行を追加")
+            rows = len(data)
+            if duplicates:
+                duplicates.scan(data)
+            if sort_key:
+                sources.append(data)
+            else:
+                merged_data.extend(deduplicate(data))
+                self.release_rows(data)
+            self.report.add(rows_in=rows)
+            print(f"'{file_path.name}' から {rows} 行を追加")
+        
+        if sort_key:
+            # 日付順に並んだファイルはそのまま、並んでいないファイルはソートしたランに分けてk-wayマージ
+            merged_data.extend(deduplicate(merge_sorted(sources, sort_key, self.budget)))
+            for data in sources:
+                self.release_rows(data)
+            print("アンケート回答日の順に並べ替えました")
         
-        # マージされたデータをCSVファイルに出力
+        if duplicates:
+            for line in duplicates.summary():
+                print(line)
+        
+        return base_headers, merged_data
+    
+    def write_merged_outputs(self, base_headers: List[str], merged_data: List[List[str]]) -> bool:
+        """マージしたデータをCSVファイルに出力し、年ごとに分割"""
         output_file = self.output_dir / "merged_survey.csv"
         try:
-            with open(output_file, 'w', newline='', encoding='utf-8') as f:
+            atomic = AtomicWriter(output_file)
+            with atomic as f:
                 writer = csv.writer(f)
                 writer.writerow(base_headers)  # ヘッダー行を書き込み
-                writer.writerows(merged_data)  # データ行を書き込み
+                with Progress("マージ", len(merged_data)) as progress:
+                    write_rows(writer, merged_data, progress)  # データ行を書き込み
             
-            print(f"マージ完了: '{output_file}' に {len(merged_data)} 件の回答を保存しました。")
+            self.report.add(rows_out=len(merged_data), bytes_written=file_size(output_file))
+            status = "" if atomic.changed else "（変更なし）"
+            print(f"マージ完了: '{output_file}' に {len(merged_data)} 件の回答を保存しました。{status}")
             
             # 年ごとにファイルを分割
             self.split_by_year(output_file, base_headers, merged_data)
             
-            # 各変換後のCSVファイルも年毎に分割
-            self.split_converted_csv_files()
-            
             return True
             
         except Exception as e:
@@ -190,8 +511,12 @@ class SurveyMerger:
             
             # 年ごとにデータを分類
             year_data: Dict[int, List[List[str]]] = {}
+            # 列統計は振り分けと同じ走査で計算する
+            year_stats: Dict[int, PartitionProfile] = {}
             
+            progress = Progress("年毎分割 merged_survey", len(data))
             for row in data:
+                progress.update()
                 if len(row) <= date_column_index:
                     continue
                 
@@ -203,9 +528,14 @@ class SurveyMerger:
                     continue
                 
                 if year not in year_data:
-                    year_data[year] = []
+                    year_data[year] = self.new_row_buffer()
+                    if self.column_stats:
+                        year_stats[year] = PartitionProfile(headers)
                 
                 year_data[year].append(row)
+                if self.column_stats:
+                    year_stats[year].add(row)
+            progress.close()
             
             # 年ごとにファイルを出力
             print(f"\n=== 年ごとのファイル分割 ===")
@@ -213,13 +543,25 @@ class SurveyMerger:
                 output_file = self.output_dir / f"merged_survey_{year}.csv"
                 year_rows = year_data[year]
                 
-                with open(output_file, 'w', newline='', encoding='utf-8') as f:
+                atomic = AtomicWriter(output_file)
+                with atomic as f:
                     writer = csv.writer(f)
                     writer.writerow(headers)  # ヘッダー行を書き込み
                     writer.writerows(year_rows)  # データ行を書き込み
                 
-                print(f"  {year}年: {output_file} に {len(year_rows)} 件の回答を保存しました。")
+                self.report.add(bytes_written=file_size(output_file))
+                self.write_row_index(output_file, atomic)
+                if self.column_stats:
+                    if year_stats.pop(year).write(output_file):
+                        self.report.add(bytes_written=file_size(stats_path(output_file)))
+                elif atomic.changed:
+                    # 列統計を出力しない場合、内容が変わったファイルの古い列統計は削除する
+                    stats_path(output_file).unlink(missing_ok=True)
+                status = "" if atomic.changed else "（変更なし、書き込みをスキップ）"
+                print(f"  {year}年: {output_file} に {len(year_rows)} 件の回答を保存しました。{status}")
+                self.release_rows(year_rows)
             
+            self.remove_stale_year_files(self.output_dir, "merged_survey", year_data.keys())
             return True
             
         except Exception as e:
@@ -228,6 +570,180 @@ class SurveyMerger:
             traceback.print_exc()
             return False
     
+    def export_columnar(self, headers: List[str], data: List[List[str]]) -> bool:
+        """マージ後のデータを年毎のパーティションとして列指向バイナリストアに出力"""
+        try:
+            date_column_index = headers.index("アンケート回答日")
+        except ValueError:
+            print("警告: 'アンケート回答日' カラムが見つかりません。列指向ストアの出力をスキップします。")
+            return False
+        
+        print(f"\n=== 列指向バイナリストアの出力 ===")
+        try:
+            year_data: Dict[int, List[List[str]]] = {}
+            for row in data:
+                if len(row) <= date_column_index:
+                    continue
+                year = self.extract_year_from_date(row[date_column_index])
+                if year is None:
+                    continue
+                year_data.setdefault(year, []).append(row)
+            
+            store_dir = self.output_dir / "columnar"
+            if store_dir.exists():
+                shutil.rmtree(store_dir)
+            
+            # パーティション間で列の保存形式を揃える
+            column_types = infer_column_types(headers, year_data.values())
+            writer = ColumnarWriter(store_dir)
+            for year in sorted(year_data.keys()):
+                writer.write_partition(str(year), headers, year_data[year], column_types)
+                print(f"  {year}年: {len(year_data[year])} 行")
+            writer.close()
+            self.report.add(rows_in=len(data), rows_out=sum(len(rows) for rows in year_data.values()),
+                            bytes_written=writer.bytes_written)
+            
+            counts = {t: column_types.count(t) for t in ("flag", "score", "dict")}
+            print(f"  列の保存形式: フラグ {counts['flag']}列, スコア {counts['score']}列, 辞書 {counts['dict']}列")
+            print(f"  列指向ストアを '{store_dir}' に保存しました（{writer.bytes_written:,} バイト）")
+            return True
+            
+        except Exception as e:
+            print(f"エラー: 列指向ストアの出力に失敗しました: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+    
+    def export_sqlite(self, headers: List[str], data: List[List[str]]) -> bool:
+        """マージ後のデータをSQLiteデータベースに差分更新で出力"""
+        print(f"\n=== SQLiteデータベースの出力 ===")
+        try:
+            result = SQLiteExporter(self.sqlite_path).export(headers, data)
+            self.report.add(rows_in=len(data), rows_out=result['inserted'],
+                            bytes_written=file_size(self.sqlite_path))
+            print(f"  '{self.sqlite_path}': 新規 {result['inserted']} 行, 削除 {result['deleted']} 行, "
+                  f"合計 {result['rows']} 行 ({result['seconds']:.2f}秒)")
+            return True
+        except Exception as e:
+            print(f"エラー: SQLiteデータベースの出力に失敗しました: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+    
+    def export_cube(self, headers: List[str], data: List[List[str]]) -> bool:
+        """満足度・フラグ列の集計キューブを、前回から追加された行だけで更新"""
+        print(f"\n=== 集計キューブの出力 ===")
+        try:
+            start = time.perf_counter()
+            cube = AggregateCube.load(self.cube_path) or AggregateCube()
+            result = cube.update(headers, data)
+            changed = cube.save(self.cube_path)
+            self.report.add(rows_in=result['rows'], rows_out=result['added'],
+                            bytes_written=file_size(self.cube_path) if changed else 0)
+            rebuilt = f"（作り直した県: {', '.join(result['rebuilt'])}）" if result['rebuilt'] else ""
+            print(f"  '{self.cube_path}': 集計した行 {result['added']} 行{rebuilt}, 合計 {result['rows']} 行, "
+                  f"セル {result['cells']} 件 ({time.perf_counter() - start:.2f}秒)")
+            return True
+        except Exception as e:
+            print(f"エラー: 集計キューブの出力に失敗しました: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+    
+    def export_bitmap_index(self, headers: List[str], data: List[List[str]]) -> bool:
+        """値の種類が少ない列（フラグ列・選択肢の列）の値ごとのビットマップ索引を作成"""
+        print(f"\n=== ビットマップ索引の出力 ===")
+        try:
+            start = time.perf_counter()
+            result = write_bitmap_index(self.bitmap_index_path, headers, data,
+                                        self.output_dir / "merged_survey.csv")
+            self.report.add(rows_in=result['rows'], bytes_written=file_size(self.bitmap_index_path))
+            status = "" if result['changed'] else "（変更なし）"
+            print(f"  '{self.bitmap_index_path}': {result['columns']} 列, ビットマップ {result['bitmaps']} 件, "
+                  f"{file_size(self.bitmap_index_path):,} バイト ({time.perf_counter() - start:.2f}秒){status}")
+            return True
+        except Exception as e:
+            print(f"エラー: ビットマップ索引の出力に失敗しました: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+    
+    def export_text_index(self, headers: List[str], data: List[List[str]]) -> bool:
+        """自由記述（自由意見）の文字n-gramの全文索引を、前回から追加された行だけで更新"""
+        print(f"\n=== 全文索引の出力 ===")
+        try:
+            start = time.perf_counter()
+            index = TextIndex.load(self.text_index_path) or TextIndex()
+            result = index.update(headers, data, self.output_dir / "merged_survey.csv")
+            changed = index.save(self.text_index_path)
+            self.report.add(rows_in=result['rows'], rows_out=result['added'],
+                            bytes_written=file_size(self.text_index_path) if changed else 0)
+            rebuilt = "（索引済みの行が変わったため作り直し）" if result['rebuilt'] else ""
+            print(f"  '{self.text_index_path}': 追加 {result['added']} 件{rebuilt}, 合計 {result['documents']} 件, "
+                  f"n-gram {result['grams']} 種類 ({time.perf_counter() - start:.2f}秒)")
+            return True
+        except Exception as e:
+            print(f"エラー: 全文索引の出力に失敗しました: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+    
+    def export_delta(self, headers: List[str], data: List[List[str]]) -> bool:
+        """前回の実行時の行のフィンガープリントと比較し、追加・削除・変更された行を差分ファイルに出力"""
+        print(f"\n=== 差分ファイルの出力 ===")
+        try:
+            result = capture_changes(headers, data, DEFAULT_STATE_PATH, self.delta_dir)
+            self.report.add(rows_in=result['rows'],
+                            rows_out=result['added'] + result['changed'] + result['removed'],
+                            bytes_written=file_size(result['path']) if result['path'] else 0)
+            if result['baseline']:
+                print(f"  前回の状態がないため、{result['rows']} 行の状態を保存しました（次回の実行から差分を出力）")
+                return True
+            print(f"  追加 {result['added']} 行, 変更 {result['changed']} 行, 削除 {result['removed']} 行")
+            if result['path']:
+                print(f"  '{result['path']}' に出力しました")
+            if result['schema_changed']:
+                print("  警告: 前回の実行からヘッダーが変わったため、すべての行が変更として出力されています。")
+            elif result['changed'] or result['removed']:
+                print("  警告: 前回までの行が変更・削除されています。元データの過去分が書き換えられた可能性があります。")
+            return True
+        except Exception as e:
+            print(f"エラー: 差分ファイルの出力に失敗しました: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+    
+    def compress_outputs(self) -> bool:
+        """マージ後・変換後のCSVファイルを並列に圧縮"""
+        sources = sorted(self.output_dir.glob("merged_survey*.csv"))
+        sources += sorted(self.input_dir.rglob("*_converted*.csv"))
+        
+        print(f"\n=== 出力ファイルの圧縮（{self.compress}） ===")
+        try:
+            start = time.perf_counter()
+            results = compress_files(sources, self.compress, self.compress_level, self.compress_workers)
+            elapsed = time.perf_counter() - start
+            
+            total_original = 0
+            total_compressed = 0
+            for result in results:
+                total_original += result['original_size']
+                total_compressed += result['compressed_size']
+                print(f"  {result['target']}: {result['original_size']:,} → {result['compressed_size']:,} バイト "
+                      f"(圧縮率 {result['ratio']:.1%}, {result['seconds']:.2f}秒)"
+                      f"{'' if result['changed'] else ' 変更なし'}")
+            self.report.add(bytes_read=total_original, bytes_written=total_compressed)
+            if total_original:
+                print(f"  合計: {total_original:,} → {total_compressed:,} バイト "
+                      f"(圧縮率 {total_compressed / total_original:.1%}, 経過時間 {elapsed:.2f}秒)")
+            return True
+            
+        except Exception as e:
+            print(f"エラー: 出力ファイルの圧縮に失敗しました: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+    
     def split_converted_csv_files(self):
         """各変換後のCSVファイルを年毎に分割"""
         converted_files = [
@@ -243,71 +759,130 @@ class SurveyMerger:
                 print(f"  スキップ: {csv_file} が見つかりません")
                 continue
             
-            try:
-                # CSVファイルを読み込み
-                headers, data = self.read_csv_data(csv_file)
-                
-                if not headers:
-                    print(f"  警告: {csv_file} の読み込みに失敗しました")
+            self.split_converted_stage(csv_file)
+    
+    def split_converted_stage(self, csv_file: Path) -> bool:
+        """変換後のCSVファイルを年毎に分割（キャッシュが有効な場合は入力が同じなら再利用）"""
+        def split() -> bool:
+            if self.cache:
+                # 変換後ファイルが前回と同じなら年毎の分割ファイルを再利用
+                inputs = [csv_file] + [Path(p) for p in MERGE_MODULES]
+                output_globs = [f"{csv_file.parent.as_posix()}/{csv_file.stem}_*.csv",
+                                f"{csv_file.parent.as_posix()}/{csv_file.stem}_*.csv.idx"]
+                return self.cache.run_stage(f"split:{csv_file.stem}", inputs, output_globs,
+                                            lambda: self.split_converted_csv_file(csv_file))
+            return self.split_converted_csv_file(csv_file)
+        
+        return self.report.run("split", csv_file.parent.name, split)
+    
+    def split_converted_csv_file(self, csv_file: Path) -> bool:
+        """変換後のCSVファイルを1つ年毎に分割"""
+        try:
+            # CSVファイルを読み込み
+            headers, data = self.read_csv_data(csv_file)
+            
+            if not headers:
+                print(f"  警告: {csv_file} の読み込みに失敗しました")
+                return False
+            self.report.add(rows_in=len(data))
+            
+            # 年毎に分割
+            output_dir = csv_file.parent
+            base_name = csv_file.stem  # ファイル名から拡張子を除く
+            
+            # アンケート回答日のカラムインデックスを取得
+            date_column_index = None
+            for i, header in enumerate(headers):
+                if header == "アンケート回答日":
+                    date_column_index = i
+                    break
+            
+            if date_column_index is None:
+                print(f"  警告: {csv_file} に'アンケート回答日'カラムが見つかりません。スキップします。")
+                return False
+            
+            # 年ごとにデータを分類
+            year_data: Dict[int, List[List[str]]] = {}
+            
+            progress = Progress(f"年毎分割 {base_name}", len(data))
+            for row in data:
+                progress.update()
+                if len(row) <= date_column_index:
                     continue
                 
-                # 年毎に分割
-                output_dir = csv_file.parent
-                base_name = csv_file.stem  # ファイル名から拡張子を除く
-                
-                # アンケート回答日のカラムインデックスを取得
-                date_column_index = None
-                for i, header in enumerate(headers):
-                    if header == "アンケート回答日":
-                        date_column_index = i
-                        break
+                date_str = row[date_column_index]
+                year = self.extract_year_from_date(date_str)
                 
-                if date_column_index is None:
-                    print(f"  警告: {csv_file} に'アンケート回答日'カラムが見つかりません。スキップします。")
+                if year is None:
+                    # 日付が解析できない場合はスキップ（警告は出さない）
                     continue
                 
-                # 年ごとにデータを分類
-                year_data: Dict[int, List[List[str]]] = {}
+                if year not in year_data:
+                    year_data[year] = self.new_row_buffer()
                 
-                for row in data:
-                    if len(row) <= date_column_index:
-                        continue
-                    
-                    date_str = row[date_column_index]
-                    year = self.extract_year_from_date(date_str)
-                    
-                    if year is None:
-                        # 日付が解析できない場合はスキップ（警告は出さない）
-                        continue
+                year_data[year].append(row)
+            progress.close()
+            self.release_rows(data)
+            
+            # 年ごとにファイルを出力
+            if year_data:
+                for year in sorted(year_data.keys()):
+                    output_file = output_dir / f"{base_name}_{year}.csv"
+                    year_rows = year_data[year]
                     
-                    if year not in year_data:
-                        year_data[year] = []
+                    atomic = AtomicWriter(output_file)
+                    with atomic as f:
+                        writer = csv.writer(f)
+                        writer.writerow(headers)  # ヘッダー行を書き込み
+                        writer.writerows(year_rows)  # データ行を書き込み
                     
-                    year_data[year].append(row)
+                    self.report.add(rows_out=len(year_rows), bytes_written=file_size(output_file))
+                    self.write_row_index(output_file, atomic)
+                    status = "" if atomic.changed else " 変更なし"
+                    print(f"  {csv_file.name} → {output_file.name}: {len(year_rows)}件 ({year}年){status}")
+                    self.release_rows(year_rows)
                 
-                # 年ごとにファイルを出力
-                if year_data:
-                    for year in sorted(year_data.keys()):
-                        output_file = output_dir / f"{base_name}_{year}.csv"
-                        year_rows = year_data[year]
-                        
-                        with open(output_file, 'w', newline='', encoding='utf-8') as f:
-                            writer = csv.writer(f)
-                            writer.writerow(headers)  # ヘッダー行を書き込み
-                            writer.writerows(year_rows)  # データ行を書き込み
-                        
-                        print(f"  {csv_file.name} → {output_file.name}: {len(year_rows)}件 ({year}年)")
-                else:
-                    print(f"  警告: {csv_file} に有効なデータが見つかりませんでした")
-                    
-            except Exception as e:
-                print(f"  エラー: {csv_file} の分割に失敗しました: {e}")
-                import traceback
-                traceback.print_exc()
+                self.remove_stale_year_files(output_dir, base_name, year_data.keys())
+                return True
+            else:
+                print(f"  警告: {csv_file} に有効なデータが見つかりませんでした")
+                return False
+                
+        except Exception as e:
+            print(f"  エラー: {csv_file} の分割に失敗しました: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+    
+    def write_row_index(self, csv_file: Path, atomic: AtomicWriter) -> None:
+        """
+        年毎の分割ファイルの行オフセット索引を作成（ファイルが変わっていなければ既存の索引を使う）
+        ファイルの内容のハッシュ値は書き込み時に計算したものを使う
+        """
+        if not atomic.changed and read_index(csv_file) is not None:
+            return
+        path = build_index(csv_file, digest=atomic.digest)
+        self.report.add(bytes_written=file_size(path))
+    
+    def remove_stale_year_files(self, directory: Path, base_name: str, years) -> None:
+        """今回のデータに存在しない年の分割ファイル（およびその圧縮版）を削除"""
+        current_years = {str(year) for year in years}
+        for file_path in directory.glob(f"{base_name}_*.csv*"):
+            match = YEAR_PARTITION_PATTERN.search(file_path.name)
+            if not match or file_path.name[:match.start()] != base_name:
                 continue
+            if match.group(1) not in current_years:
+                try:
+                    file_path.unlink()
+                    print(f"  削除: {file_path}（該当する年のデータがなくなりました）")
+                except Exception as e:
+                    print(f"  警告: {file_path} の削除に失敗しました: {e}")
     
     def cleanup_output_directories(self):
-        """変換前の出力ディレクトリをクリーンアップ"""
+        """
+        変換前の出力ディレクトリをクリーンアップ
+        年毎の分割ファイルは内容が変わった場合だけ書き換えるため削除しない
+        """
         output_dirs = [
             Path("output/fukui"),
             Path("output/ishikawa"),
@@ -317,39 +892,47 @@ class SurveyMerger:
         print("=== 出力ディレクトリのクリーンアップ ===")
         
         for output_dir in output_dirs:
-            if output_dir.exists():
-                # ディレクトリ内のすべてのファイルを削除
-                files_deleted = 0
-                for file_path in output_dir.iterdir():
-                    if file_path.is_file():
-                        try:
-                            file_path.unlink()
-                            files_deleted += 1
-                        except Exception as e:
-                            print(f"  警告: {file_path} の削除に失敗しました: {e}")
-                
-                if files_deleted > 0:
-                    print(f"  {output_dir}: {files_deleted}件のファイルを削除しました")
-                else:
-                    print(f"  {output_dir}: 削除するファイルはありませんでした")
-            else:
-                print(f"  {output_dir}: ディレクトリが存在しないためスキップ")
+            self.report.run("cleanup", output_dir.name, lambda d=output_dir: self.cleanup_output_directory(d))
         
         print()
     
+    def cleanup_output_directory(self, output_dir: Path) -> bool:
+        """1県の出力ディレクトリから年毎の分割ファイル以外のファイルを削除"""
+        if output_dir.exists():
+            files_deleted = 0
+            for file_path in output_dir.iterdir():
+                if file_path.is_file() and not YEAR_PARTITION_PATTERN.search(file_path.name):
+                    try:
+                        file_path.unlink()
+                        files_deleted += 1
+                    except Exception as e:
+                        print(f"  警告: {file_path} の削除に失敗しました: {e}")
+            
+            if files_deleted > 0:
+                print(f"  {output_dir}: {files_deleted}件のファイルを削除しました")
+            else:
+                print(f"  {output_dir}: 削除するファイルはありませんでした")
+        else:
+            print(f"  {output_dir}: ディレクトリが存在しないためスキップ")
+        return True
+    
     def run(self):
         """メイン処理"""
         print("=== アンケートCSVマージプログラム ===")
         print()
         
         # 1. データのダウンロード
-        if not self.downloader.download_all_data():
+        if not self.download_all_data():
             print("警告: データのダウンロードに失敗しましたが、処理を続行します。")
         
         print()
         
         # 2. 出力ディレクトリのクリーンアップ（古いファイルを削除）
-        self.cleanup_output_directories()
+        # 差分変換では前回の変換後ファイルに追記するため削除しない
+        if self.incremental:
+            print("=== 差分変換モード: 出力ディレクトリのクリーンアップをスキップ ===\n")
+        else:
+            self.cleanup_output_directories()
         
         # 3. 変換スクリプトの実行
         if not self.run_conversion_scripts():
@@ -368,12 +951,245 @@ class SurveyMerger:
         
         # 6. マージ実行
         success = self.merge_csv_files(csv_files)
+        
+        if self.cache:
+            print(f"\n=== 成果物キャッシュ ===")
+            print(f"  {self.cache.summary()}")
+        if self.budget:
+            print(f"\n=== メモリ上限 ===")
+            print(f"  {self.budget.summary()}")
         return success
 
+    def run_pipeline(self, max_workers: int = None) -> bool:
+        """
+        メイン処理（パイプライン実行）
+        県ごとに ダウンロード → クリーンアップ → 変換 → 読み込み/年毎分割 を依存関係に沿って並行に実行し、
+        3県の変換後データが揃った時点でマージする
+        """
+        print("=== アンケートCSVマージプログラム（パイプライン実行） ===")
+        print()
+        
+        if not self.check_directories():
+            return False
+        
+        csv_files = [Path(conversion["output"]) for conversion in CONVERSIONS]
+        # 変換が完了した県から順に読み込んだ変換後データ（マージで再利用する）
+        loaded: Dict[Path, Tuple[List[str], List[List[str]]]] = {}
+        state = {}
+        
+        def load_converted(csv_file: Path) -> bool:
+            headers, data = self.read_csv_data(csv_file)
+            if not headers:
+                return False
+            self.report.add(rows_in=len(data), rows_out=len(data))
+            loaded[csv_file] = (headers, data)
+            return True
+        
+        def merge() -> bool:
+            print("\n=== CSVファイルのマージ ===")
+            state["merged"] = self.merge_stage(csv_files, loaded)
+            return state["merged"] is not None
+        
+        scheduler = PipelineScheduler(max_workers)
+        for conversion, csv_file in zip(CONVERSIONS, csv_files):
+            name = conversion["name"]
+            # ダウンロードに失敗しても既存の入力データで処理を続行する
+            scheduler.add(f"download:{name}", lambda c=conversion: self.download_prefecture(c),
+                          allow_failure=True)
+            convert_deps = [f"download:{name}"]
+            # 差分変換では前回の変換後ファイルに追記するため削除しない
+            if not self.incremental:
+                scheduler.add(f"cleanup:{name}",
+                              lambda d=csv_file.parent: self.report.run("cleanup", d.name,
+                                                                        lambda: self.cleanup_output_directory(d)))
+                convert_deps.append(f"cleanup:{name}")
+            scheduler.add(f"convert:{name}", lambda c=conversion: self.convert_prefecture(c), convert_deps)
+            scheduler.add(f"load:{name}",
+                          lambda f=csv_file, n=name: self.report.run("load", n, lambda: load_converted(f)),
+                          [f"convert:{name}"])
+            scheduler.add(f"split:{name}", lambda f=csv_file: self.split_converted_stage(f), [f"convert:{name}"])
+        
+        scheduler.add("merge", merge, [f"load:{c['name']}" for c in CONVERSIONS])
+        scheduler.add("export", lambda: self.export_outputs(state["merged"]),
+                      ["merge"] + [f"split:{c['name']}" for c in CONVERSIONS])
+        
+        success = scheduler.run()
+        scheduler.print_report()
+        
+        if self.cache:
+            print(f"\n=== 成果物キャッシュ ===")
+            print(f"  {self.cache.summary()}")
+        if self.budget:
+            print(f"\n=== メモリ上限 ===")
+            print(f"  {self.budget.summary()}")
+        return success
+    
+    def write_run_report(self, success: bool, mode: str) -> Path:
+        """処理段階・県ごとの計測結果を output_merge/run_report.json に出力"""
+        path = self.report.write(self.output_dir / "run_report.json", success, mode)
+        print(f"\n実行レポート: '{path}' に処理段階ごとの計測結果を保存しました")
+        return path
+    
+    def write_unmapped_report(self) -> Optional[Path]:
+        """
+        変換で対応表・キーワードに当てはまらなかった回答を県ごとに output_merge/unmapped_report.json に出力
+        （変換スクリプトを実行しなかった場合（キャッシュを再利用した場合を含む）は出力しない）
+        """
+        summaries = collect_summaries(self.report.stages)
+        if not summaries:
+            return None
+        path = self.output_dir / "unmapped_report.json"
+        with AtomicWriter(path) as f:
+            json.dump({"started_at": self.report.started_at.isoformat(timespec="seconds"), "sources": summaries},
+                      f, ensure_ascii=False, indent=1)
+        print(f"\n=== 未対応の回答 ===")
+        for source, categories in summaries.items():
+            for category, columns in categories.items():
+                for column, counter in columns.items():
+                    print(f"  {source} {UNMAPPED_CATEGORIES[category]} {column}: {counter['misses']} 件")
+        print(f"  値の一覧: '{path}'")
+        return path
+    
+    def write_profile_summary(self, top_n: int = 20) -> Optional[Path]:
+        """処理段階ごとのプロファイルから上位N関数の一覧を出力し、各処理段階の上位3関数を表示"""
+        profiler = self.report.profiler
+        if profiler is None:
+            return None
+        path = profiler.write_summary(top_n)
+        if path is None:
+            return None
+        print(f"\n=== プロファイル（{profiler.mode}） ===")
+        for stage, functions in profiler.top_functions(3).items():
+            print(f"  {stage}")
+            for function in functions:
+                print(f"    {function}")
+        print(f"  上位{top_n}関数の一覧: '{path}'（詳細: '{profiler.output_dir}' の .pstats / .folded ファイル）")
+        return path
+
+def parse_args(argv=None):
+    """コマンドライン引数を解析"""
+    parser = argparse.ArgumentParser(description="アンケートCSVマージプログラム")
+    parser.add_argument("--columnar", action="store_true",
+                        help="output_merge/columnar/ に列指向バイナリストアを出力する")
+    parser.add_argument("--sqlite", nargs="?", const="output_merge/merged_survey.sqlite", default=None,
+                        metavar="PATH",
+                        help="SQLiteデータベースを差分更新で出力する（既定: output_merge/merged_survey.sqlite）")
+    parser.add_argument("--cube", nargs="?", const="output_merge/survey_cube.bin", default=None, metavar="PATH",
+                        help="県×回答年月×年代×居住都道府県ごとの満足度・フラグ列の集計キューブを差分更新で出力する"
+                             "（既定: output_merge/survey_cube.bin、集計は aggregate_cube.py で問い合わせ）")
+    parser.add_argument("--bitmap-index", nargs="?", const="output_merge/bitmap_index.bin", default=None,
+                        metavar="PATH",
+                        help="フラグ列・選択肢の列の値ごとのビットマップ索引を出力する"
+                             "（既定: output_merge/bitmap_index.bin、条件式は bitmap_index.py で評価）")
+    parser.add_argument("--text-index", nargs="?", const="output_merge/text_index.bin", default=None,
+                        metavar="PATH",
+                        help="自由意見の文字n-gramの全文索引を差分更新で出力する"
+                             "（既定: output_merge/text_index.bin、検索は text_index.py）")
+    parser.add_argument("--delta", nargs="?", const="output_merge/delta", default=None, metavar="DIR",
+                        help="前回の実行から追加・削除・変更された行を delta_{日付}.csv に出力する"
+                             f"（既定: output_merge/delta、前回の状態は {DEFAULT_STATE_PATH} に保存）")
+    parser.add_argument("--compress", choices=sorted(CODECS), default=None,
+                        help="マージ後・変換後のCSVファイルの圧縮版（.gz/.xz）を出力する")
+    parser.add_argument("--compress-level", type=int, default=None, metavar="N",
+                        help="圧縮レベル（0〜9、既定: 6）")
+    parser.add_argument("--compress-workers", type=int, default=None, metavar="N",
+                        help="圧縮の並列数（既定: CPUコア数）")
+    parser.add_argument("--incremental", action="store_true",
+                        help="前回の変換以降に追加されたレコードだけを変換する（変更を検出した場合は全件を変換）")
+    parser.add_argument("--validate", choices=VALIDATION_MODES, default=DEFAULT_VALIDATION_MODE,
+                        help="変換後の行の統一スキーマ（列数・対象県・回答日・満足度・フラグ列）の検証"
+                             "（count: 違反を数える（既定）、quarantine: 違反した行を quarantine/ に退避、"
+                             "fail: 最初の違反で中止、off: 検証しない）")
+    parser.add_argument("--cache", action="store_true",
+                        help="入力が変わっていない処理段階の出力をキャッシュから再利用する")
+    parser.add_argument("--cache-dir", default=None, metavar="DIR",
+                        help=f"キャッシュの保存先（既定: {DEFAULT_CACHE_DIR}）")
+    parser.add_argument("--cache-max-size", type=parse_size, default=None, metavar="SIZE",
+                        help="キャッシュの最大サイズ（例: 500MB、既定: 1GB）。超えた場合は古いものから削除")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="県ごとの処理を依存関係に沿って並行に実行し、処理時間とクリティカルパスを表示する")
+    parser.add_argument("--workers", type=int, default=None, metavar="N",
+                        help="--pipeline の並列数（既定: Pythonの既定値）")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="実行レポートにtracemallocで計測した処理段階ごとのメモリ確保量のピークを記録する（処理は大幅に遅くなる）")
+    parser.add_argument("--profile", nargs="?", const="cprofile", choices=PROFILE_MODES, default=None,
+                        help="処理段階・変換スクリプトごとにプロファイルする（cprofile: 全関数呼び出しを記録、"
+                             "sample: 一定間隔のサンプリングでオーバーヘッドが小さい。既定: cprofile）")
+    parser.add_argument("--profile-dir", default=None, metavar="DIR",
+                        help="プロファイルの出力先（既定: output_merge/profile）")
+    parser.add_argument("--profile-top", type=int, default=20, metavar="N",
+                        help="プロファイルの一覧に出力する関数の数（既定: 20）")
+    parser.add_argument("--profile-interval", type=float, default=None, metavar="MS",
+                        help=f"sampleモードのサンプリング間隔（ミリ秒、既定: {DEFAULT_PROFILE_INTERVAL * 1000:g}）")
+    parser.add_argument("--max-memory", type=parse_size, default=None, metavar="SIZE",
+                        help="マージ・年毎分割で保持する行データのメモリ使用量の上限（例: 256MB）。"
+                             "超えた分は一時ファイルに退避する")
+    parser.add_argument("--sort-by-date", action="store_true",
+                        help="マージ後のファイル（年毎の分割ファイルを含む）をアンケート回答日の順に出力する")
+    parser.add_argument("--column-stats", action="store_true",
+                        help="年毎の分割ファイルごとに列統計（空欄の割合・値の種類の数・最多の値・最小値/最大値）を"
+                             " {ファイル名}.stats.json に出力する")
+    parser.add_argument("--dedup", action="store_true",
+                        help="正規化した内容が同じ重複回答（2件目以降）をマージ時に除去し、県ごとの除去件数を表示する")
+    parser.add_argument("--no-progress", action="store_true",
+                        help="進捗（処理速度・残り時間）を表示しない")
+    parser.add_argument("--watch", action="store_true",
+                        help="常駐してダウンロード元を条件付きリクエストで定期的に確認し、変わった県だけを差分変換して"
+                             "マージ後のファイルを更新する（Ctrl+Cで停止）")
+    parser.add_argument("--poll-interval", action="append", default=[], metavar="[県名=]秒",
+                        help="--watch の確認間隔（既定: 300秒）。「fukui=3600」のように県ごとにも指定できる（複数指定可）")
+    parser.add_argument("--source-url", action="append", default=[], metavar="県名=URL",
+                        help="ダウンロード元を置き換える（テスト用のサーバーなど、複数指定可。"
+                             "福井はGitHub APIのファイル一覧と同じ形式のJSON）")
+    args = parser.parse_args(argv)
+    names = [conversion["name"] for conversion in CONVERSIONS]
+    try:
+        args.poll_intervals = parse_intervals(args.poll_interval, names)
+    except ValueError as e:
+        parser.error(str(e))
+    args.source_urls = {}
+    for value in args.source_url:
+        name, separator, url = value.partition("=")
+        if not separator or name not in names:
+            parser.error(f"--source-url は 県名=URL（県名: {', '.join(names)}）で指定してください: {value}")
+        args.source_urls[name] = url
+    if args.compress_level is not None and not 0 <= args.compress_level <= 9:
+        parser.error("--compress-level は0〜9で指定してください")
+    return args
+
 def main():
     """メイン関数"""
-    merger = SurveyMerger()
-    success = merger.run()
+    args = parse_args()
+    if args.no_progress:
+        set_display(ProgressDisplay("off"))
+    merger = SurveyMerger(columnar=args.columnar, sqlite_path=args.sqlite,
+                          compress=args.compress, compress_level=args.compress_level,
+                          compress_workers=args.compress_workers, incremental=args.incremental,
+                          validate=args.validate, source_urls=args.source_urls,
+                          cache=args.cache, cache_dir=args.cache_dir, cache_max_bytes=args.cache_max_size,
+                          trace_memory=args.trace_memory, profile=args.profile, profile_dir=args.profile_dir,
+                          profile_interval=args.profile_interval / 1000 if args.profile_interval else None,
+                          max_memory=args.max_memory, sort_by_date=args.sort_by_date,
+                          delta_dir=args.delta, dedup=args.dedup,
+                          cube_path=args.cube, bitmap_index_path=args.bitmap_index,
+                          text_index_path=args.text_index, column_stats=args.column_stats)
+    if args.watch:
+        # 監視モードでは再処理ごとに実行レポートを出力する
+        try:
+            success = SourceWatcher(merger, CONVERSIONS, args.poll_intervals).run()
+        finally:
+            if merger.budget:
+                merger.budget.cleanup()
+        sys.exit(0 if success else 1)
+    try:
+        success = merger.run_pipeline(args.workers) if args.pipeline else merger.run()
+    finally:
+        # 退避した一時ファイルを削除
+        if merger.budget:
+            merger.budget.cleanup()
+    merger.write_run_report(success, "pipeline" if args.pipeline else "sequential")
+    merger.write_unmapped_report()
+    merger.write_profile_summary(args.profile_top)
     
     if success:
         print("\nプログラムが正常に完了しました。")
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+性能回帰チェックプログラム
+固定のシードで生成した合成データ（generate_survey.py）に対して、主要な処理
+（フラグ解析・日付の正規化・1行ごとの変換・マージ・年毎分割）を繰り返し計測し、
+コミット済みのベースライン（perf_baseline.json）と比較する
+最小値（他のプロセスの影響を最も受けにくい値）が閾値を超えて遅くなった処理がある場合は
+終了コード1で終了する
+
+実行環境による速度の差を打ち消すため、各処理の時間は同じ環境で計測した
+基準処理（calibration）の時間との比で比較する
+"""
+
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import timeit
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+import convert_fukui
+import convert_ishikawa
+import convert_toyama
+from generate_survey import PREFECTURES, generate_inputs
+from merge_survey import CONVERSIONS, SurveyMerger
+from progress import ProgressDisplay, set_display
+
+REPO_DIR = Path(__file__).resolve().parent
+DEFAULT_BASELINE = REPO_DIR / "perf_baseline.json"
+DEFAULT_ROWS = 2000
+DEFAULT_SEED = 0
+DEFAULT_REPEAT = 7
+DEFAULT_THRESHOLD = 0.25
+BASELINE_VERSION = 1
+
+# 計測する処理（名前 → 準備関数）。準備関数は (計測する関数, 1回あたりの処理件数) を返す
+BENCHMARKS: Dict[str, Callable[["Fixture"], Tuple[Callable[[], object], int]]] = {}
+
+
+def benchmark(name: str):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+@contextlib.contextmanager
+def working_directory(path: Path):
+    """変換スクリプトは相対パスで入出力するため、作業ディレクトリを一時的に移動"""
+    previous = Path.cwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def quiet():
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+class Fixture:
+    """固定のシードで生成した合成データと、その前処理・変換結果"""
+
+    def __init__(self, root: Path, rows: int, seed: int):
+        self.root = Path(root)
+        self.rows = rows
+        generate_inputs(self.root / "input", rows, PREFECTURES, "utf-8", seed, mapping_dir=REPO_DIR / "input")
+        for prefecture in PREFECTURES:
+            (self.root / "output" / prefecture).mkdir(parents=True, exist_ok=True)
+
+        with working_directory(self.root), quiet():
+            convert_toyama.copy_toyama_csv()
+            convert_ishikawa.remove_unwanted_linebreaks("input/ishikawa/ishikawa.csv")
+            convert_fukui.process_fukui_csv("input/fukui/fukui.csv")
+            convert_toyama.convert_toyama_csv()
+            convert_ishikawa.convert_ishikawa_csv()
+            convert_fukui.convert_fukui_csv()
+
+        self.formatted = {p: self.read_rows(f"input/{p}/{p}_formatted.csv") for p in PREFECTURES}
+
+    def read_rows(self, relative_path: str) -> List[Dict[str, str]]:
+        with open(self.root / relative_path, "r", encoding="utf-8-sig", newline="") as f:
+            return list(csv.DictReader(f))
+
+
+@benchmark("flags.purpose")
+def bench_purpose_flags(fixture: Fixture):
+    values = [row["訪問目的"] for row in fixture.formatted["toyama"]]
+    return lambda: [convert_toyama.parse_purpose_flags(v) for v in values], len(values)
+
+
+@benchmark("flags.transport")
+def bench_transport_flags(fixture: Fixture):
+    rows = fixture.formatted["toyama"]
+    values = [(row["交通手段（来県）"], row["交通手段（県内）"]) for row in rows]
+    return lambda: [(convert_toyama.parse_transport_flags(a), convert_toyama.parse_transport2_flags(b))
+                    for a, b in values], len(values)
+
+
+@benchmark("flags.information_source")
+def bench_information_source_flags(fixture: Fixture):
+    rows = fixture.formatted["toyama"]
+    return lambda: [convert_toyama.check_information_source_flags(convert_toyama.format_information_source(row))
+                    for row in rows], len(rows)
+
+
+@benchmark("dates.normalize")
+def bench_date_normalization(fixture: Fixture):
+    cases = [
+        (convert_toyama.format_date_string, [r["アンケート回答日"] for r in fixture.formatted["toyama"]]),
+        (convert_ishikawa.format_date_string, [r["タイムスタンプ"] for r in fixture.formatted["ishikawa"]]),
+        (convert_fukui.format_date_string, [r["回答日時"] for r in fixture.formatted["fukui"]]),
+    ]
+    count = sum(len(values) for _, values in cases)
+    return lambda: [[normalize(v) for v in values] for normalize, values in cases], count
+
+
+def bench_convert(fixture: Fixture, convert: Callable[[], object]):
+    def run():
+        with working_directory(fixture.root), quiet():
+            convert()
+    return run, fixture.rows
+
+
+@benchmark("convert.toyama")
+def bench_convert_toyama(fixture: Fixture):
+    return bench_convert(fixture, convert_toyama.convert_toyama_csv)
+
+
+@benchmark("convert.ishikawa")
+def bench_convert_ishikawa(fixture: Fixture):
+    return bench_convert(fixture, convert_ishikawa.convert_ishikawa_csv)
+
+
+@benchmark("convert.fukui")
+def bench_convert_fukui(fixture: Fixture):
+    return bench_convert(fixture, convert_fukui.convert_fukui_csv)
+
+
+@benchmark("merge")
+def bench_merge(fixture: Fixture):
+    csv_files = [Path(conversion["output"]) for conversion in CONVERSIONS]
+
+    def run():
+        with working_directory(fixture.root), quiet():
+            merger = SurveyMerger()
+            merger.check_directories()
+            headers, data = merger.collect_merged_data(csv_files)
+            merger.write_merged_outputs(headers, data)
+    return run, fixture.rows * len(csv_files)
+
+
+@benchmark("split")
+def bench_split(fixture: Fixture):
+    csv_files = [Path(conversion["output"]) for conversion in CONVERSIONS]
+
+    def run():
+        with working_directory(fixture.root), quiet():
+            merger = SurveyMerger()
+            for csv_file in csv_files:
+                merger.split_converted_csv_file(csv_file)
+    return run, fixture.rows * len(csv_files)
+
+
+def calibration_loop():
+    """実行環境の速度の基準となる処理（文字列処理と辞書操作）"""
+    counts = {}
+    for i in range(200000):
+        key = f"項目{i % 97}"
+        counts[key] = counts.get(key, 0) + len(key.strip())
+    return counts
+
+
+def measure(func: Callable[[], object], repeat: int) -> dict:
+    """関数をrepeat回計測し、統計値（秒）を返す"""
+    func()  # ウォームアップ（初回のファイル作成・キャッシュの影響を除く）
+    times = timeit.Timer(func).repeat(repeat=repeat, number=1)
+    stats = {
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.mean(times),
+        "stdev": statistics.stdev(times),
+    }
+    return {key: round(value, 6) for key, value in stats.items()}
+
+
+def run_benchmarks(fixture: Fixture, names: List[str], repeat: int) -> dict:
+    calibration = measure(calibration_loop, repeat)
+    results = {}
+    for name in names:
+        func, items = BENCHMARKS[name](fixture)
+        stats = measure(func, repeat)
+        stats["items"] = items
+        stats["per_item_us"] = round(stats["median"] / items * 1e6, 3)
+        # 基準処理の時間との比（実行環境の速度の差を打ち消した値）
+        stats["relative"] = round(stats["min"] / calibration["min"], 4)
+        results[name] = stats
+    return {"calibration": calibration, "benchmarks": results}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> List[str]:
+    """ベースラインと比較して結果を表示し、閾値を超えて遅くなった処理の名前を返す"""
+    regressions = []
+    print(f"  {'処理':<28} {'最小値(ms)':>10} {'中央値(ms)':>10} {'標準偏差':>9} {'1件(µs)':>9} {'基準比':>8} {'ベースライン':>10} {'変化':>8}")
+    for name, stats in results["benchmarks"].items():
+        base = baseline.get("benchmarks", {}).get(name)
+        if base:
+            change = stats["relative"] / base["relative"] - 1
+            change_text = f"{change:+7.1%}"
+            base_text = f"{base['relative']:10.3f}"
+            if change > threshold:
+                regressions.append(name)
+                change_text += " ✗"
+        else:
+            change_text, base_text = "   (新規)", "         -"
+        print(f"  {name:<28} {stats['min'] * 1000:10.2f} {stats['median'] * 1000:10.2f} {stats['stdev'] * 1000:9.2f} "
+              f"{stats['per_item_us']:9.1f} {stats['relative']:8.3f} {base_text} {change_text}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="性能回帰チェック")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE), metavar="PATH",
+                        help="ベースラインファイル（既定: perf_baseline.json）")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="計測結果でベースラインを更新する（処理を意図して変更した場合）")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, metavar="RATIO",
+                        help=f"許容する遅くなる割合（既定: {DEFAULT_THRESHOLD}、0.25は25%%）")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, metavar="N",
+                        help=f"各処理の計測回数（既定: {DEFAULT_REPEAT}）")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), default=None, metavar="NAME",
+                        help="指定した処理だけを計測する")
+    args = parser.parse_args()
+    if args.repeat < 2:
+        parser.error("--repeat は2以上を指定してください")
+
+    baseline_path = Path(args.baseline)
+    baseline = {}
+    if baseline_path.exists():
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    rows = baseline.get("rows", DEFAULT_ROWS)
+    seed = baseline.get("seed", DEFAULT_SEED)
+    names = args.only or list(BENCHMARKS)
+    # 計測中は進捗を表示しない
+    set_display(ProgressDisplay("off"))
+
+    with tempfile.TemporaryDirectory(prefix="perf_regression_") as temp_dir:
+        print(f"合成データを生成中（{rows:,} 行/県, シード {seed}）...")
+        fixture = Fixture(Path(temp_dir), rows, seed)
+        print(f"計測中（各処理 {args.repeat} 回）...\n")
+        results = run_benchmarks(fixture, names, args.repeat)
+
+    regressions = compare(results, baseline, args.threshold)
+
+    if args.update_baseline:
+        if args.only and baseline:
+            # 一部の処理だけを計測した場合は、その処理だけを更新する
+            baseline["benchmarks"].update(results["benchmarks"])
+            results["benchmarks"] = baseline["benchmarks"]
+        data = {
+            "version": BASELINE_VERSION,
+            "rows": rows,
+            "seed": seed,
+            "repeat": args.repeat,
+            "python": platform.python_version(),
+            "updated_at": datetime.now().isoformat(timespec="seconds"),
+            **results,
+        }
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1, sort_keys=False)
+            f.write("\n")
+        print(f"\nベースラインを '{baseline_path}' に保存しました")
+        return 0
+
+    if not baseline:
+        print(f"\nベースライン '{baseline_path}' がありません。--update-baseline で作成してください")
+        return 1
+    if regressions:
+        print(f"\n✗ {len(regressions)} 件の処理がベースラインより {args.threshold:.0%} 以上遅くなりました: "
+              + ", ".join(regressions))
+        return 1
+    print(f"\n✓ すべての処理がベースラインの {args.threshold:.0%} 以内です")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+パイプラインスケジューラモジュール
+処理を依存関係のグラフ（DAG）として登録し、依存する処理が完了したものから
+スレッドプールで並行に実行する機能を提供
+実行後は処理ごとの所要時間とクリティカルパス（全体の所要時間を決めた処理の連なり）を表示する
+"""
+
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, List, Optional
+
+
+class PipelineNode:
+    """パイプラインの処理1つ"""
+
+    def __init__(self, name: str, func: Callable[[], bool], deps: Iterable[str], allow_failure: bool):
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+        # Trueの場合は失敗しても後続の処理を実行する（ダウンロード失敗時に既存データで続行する場合など）
+        self.allow_failure = allow_failure
+        self.status = "pending"
+        self.start: Optional[float] = None
+        self.end: Optional[float] = None
+
+    @property
+    def duration(self) -> float:
+        if self.start is None or self.end is None:
+            return 0.0
+        return self.end - self.start
+
+
+class PipelineScheduler:
+    """依存関係グラフに沿って処理を並行実行するスケジューラ"""
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers
+        self.nodes: Dict[str, PipelineNode] = {}
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def add(self, name: str, func: Callable[[], bool], deps: Iterable[str] = (),
+            allow_failure: bool = False) -> PipelineNode:
+        """処理を登録（依存する処理は先に登録しておく）"""
+        if name in self.nodes:
+            raise ValueError(f"処理 '{name}' は既に登録されています")
+        deps = list(deps)
+        unknown = [d for d in deps if d not in self.nodes]
+        if unknown:
+            raise ValueError(f"処理 '{name}' の依存先が登録されていません: {unknown}")
+        node = PipelineNode(name, func, deps, allow_failure)
+        self.nodes[name] = node
+        return node
+
+    def _run_node(self, node: PipelineNode) -> bool:
+        node.start = time.perf_counter()
+        try:
+            return bool(node.func())
+        except Exception as e:
+            print(f"✗ {node.name} でエラーが発生しました: {e}")
+            traceback.print_exc()
+            return False
+        finally:
+            node.end = time.perf_counter()
+
+    def _is_ready(self, node: PipelineNode) -> bool:
+        return all(self.nodes[d].status in ("done", "failed_allowed") for d in node.deps)
+
+    def _is_blocked(self, node: PipelineNode) -> bool:
+        return any(self.nodes[d].status in ("failed", "skipped") for d in node.deps)
+
+    def run(self) -> bool:
+        """すべての処理を実行し、必須の処理がすべて成功した場合にTrueを返す"""
+        self.started_at = time.perf_counter()
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                # 失敗した処理に依存する処理はスキップ
+                for node in self.nodes.values():
+                    if node.status == "pending" and self._is_blocked(node):
+                        node.status = "skipped"
+                        print(f"  スキップ: {node.name}（依存する処理が失敗しました）")
+
+                # 依存する処理がすべて完了したものを開始
+                for node in self.nodes.values():
+                    if node.status == "pending" and self._is_ready(node):
+                        node.status = "running"
+                        running[executor.submit(self._run_node, node)] = node
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node = running.pop(future)
+                    if future.result():
+                        node.status = "done"
+                    else:
+                        node.status = "failed_allowed" if node.allow_failure else "failed"
+
+        self.finished_at = time.perf_counter()
+        return all(node.status in ("done", "failed_allowed") for node in self.nodes.values())
+
+    def critical_path(self) -> List[PipelineNode]:
+        """
+        最後に完了した処理から、開始を最も遅らせた依存先（最後に完了した依存先）を
+        たどってクリティカルパスを求める
+        """
+        finished = [n for n in self.nodes.values() if n.end is not None]
+        if not finished:
+            return []
+        path = [max(finished, key=lambda n: n.end)]
+        while True:
+            deps = [self.nodes[d] for d in path[-1].deps if self.nodes[d].end is not None]
+            if not deps:
+                break
+            path.append(max(deps, key=lambda n: n.end))
+        path.reverse()
+        return path
+
+    def print_report(self):
+        """処理ごとの所要時間とクリティカルパスを表示"""
+        if self.started_at is None:
+            return
+        status_labels = {
+            "done": "完了", "failed_allowed": "失敗（続行）", "failed": "失敗",
+            "skipped": "スキップ", "pending": "未実行", "running": "実行中",
+        }
+        print("\n=== パイプラインの処理時間 ===")
+        print(f"  {'処理':<28} {'開始':>8} {'所要時間':>10}  状態")
+        for node in sorted(self.nodes.values(), key=lambda n: (n.start is None, n.start or 0)):
+            offset = f"{node.start - self.started_at:7.2f}s" if node.start is not None else "       -"
+            print(f"  {node.name:<28} {offset:>8} {node.duration:9.2f}s  {status_labels[node.status]}")
+
+        path = self.critical_path()
+        total = (self.finished_at or time.perf_counter()) - self.started_at
+        busy = sum(n.duration for n in self.nodes.values())
+        print(f"\n  全体の所要時間: {total:.2f}秒（各処理の所要時間の合計: {busy:.2f}秒）")
+        if path:
+            print("  クリティカルパス: " + " → ".join(f"{n.name} ({n.duration:.2f}s)" for n in path))
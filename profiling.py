@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+プロファイリングモジュール
+instrumentation.py の処理段階ごとに、処理時間の内訳（どの関数で時間がかかっているか）を記録する機能を提供
+
+  - cprofile: cProfileで全関数呼び出しを記録し、処理段階ごとに .pstats ファイルを出力（処理は遅くなる）
+  - sample:   一定間隔でスタックをサンプリングし、処理段階ごとに .samples.json と
+              フレームグラフ用の .folded ファイルを出力（オーバーヘッドが小さく、日次実行でも有効にできる）
+
+変換スクリプト（子プロセス）には環境変数でモードと出力先を渡し、同じディレクトリに出力させる
+最後に親プロセスがすべての結果を読み込み、処理段階ごとの上位N関数をまとめた summary.txt を出力する
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from atomic_write import AtomicWriter
+
+MODES = ("cprofile", "sample")
+PROFILE_ENV = "SURVEY_PROFILE"
+PROFILE_DIR_ENV = "SURVEY_PROFILE_DIR"
+PROFILE_INTERVAL_ENV = "SURVEY_PROFILE_INTERVAL"
+DEFAULT_INTERVAL = 0.01
+SUMMARY_NAME = "summary.txt"
+
+
+def frame_label(code) -> str:
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+
+class _Sampler:
+    """スレッドごとに登録された処理段階のスタックを一定間隔でサンプリング"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._lock = threading.Lock()
+        # スレッドID → 実行中の処理段階のサンプル（入れ子の場合は内側の処理段階に記録）
+        self._targets: Dict[int, List[dict]] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def _ensure_started(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="stage-sampler", daemon=True)
+            self._thread.start()
+
+    def start(self) -> dict:
+        samples = {"samples": 0, "self": Counter(), "total": Counter(), "stacks": Counter()}
+        with self._lock:
+            self._targets.setdefault(threading.get_ident(), []).append(samples)
+            self._ensure_started()
+        return samples
+
+    def stop(self, samples: dict):
+        with self._lock:
+            stack = self._targets.get(threading.get_ident(), [])
+            if samples in stack:
+                stack.remove(samples)
+            if not stack:
+                self._targets.pop(threading.get_ident(), None)
+
+    def _run(self):
+        sampler_id = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, stack in self._targets.items():
+                    frame = frames.get(thread_id)
+                    if frame is None or thread_id == sampler_id or not stack:
+                        continue
+                    labels = []
+                    while frame is not None:
+                        labels.append(frame_label(frame.f_code))
+                        frame = frame.f_back
+                    samples = stack[-1]
+                    samples["samples"] += 1
+                    samples["self"][labels[0]] += 1
+                    for label in set(labels):
+                        samples["total"][label] += 1
+                    samples["stacks"][";".join(reversed(labels))] += 1
+
+
+class StageProfiler:
+    """処理段階ごとのプロファイラ"""
+
+    def __init__(self, mode: str, output_dir: Path, prefix: str, interval: float = DEFAULT_INTERVAL):
+        if mode not in MODES:
+            raise ValueError(f"未対応のプロファイルモードです: {mode}")
+        self.mode = mode
+        self.output_dir = Path(output_dir)
+        self.prefix = prefix
+        self.interval = interval
+        self.skipped: List[str] = []
+        self._local = threading.local()
+        self._sampler = _Sampler(interval) if mode == "sample" else None
+
+    @classmethod
+    def from_env(cls) -> Optional["StageProfiler"]:
+        """親プロセスから環境変数で指示された場合のプロファイラ（変換スクリプト用）"""
+        mode = os.environ.get(PROFILE_ENV)
+        if mode not in MODES or not os.environ.get(PROFILE_DIR_ENV):
+            return None
+        interval = float(os.environ.get(PROFILE_INTERVAL_ENV) or DEFAULT_INTERVAL)
+        return cls(mode, Path(os.environ[PROFILE_DIR_ENV]), Path(sys.argv[0]).stem, interval)
+
+    def child_env(self) -> Dict[str, str]:
+        """変換スクリプトに渡す環境変数"""
+        return {PROFILE_ENV: self.mode, PROFILE_DIR_ENV: str(self.output_dir.resolve()),
+                PROFILE_INTERVAL_ENV: str(self.interval)}
+
+    def clear(self):
+        """前回の実行結果を削除"""
+        if self.output_dir.exists():
+            for path in self.output_dir.iterdir():
+                if path.suffix in (".pstats", ".json", ".folded") or path.name == SUMMARY_NAME:
+                    path.unlink()
+
+    def _base_path(self, stage: str, prefecture: Optional[str]) -> Path:
+        name = ".".join(part for part in (self.prefix, stage, prefecture) if part)
+        return self.output_dir / name
+
+    @contextmanager
+    def profile(self, stage: str, prefecture: Optional[str] = None):
+        """処理段階をプロファイルするコンテキストマネージャ"""
+        # 同じスレッドで入れ子になった処理段階は外側の処理段階に含める
+        if getattr(self._local, "active", False):
+            yield
+            return
+        self._local.active = True
+        try:
+            if self.mode == "cprofile":
+                with self._cprofile(stage, prefecture):
+                    yield
+            else:
+                with self._sample(stage, prefecture):
+                    yield
+        finally:
+            self._local.active = False
+
+    @contextmanager
+    def _cprofile(self, stage: str, prefecture: Optional[str]):
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12以降は同時に1つのcProfileしか有効にできない（--pipelineで並行実行中の処理段階）
+            self.skipped.append(f"{stage}:{prefecture}" if prefecture else stage)
+            yield
+            return
+        try:
+            yield
+        finally:
+            profile.disable()
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            profile.dump_stats(str(self._base_path(stage, prefecture)) + ".pstats")
+
+    @contextmanager
+    def _sample(self, stage: str, prefecture: Optional[str]):
+        samples = self._sampler.start()
+        try:
+            yield
+        finally:
+            self._sampler.stop(samples)
+            # サンプリング間隔より短い処理段階は出力しない
+            if samples["samples"]:
+                self._write_samples(stage, prefecture, samples)
+
+    def _write_samples(self, stage: str, prefecture: Optional[str], samples: dict):
+        base = str(self._base_path(stage, prefecture))
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        with AtomicWriter(base + ".samples.json") as f:
+            json.dump({"interval": self.interval, "samples": samples["samples"],
+                       "self": dict(samples["self"]), "total": dict(samples["total"])},
+                      f, ensure_ascii=False)
+        # フレームグラフ用（flamegraph.pl や speedscope で読み込める形式）
+        with AtomicWriter(base + ".folded") as f:
+            for stack, count in samples["stacks"].items():
+                f.write(f"{stack} {count}\n")
+
+    def write_summary(self, top_n: int = 20) -> Optional[Path]:
+        """出力ディレクトリ内のすべての結果（子プロセスの分を含む）から上位N関数の一覧を出力"""
+        if not self.output_dir.exists():
+            return None
+        out = io.StringIO()
+        for path in sorted(self.output_dir.glob("*.pstats")):
+            out.write(f"=== {path.stem} ===\n")
+            stats = pstats.Stats(str(path), stream=out)
+            stats.sort_stats(pstats.SortKey.TIME).print_stats(top_n)
+        for path in sorted(self.output_dir.glob("*.samples.json")):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            total = data["samples"] or 1
+            out.write(f"=== {path.name[:-len('.samples.json')]} "
+                      f"（サンプル数 {data['samples']}, 間隔 {data['interval'] * 1000:g}ms） ===\n")
+            out.write(f"  {'自関数':>7} {'累積':>7}  関数\n")
+            ranking = sorted(data["self"].items(), key=lambda item: -item[1])[:top_n]
+            for label, count in ranking:
+                out.write(f"  {count / total:7.1%} {data['total'].get(label, 0) / total:7.1%}  {label}\n")
+            out.write("\n")
+        if self.skipped:
+            out.write("プロファイルできなかった処理段階（他の処理段階のcProfileが実行中）: "
+                      + ", ".join(self.skipped) + "\n")
+
+        path = self.output_dir / SUMMARY_NAME
+        with AtomicWriter(path) as f:
+            f.write(out.getvalue())
+        return path
+
+    def top_functions(self, count: int = 3) -> Dict[str, List[str]]:
+        """処理段階ごとの自関数の時間が長い上位の関数（表示用）"""
+        result = {}
+        for path in sorted(self.output_dir.glob("*.pstats")):
+            stats = pstats.Stats(str(path))
+            ranking = sorted(stats.stats.items(), key=lambda item: -item[1][2])[:count]
+            result[path.stem] = [f"{func[2]} ({Path(func[0]).name}:{func[1]}) {timing[2]:.2f}s"
+                                 for func, timing in ranking]
+        for path in sorted(self.output_dir.glob("*.samples.json")):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            total = data["samples"] or 1
+            ranking = sorted(data["self"].items(), key=lambda item: -item[1])[:count]
+            result[path.name[:-len(".samples.json")]] = [f"{label} {n / total:.0%}" for label, n in ranking]
+        return result
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+進捗表示モジュール
+時間のかかる処理（ダウンロード・前処理・変換・マージ・分割）の進捗を、処理量、処理速度、
+経過時間、残り時間の目安とともに標準エラー出力に表示する機能を提供
+
+  - tty:   端末では1行を書き換えて表示（1秒間に最大4回、実行中の処理が複数ある場合は1行にまとめる）
+  - log:   端末でない場合（CIなど）は一定間隔でログ行を出力
+  - relay: 変換スクリプト（子プロセス）では進捗を機械可読な行として出力し、親プロセスが表示する
+  - off:   表示しない
+
+update()は件数を加算するだけで、時刻の確認も処理速度から見積もった件数ごとにしか行わないため、
+1行ごとのループ内で呼び出しても負荷はほとんどない
+"""
+
+import itertools
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import unicodedata
+from typing import Dict, Iterable, List, Optional
+
+PROGRESS_ENV = "SURVEY_PROGRESS"
+MODES = ("tty", "log", "relay", "off")
+RELAY_PREFIX = "@@progress "
+# 表示の間隔（秒）
+TTY_INTERVAL = 0.25
+LOG_INTERVAL = 10.0
+RELAY_INTERVAL = 0.5
+# 時刻を確認する間隔の目安（秒）
+CHECK_SECONDS = 0.02
+# write_rows()で進捗を更新する行数
+WRITE_BATCH = 10000
+READ_CHUNK = 1024 * 1024
+
+UNITS = ("rows", "bytes")
+
+
+def default_mode(stream=None) -> str:
+    """環境変数 SURVEY_PROGRESS の指定、なければ出力先が端末かどうかで表示方法を決める"""
+    mode = os.environ.get(PROGRESS_ENV)
+    if mode in MODES:
+        return mode
+    stream = stream or sys.stderr
+    isatty = getattr(stream, "isatty", None)
+    return "tty" if isatty and isatty() else "log"
+
+
+def format_amount(value: float, unit: str) -> str:
+    if unit == "bytes":
+        for suffix in ("B", "KB", "MB", "GB"):
+            if value < 1024 or suffix == "GB":
+                return f"{value:,.0f}{suffix}" if suffix == "B" else f"{value:,.1f}{suffix}"
+            value /= 1024
+    return f"{value:,.0f}行"
+
+
+def display_width(text: str) -> int:
+    """端末での表示幅（全角文字は2文字分）"""
+    return sum(2 if unicodedata.east_asian_width(c) in "WF" else 1 for c in text)
+
+
+def truncate(text: str, width: int) -> str:
+    while text and display_width(text) > width:
+        text = text[:-1]
+    return text
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+
+class Progress:
+    """1つの処理の進捗（with文で使うと終了時にclose()する）"""
+
+    def __init__(self, label: str, total: Optional[int] = None, unit: str = "rows",
+                 display: Optional["ProgressDisplay"] = None):
+        if unit not in UNITS:
+            raise ValueError(f"未対応の単位です: {unit}")
+        self.label = label
+        self.total = total
+        self.unit = unit
+        self.count = 0
+        self.display = display or get_display()
+        self.reported = False
+        self.closed = False
+        self._start = time.monotonic()
+        self._next_report = self._start + self.display.interval
+        # 表示しない場合は時刻も確認しない
+        self._next_check = float("inf") if self.display.mode == "off" else 1
+        self.display.start(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def update(self, amount: int = 1):
+        """処理量を加算（ループ内で呼び出す）"""
+        self.count += amount
+        if self.count >= self._next_check:
+            self._check()
+
+    def set_total(self, total: Optional[int]):
+        self.total = total
+
+    def _check(self):
+        now = time.monotonic()
+        # 処理速度から、次に時刻を確認するまでの処理量を見積もる
+        rate = self.count / max(now - self._start, 1e-6)
+        self._next_check = self.count + max(1, int(rate * CHECK_SECONDS))
+        if now >= self._next_report:
+            self._next_report = now + self.display.interval
+            self.display.refresh(self)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self._start
+
+    def status(self) -> str:
+        """表示用の文字列（例: 変換 toyama: 12,345/50,000行 (24.7%) 8,210行/秒 経過 00:01 残り 00:04）"""
+        elapsed = self.elapsed
+        rate = self.count / elapsed if elapsed > 0 else 0
+        if self.total:
+            # 行数は単位を最後にだけ付ける（12,345/50,000行）
+            done = f"{self.count:,}" if self.unit == "rows" else format_amount(self.count, self.unit)
+            parts = [f"{self.label}: {done}/{format_amount(self.total, self.unit)} "
+                     f"({min(self.count / self.total, 1):.1%})"]
+        else:
+            parts = [f"{self.label}: {format_amount(self.count, self.unit)}"]
+        parts.append(f"{format_amount(rate, self.unit)}/秒")
+        parts.append(f"経過 {format_duration(elapsed)}")
+        if self.total and rate > 0 and not self.closed:
+            parts.append(f"残り {format_duration(max(self.total - self.count, 0) / rate)}")
+        return " ".join(parts)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.display.finish(self)
+
+
+class ProgressDisplay:
+    """進捗の表示先"""
+
+    def __init__(self, mode: Optional[str] = None, stream=None, log_interval: float = LOG_INTERVAL):
+        self.stream = stream or sys.stderr
+        self.mode = mode or default_mode(self.stream)
+        if self.mode not in MODES:
+            raise ValueError(f"未対応の進捗表示モードです: {self.mode}")
+        self.interval = {"tty": TTY_INTERVAL, "log": log_interval,
+                         "relay": RELAY_INTERVAL, "off": float("inf")}[self.mode]
+        self._active: List[Progress] = []
+        self._ids: Dict[int, int] = {}
+        self._next_id = itertools.count(1)
+        self._relayed: Dict[tuple, Progress] = {}
+        self._lock = threading.Lock()
+        self._width = 0
+
+    def start(self, progress: Progress):
+        with self._lock:
+            self._active.append(progress)
+            self._ids[id(progress)] = next(self._next_id)
+
+    def refresh(self, progress: Progress):
+        with self._lock:
+            progress.reported = True
+            if self.mode == "tty":
+                self._render_line()
+            elif self.mode == "log":
+                self._write(f"  [進捗] {progress.status()}\n")
+            elif self.mode == "relay":
+                self._relay(progress, done=False)
+
+    def finish(self, progress: Progress):
+        with self._lock:
+            if progress in self._active:
+                self._active.remove(progress)
+            if self.mode == "relay":
+                self._relay(progress, done=True)
+            elif self.mode in ("tty", "log") and progress.reported:
+                # 途中経過を表示した（時間のかかった）処理だけ完了時の結果を残す
+                self._clear_line()
+                self._write(f"  [完了] {progress.status()}\n")
+            if self.mode == "tty":
+                self._render_line()
+            self._ids.pop(id(progress), None)
+
+    def _write(self, text: str):
+        try:
+            self.stream.write(text)
+            self.stream.flush()
+        except (OSError, ValueError):
+            pass
+
+    def _clear_line(self):
+        if self.mode == "tty" and self._width:
+            self._write("\r" + " " * self._width + "\r")
+            self._width = 0
+
+    def _render_line(self):
+        line = " | ".join(p.status() for p in self._active if p.reported)
+        if not line:
+            self._clear_line()
+            return
+        # 端末の幅を超えると折り返して書き換えられないため切り詰める
+        line = truncate(line, shutil.get_terminal_size().columns - 1)
+        width = display_width(line)
+        # 前回の表示より短い場合は残りを空白で消す
+        self._write("\r" + line + " " * max(self._width - width, 0))
+        self._width = width
+
+    def _relay(self, progress: Progress, done: bool):
+        data = {"id": self._ids.get(id(progress)), "label": progress.label, "count": progress.count,
+                "total": progress.total, "unit": progress.unit, "elapsed": round(progress.elapsed, 3),
+                "done": done}
+        self._write(RELAY_PREFIX + json.dumps(data, ensure_ascii=False) + "\n")
+
+    def receive(self, line: str, source: str = "") -> bool:
+        """
+        子プロセスが出力した進捗の行を表示に反映する
+        進捗の行でなければFalseを返す（通常の標準エラー出力として扱う）
+        """
+        if not line.startswith(RELAY_PREFIX):
+            return False
+        try:
+            data = json.loads(line[len(RELAY_PREFIX):])
+        except ValueError:
+            return False
+        key = (source, data.get("id"))
+        progress = self._relayed.get(key)
+        if progress is None:
+            if data.get("done") and not data.get("count"):
+                return True
+            progress = Progress(data["label"], data.get("total"), data.get("unit", "rows"), display=self)
+            self._relayed[key] = progress
+        # 子プロセスでの経過時間に合わせる
+        progress._start = time.monotonic() - data.get("elapsed", 0)
+        progress.count = data.get("count", 0)
+        progress.total = data.get("total")
+        if data.get("done"):
+            del self._relayed[key]
+            progress.reported = progress.reported or data.get("elapsed", 0) >= self.interval
+            progress.close()
+        else:
+            now = time.monotonic()
+            if now >= progress._next_report:
+                progress._next_report = now + self.interval
+                self.refresh(progress)
+        return True
+
+    def child_env(self) -> Dict[str, str]:
+        """変換スクリプトに渡す環境変数（進捗は親プロセスがまとめて表示する）"""
+        return {PROGRESS_ENV: "off" if self.mode == "off" else "relay"}
+
+
+_display: Optional[ProgressDisplay] = None
+_display_lock = threading.Lock()
+
+
+def get_display() -> ProgressDisplay:
+    """プロセス共通の表示先"""
+    global _display
+    with _display_lock:
+        if _display is None:
+            _display = ProgressDisplay()
+        return _display
+
+
+def set_display(display: ProgressDisplay) -> ProgressDisplay:
+    """プロセス共通の表示先を設定（--no-progress など）"""
+    global _display
+    with _display_lock:
+        _display = display
+    return display
+
+
+def write_rows(writer, rows: Iterable[list], progress: Progress):
+    """csv.writerに行を書き込みながら進捗を更新（一定行数ごとにまとめて書き込む）"""
+    iterator = iter(rows)
+    while True:
+        batch = list(itertools.islice(iterator, WRITE_BATCH))
+        if not batch:
+            break
+        writer.writerows(batch)
+        progress.update(len(batch))
+
+
+def read_bytes(path, label: str) -> bytes:
+    """ファイルを読み込みながら進捗（バイト数）を表示"""
+    chunks = []
+    with open(path, "rb") as f, Progress(label, os.fstat(f.fileno()).st_size, "bytes") as progress:
+        for chunk in iter(lambda: f.read(READ_CHUNK), b""):
+            chunks.append(chunk)
+            progress.update(len(chunk))
+    return b"".join(chunks)
+
+
+def copy_file(source, target, label: str):
+    """ファイルをコピーしながら進捗（バイト数）を表示（shutil.copy2と同様に更新日時などもコピー）"""
+    with open(source, "rb") as src, open(target, "wb") as dst, \
+            Progress(label, os.fstat(src.fileno()).st_size, "bytes") as progress:
+        for chunk in iter(lambda: src.read(READ_CHUNK), b""):
+            dst.write(chunk)
+            progress.update(len(chunk))
+    shutil.copystat(source, target)
+
+
+def run_subprocess(command: List[str], env: Dict[str, str], source: str = "") -> subprocess.CompletedProcess:
+    """
+    subprocess.run(capture_output=True, text=True)と同様にコマンドを実行し、
+    実行中に子プロセスが出力した進捗を表示する（進捗の行は標準エラー出力の結果に含めない）
+    """
+    display = get_display()
+    env = dict(env, **display.child_env())
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               text=True, encoding="utf-8", env=env)
+    stderr_lines = []
+
+    def read_stderr():
+        for line in process.stderr:
+            if not display.receive(line, source):
+                stderr_lines.append(line)
+
+    reader = threading.Thread(target=read_stderr, name=f"progress-{source}", daemon=True)
+    reader.start()
+    stdout = process.stdout.read()
+    process.wait()
+    reader.join()
+    process.stdout.close()
+    process.stderr.close()
+    return subprocess.CompletedProcess(command, process.returncode, stdout, "".join(stderr_lines))
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+問い合わせサービス
+年毎の分割ファイル（output_merge/merged_survey_{年}.csv）から、県・期間・フラグ列で絞り込んだ行を
+CSVまたはJSONで返す読み取り専用のHTTPサーバー（標準ライブラリのみ、リクエストごとにスレッドで処理）
+
+  GET /partitions                  年毎の分割ファイルの一覧（行数・回答日の範囲）
+  GET /rows?県=石川&from=2024/04/01&to=2024/06/30&flag=Instagram&columns=アンケート回答日,年代
+           &offset=0&limit=100&format=json   （format=csv でCSV）
+  GET /health                      動作確認
+
+  - 分割ファイルは行オフセット索引（.idx）を使ってメモリマップし、最近使った分を開いたままにする。
+    索引はパイプラインが作成したものだけを使い、ないか古い場合は作成せずにファイルを先頭から読む
+  - 期間を指定した場合は索引の回答日ごとの範囲から該当する行だけを読み込む
+  - 応答はETag付きでキャッシュし、If-None-Matchが一致する場合は304を返す
+  - 分割ファイルの更新（パイプラインの実行）を検出すると、再起動せずに新しいファイルを開き直す
+"""
+
+import argparse
+import csv
+import hashlib
+import io
+import itertools
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from date_sort import DATE_COLUMN
+from row_index import IndexedCSV, day_number
+
+DEFAULT_DATA_DIR = Path("output_merge")
+PARTITION_PATTERN = re.compile(r"merged_survey_(\d{4})\.csv$")
+SOURCE_COLUMN = "対象県（富山/石川/福井）"
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 10000
+# 開いたままにする分割ファイルの数
+HOT_PARTITIONS = 4
+# キャッシュする応答の数と合計サイズ
+CACHE_ENTRIES = 256
+CACHE_BYTES = 64 * 1024 * 1024
+# 分割ファイルの更新を確認する間隔（秒）
+RELOAD_INTERVAL = 1.0
+
+
+class QueryError(ValueError):
+    """リクエストのパラメーターの誤り（400を返す）"""
+
+
+class ScannedCSV:
+    """
+    索引がないか古い分割ファイルを先頭から読む（IndexedCSVと同じ読み込みの機能、ファイルには書き込まない）
+    行数と回答日の範囲は開いた時点のもの
+    """
+
+    def __init__(self, csv_path):
+        self.path = Path(csv_path)
+        self.day_runs: List[Tuple[int, int, int]] = []
+        self._rows = 0
+        with open(self.path, "r", encoding="utf-8-sig", newline="") as f:
+            reader = csv.reader(f)
+            self.headers: List[str] = next(reader, [])
+            date_index = self.headers.index(DATE_COLUMN) if DATE_COLUMN in self.headers else None
+            for row in reader:
+                day = day_number(row[date_index]) if date_index is not None and date_index < len(row) else 0
+                if self.day_runs and self.day_runs[-1][0] == day:
+                    _, start, count = self.day_runs[-1]
+                    self.day_runs[-1] = (day, start, count + 1)
+                else:
+                    self.day_runs.append((day, self._rows, 1))
+                self._rows += 1
+        self.sorted = all(a[0] <= b[0] for a, b in zip(self.day_runs, self.day_runs[1:]))
+        self._date_index = date_index
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def _scan(self) -> Iterator[List[str]]:
+        with open(self.path, "r", encoding="utf-8-sig", newline="") as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            yield from reader
+
+    def rows(self, start: int = 0, stop: Optional[int] = None) -> List[List[str]]:
+        """start行目からstop行目の手前までの行（0始まり、ヘッダー行を除く）"""
+        start, stop, _ = slice(start, stop).indices(len(self))
+        return list(itertools.islice(self._scan(), start, stop))
+
+    def date_range(self, start: Optional[str] = None, end: Optional[str] = None) -> List[List[str]]:
+        """回答日がstart以上end以下（日単位）の行（元のファイルの順）"""
+        if self._date_index is None:
+            return []
+        first_day = day_number(start) if start else 1
+        last_day = day_number(end) if end else 99991231
+        index = self._date_index
+        return [row for row in self._scan()
+                if index < len(row) and first_day <= day_number(row[index]) <= last_day]
+
+
+class SurveyStore:
+    """年毎の分割ファイルの一覧と、メモリマップした分割ファイル・応答のキャッシュ"""
+
+    def __init__(self, data_dir: Path = DEFAULT_DATA_DIR, hot_partitions: int = HOT_PARTITIONS):
+        self.data_dir = Path(data_dir)
+        self.hot_partitions = hot_partitions
+        self.files: Dict[int, Path] = {}
+        self.generation = ""
+        self._stats: Dict[Path, Tuple[int, int]] = {}
+        self._open: "OrderedDict[int, IndexedCSV]" = OrderedDict()
+        self._cache: "OrderedDict[str, Tuple[bytes, str]]" = OrderedDict()
+        self._cache_bytes = 0
+        self._next_check = 0.0
+        self._lock = threading.RLock()
+        self.refresh(force=True)
+
+    def refresh(self, force: bool = False):
+        """分割ファイルが追加・更新・削除されていれば開き直す（一定間隔でだけ確認する）"""
+        now = time.monotonic()
+        if not force and now < self._next_check:
+            return
+        self._next_check = now + RELOAD_INTERVAL
+        stats = {}
+        files = {}
+        for path in sorted(self.data_dir.glob("merged_survey_*.csv")):
+            match = PARTITION_PATTERN.search(path.name)
+            if match:
+                stat = path.stat()
+                stats[path] = (stat.st_mtime_ns, stat.st_size)
+                files[int(match.group(1))] = path
+        with self._lock:
+            if stats == self._stats:
+                return
+            # 更新されたファイルは閉じずに参照を外す（処理中の他のリクエストが読み終わるまで有効）
+            changed = {year for year, path in files.items() if self._stats.get(path) != stats[path]}
+            for year in list(self._open):
+                if year in changed or year not in files:
+                    del self._open[year]
+            self._stats = stats
+            self.files = files
+            self.generation = hashlib.blake2b(repr(sorted((str(p), s) for p, s in stats.items())).encode(),
+                                              digest_size=8).hexdigest()
+            self._cache.clear()
+            self._cache_bytes = 0
+
+    def partition(self, year: int):
+        """
+        分割ファイルを開く。最近使った分は開いたままにする
+        索引がないか古い場合は作成せずにファイルを先頭から読む（次のリクエストで索引があれば使う）
+        """
+        with self._lock:
+            indexed = self._open.get(year)
+            if indexed is not None:
+                self._open.move_to_end(year)
+                return indexed
+            path = self.files[year]
+        try:
+            indexed = IndexedCSV(path, build=False)
+        except FileNotFoundError:
+            print(f"警告: '{path}' の索引がないか古いため、ファイルを先頭から読みます"
+                  f"（merge_survey.py または row_index.py で作成）", file=sys.stderr)
+            return ScannedCSV(path)
+        with self._lock:
+            self._open[year] = indexed
+            self._open.move_to_end(year)
+            while len(self._open) > self.hot_partitions:
+                # 閉じずに参照を外す（処理中のリクエストが読み終わるとガベージコレクションで閉じられる）
+                self._open.popitem(last=False)
+        return indexed
+
+    def cached(self, key: str) -> Optional[Tuple[bytes, str]]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+            return entry
+
+    def store(self, key: str, body: bytes, content_type: str):
+        with self._lock:
+            if key in self._cache or len(body) > CACHE_BYTES // 4:
+                return
+            self._cache[key] = (body, content_type)
+            self._cache_bytes += len(body)
+            while len(self._cache) > CACHE_ENTRIES or self._cache_bytes > CACHE_BYTES:
+                _, (old, _) = self._cache.popitem(last=False)
+                self._cache_bytes -= len(old)
+
+    def partitions(self) -> List[dict]:
+        result = []
+        for year in sorted(self.files):
+            indexed = self.partition(year)
+            days = [day for day, _, _ in indexed.day_runs if day]
+            result.append({"year": year, "file": self.files[year].name, "rows": len(indexed),
+                           "first_day": min(days) if days else None, "last_day": max(days) if days else None,
+                           "sorted": indexed.sorted})
+        return result
+
+    def query(self, params: Dict[str, List[str]]) -> Tuple[List[str], int, List[List[str]], int, int]:
+        """絞り込んだ行（列の射影・ページ分割後）と、絞り込み後の合計行数"""
+        def single(name: str) -> Optional[str]:
+            values = params.get(name)
+            return values[-1] if values else None
+
+        prefecture = single("県") or single("pref")
+        start, end = single("from"), single("to")
+        flags = [flag for value in params.get("flag", []) for flag in value.split(",") if flag]
+        try:
+            offset = int(single("offset") or 0)
+            limit = min(int(single("limit") or DEFAULT_LIMIT), MAX_LIMIT)
+        except ValueError:
+            raise QueryError("offset・limitは整数で指定してください")
+        if offset < 0 or limit < 0:
+            raise QueryError("offset・limitは0以上で指定してください")
+        for name, value in (("from", start), ("to", end)):
+            if value and not day_number(value):
+                raise QueryError(f"{name}の日付を解析できないか、存在しない日付です: {value}")
+
+        # 期間に重なる年の分割ファイルだけを読み込む
+        first_year = day_number(start) // 10000 if start else None
+        last_year = day_number(end) // 10000 if end else None
+        years = [year for year in sorted(self.files)
+                 if (first_year is None or year >= first_year) and (last_year is None or year <= last_year)]
+
+        columns: Optional[List[str]] = None
+        total = 0
+        page: List[List[str]] = []
+        for year in years:
+            indexed = self.partition(year)
+            headers = indexed.headers
+            if columns is None:
+                requested = [c for value in params.get("columns", []) for c in value.split(",") if c]
+                columns = requested or headers
+                unknown = [c for c in columns + flags if c not in headers]
+                if unknown:
+                    raise QueryError(f"存在しない列です: {', '.join(unknown)}")
+            projection = [headers.index(c) for c in columns]
+            flag_indexes = [headers.index(c) for c in flags]
+            source_index = headers.index(SOURCE_COLUMN) if SOURCE_COLUMN in headers else None
+            rows = indexed.date_range(start, end) if start or end else indexed.rows()
+            for row in rows:
+                if prefecture and (source_index is None or source_index >= len(row)
+                                   or row[source_index] != prefecture):
+                    continue
+                if any(i >= len(row) or row[i] != "1" for i in flag_indexes):
+                    continue
+                if offset <= total < offset + limit:
+                    page.append([row[i] if i < len(row) else "" for i in projection])
+                total += 1
+        return columns or [], total, page, offset, limit
+
+
+def make_handler(store: SurveyStore):
+    class QueryHandler(BaseHTTPRequestHandler):
+        server_version = "SurveyQuery/1.0"
+
+        def do_HEAD(self):
+            self.do_GET(head=True)
+
+        def do_GET(self, head: bool = False):
+            url = urlsplit(self.path)
+            params = parse_qs(url.query)
+            store.refresh()
+            if url.path == "/health":
+                self._send(HTTPStatus.OK, b"ok\n", "text/plain; charset=utf-8", head=head)
+                return
+            if url.path not in ("/rows", "/partitions"):
+                self._send_error(HTTPStatus.NOT_FOUND, f"存在しないパスです: {url.path}", head)
+                return
+
+            # 分割ファイルの世代とパス・パラメーターが同じなら同じ応答になる
+            canonical = json.dumps([url.path, sorted((k, v) for k, v in params.items())], ensure_ascii=False)
+            key = hashlib.blake2b(f"{store.generation}\n{canonical}".encode("utf-8"), digest_size=16).hexdigest()
+            etag = f'"{key}"'
+            if etag in [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]:
+                self._send(HTTPStatus.NOT_MODIFIED, b"", None, etag=etag, head=True)
+                return
+            entry = store.cached(key)
+            if entry is None:
+                try:
+                    entry = self._render(url.path, params)
+                except QueryError as e:
+                    self._send_error(HTTPStatus.BAD_REQUEST, str(e), head)
+                    return
+                store.store(key, *entry)
+            self._send(HTTPStatus.OK, entry[0], entry[1], etag=etag, head=head)
+
+        def do_POST(self):
+            self._send_error(HTTPStatus.METHOD_NOT_ALLOWED, "読み取り専用です", False)
+
+        do_PUT = do_DELETE = do_PATCH = do_POST
+
+        def _render(self, path: str, params: Dict[str, List[str]]) -> Tuple[bytes, str]:
+            if path == "/partitions":
+                body = json.dumps({"partitions": store.partitions()}, ensure_ascii=False)
+                return body.encode("utf-8"), "application/json; charset=utf-8"
+
+            columns, total, rows, offset, limit = store.query(params)
+            output_format = (params.get("format") or ["json"])[-1]
+            if output_format == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(columns)
+                writer.writerows(rows)
+                return buffer.getvalue().encode("utf-8"), "text/csv; charset=utf-8"
+            if output_format != "json":
+                raise QueryError(f"未対応の形式です: {output_format}（json/csv）")
+            body = json.dumps({"total": total, "offset": offset, "limit": limit, "columns": columns,
+                               "rows": rows}, ensure_ascii=False)
+            return body.encode("utf-8"), "application/json; charset=utf-8"
+
+        def _send(self, status: HTTPStatus, body: bytes, content_type: Optional[str],
+                  etag: Optional[str] = None, head: bool = False):
+            self.send_response(status)
+            if content_type:
+                self.send_header("Content-Type", content_type)
+            if etag:
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", "no-cache")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if not head and body:
+                self.wfile.write(body)
+
+        def _send_error(self, status: HTTPStatus, message: str, head: bool):
+            body = json.dumps({"error": message}, ensure_ascii=False).encode("utf-8")
+            self._send(status, body, "application/json; charset=utf-8", head=head)
+
+        def log_message(self, format, *args):
+            sys.stderr.write(f"[{self.log_date_time_string()}] {self.address_string()} {format % args}\n")
+
+    return QueryHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="年毎の分割ファイルを絞り込んで返す読み取り専用のHTTPサーバー")
+    parser.add_argument("--host", default="127.0.0.1", help="待ち受けるアドレス（既定: 127.0.0.1）")
+    parser.add_argument("--port", type=int, default=8080, help="待ち受けるポート（既定: 8080）")
+    parser.add_argument("--data-dir", default=str(DEFAULT_DATA_DIR), metavar="DIR",
+                        help=f"年毎の分割ファイルのディレクトリ（既定: {DEFAULT_DATA_DIR}）")
+    parser.add_argument("--hot-partitions", type=int, default=HOT_PARTITIONS, metavar="N",
+                        help=f"メモリマップしたまま開いておく分割ファイルの数（既定: {HOT_PARTITIONS}）")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.data_dir):
+        print(f"エラー: ディレクトリ '{args.data_dir}' がありません", file=sys.stderr)
+        return 1
+    store = SurveyStore(Path(args.data_dir), args.hot_partitions)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(store))
+    print(f"http://{args.host}:{args.port}/ で待ち受けています（分割ファイル {len(store.files)} 件）。Ctrl+Cで終了")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
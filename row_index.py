@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+行オフセット索引モジュール
+年毎の分割ファイル（merged_survey_{年}.csv, *_converted_{年}.csv）ごとに、
+行番号 → バイト位置 と、回答日ごとの行の範囲を記録したサイドカー索引（{ファイル名}.idx）を作成し、
+ファイルを先頭から解析せずに、mmapで指定した行・期間だけを読み込む機能を提供
+
+索引ファイルの形式:
+  - マジックナンバー SURVIDX1（8バイト）
+  - ヘッダーJSONの長さ（uint32、リトルエンディアン）とヘッダーJSON
+  - 各行の開始位置（行数+1個、最後はファイルの終わり。4GB未満のファイルはuint32、それ以上はuint64）
+  - 回答日ごとの行の範囲（日付YYYYMMDD, 開始行, 行数 のuint32の3つ組、日付順に出力したファイルでは1日1組）
+
+CSVファイルのサイズ・更新日時と内容全体のハッシュ値で、索引が古くなっていないかを確認する
+（サイズと更新日時が同じならそのまま使い、gitでチェックアウトした場合など更新日時だけが異なる場合は
+内容全体のハッシュ値で確認する）
+"""
+
+import argparse
+import array
+import bisect
+import csv
+import io
+import json
+import mmap
+import struct
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from atomic_write import AtomicWriter, file_digest
+from date_sort import DATE_COLUMN, DATE_PATTERN
+
+INDEX_SUFFIX = ".idx"
+MAGIC = b"SURVIDX1"
+INDEX_VERSION = 2
+
+
+def index_path(csv_path) -> Path:
+    csv_path = Path(csv_path)
+    return csv_path.with_name(csv_path.name + INDEX_SUFFIX)
+
+
+def _little_endian(values: array.array) -> bytes:
+    if sys.byteorder != "little":
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_little_endian(typecode: str, data) -> array.array:
+    values = array.array(typecode)
+    values.frombytes(data)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+def _uint_typecode(value: int) -> str:
+    """指定した値を格納できる符号なし整数の型（uint32 / uint64）"""
+    return "I" if value < 2 ** 32 else "Q"
+
+
+def _typecode_for_size(itemsize: int) -> str:
+    return {4: "I", 8: "Q"}[itemsize]
+
+
+def file_signature(csv_path, digest: Optional[str] = None) -> dict:
+    """
+    索引が対象のファイルと一致するかを確認するための、サイズ・更新日時と内容全体のハッシュ値
+    digestには書き込み時に計算したハッシュ値（AtomicWriter.digest）を渡せる（ファイルを読み直さない）
+    """
+    stat = Path(csv_path).stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "digest": digest or file_digest(Path(csv_path))}
+
+
+def signature_matches(csv_path, signature: Optional[dict]) -> bool:
+    """ファイルがsignatureの作成時と同じ内容か（更新日時だけが異なる場合は内容全体のハッシュ値で確認）"""
+    if not signature:
+        return False
+    try:
+        stat = Path(csv_path).stat()
+    except OSError:
+        return False
+    if stat.st_size != signature.get("size"):
+        return False
+    if stat.st_mtime_ns == signature.get("mtime_ns"):
+        return True
+    return file_digest(Path(csv_path)) == signature.get("digest")
+
+
+def day_number(value: str) -> int:
+    """回答日をYYYYMMDDの整数に変換（解析できない場合・存在しない日付の場合は0）"""
+    match = DATE_PATTERN.search(value or "")
+    if not match:
+        return 0
+    year, month, day = (int(part) for part in match.groups()[:3])
+    try:
+        date(year, month, day)
+    except ValueError:
+        return 0
+    return year * 10000 + month * 100 + day
+
+
+def _records(f) -> Iterator[Tuple[int, bytes]]:
+    """CSVファイルのレコード（引用符内の改行を含む）ごとに、開始位置とバイト列を返す"""
+    offset = f.tell()
+    record = b""
+    start = offset
+    for line in iter(f.readline, b""):
+        if not record:
+            start = offset
+        record += line
+        offset += len(line)
+        # 引用符の数が偶数ならレコードの終わり（csv.writerは値の中の引用符を2つ重ねる）
+        if record.count(b'"') % 2 == 0:
+            yield start, record
+            record = b""
+    if record:
+        yield start, record
+
+
+def build_index(csv_path, date_column: str = DATE_COLUMN, digest: Optional[str] = None) -> Path:
+    """CSVファイルの索引を作成（digestは書き込み時に計算したファイルの内容のハッシュ値）"""
+    csv_path = Path(csv_path)
+    offsets: List[int] = []
+    runs: List[Tuple[int, int, int]] = []
+    with open(csv_path, "rb") as f:
+        header_line = f.readline()
+        headers = next(csv.reader(io.StringIO(header_line.decode("utf-8-sig"))))
+        date_index = headers.index(date_column) if date_column in headers else None
+        row = 0
+        for start, record in _records(f):
+            offsets.append(start)
+            day = 0
+            if date_index is not None:
+                values = next(csv.reader(io.StringIO(record.decode("utf-8"))), [])
+                day = day_number(values[date_index]) if date_index < len(values) else 0
+            # 同じ日の行が続く間は1つの範囲にまとめる
+            if runs and runs[-1][0] == day and runs[-1][1] + runs[-1][2] == row:
+                runs[-1] = (day, runs[-1][1], runs[-1][2] + 1)
+            else:
+                runs.append((day, row, 1))
+            row += 1
+        offsets.append(f.tell())
+
+    signature = file_signature(csv_path, digest)
+    offset_type = _uint_typecode(signature["size"])
+    run_type = _uint_typecode(max(99991231, len(offsets)))
+    header = {
+        "version": INDEX_VERSION,
+        "csv": csv_path.name,
+        **signature,
+        "rows": len(offsets) - 1,
+        "headers": headers,
+        "date_column": date_column if date_index is not None else None,
+        "offset_itemsize": array.array(offset_type).itemsize,
+        "run_itemsize": array.array(run_type).itemsize,
+        "runs": len(runs),
+        "sorted": all(a[0] <= b[0] for a, b in zip(runs, runs[1:])),
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    path = index_path(csv_path)
+    with AtomicWriter(path, "wb") as out:
+        out.write(MAGIC)
+        out.write(struct.pack("<I", len(header_bytes)))
+        out.write(header_bytes)
+        out.write(_little_endian(array.array(offset_type, offsets)))
+        out.write(_little_endian(array.array(run_type, [value for run in runs for value in run])))
+    return path
+
+
+def read_index(csv_path) -> Optional[dict]:
+    """索引を読み込む（索引がない・形式が異なる・CSVファイルと一致しない場合はNone）"""
+    path = index_path(csv_path)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    if not data.startswith(MAGIC):
+        return None
+    (header_length,) = struct.unpack_from("<I", data, len(MAGIC))
+    position = len(MAGIC) + 4
+    header = json.loads(data[position:position + header_length].decode("utf-8"))
+    position += header_length
+    if header.get("version") != INDEX_VERSION or not signature_matches(csv_path, header):
+        return None
+
+    offset_size = header["offset_itemsize"] * (header["rows"] + 1)
+    offsets = _from_little_endian(_typecode_for_size(header["offset_itemsize"]),
+                                  data[position:position + offset_size])
+    position += offset_size
+    flat = _from_little_endian(_typecode_for_size(header["run_itemsize"]),
+                               data[position:position + header["run_itemsize"] * 3 * header["runs"]])
+    header["offsets"] = offsets
+    header["day_runs"] = [tuple(flat[i:i + 3]) for i in range(0, len(flat), 3)]
+    return header
+
+
+class IndexedCSV:
+    """索引を使ってCSVファイルの指定した行・期間だけを読み込む（with文で使う）"""
+
+    def __init__(self, csv_path, build: bool = True):
+        self.path = Path(csv_path)
+        index = read_index(self.path)
+        if index is None:
+            if not build:
+                raise FileNotFoundError(f"'{self.path}' の索引がないか、ファイルの内容と一致しません")
+            build_index(self.path)
+            index = read_index(self.path)
+        self.headers: List[str] = index["headers"]
+        self.offsets = index["offsets"]
+        self.day_runs: List[Tuple[int, int, int]] = index["day_runs"]
+        self.sorted = index["sorted"]
+        self._days = [run[0] for run in self.day_runs]
+        self._file = open(self.path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if index["size"] else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def rows(self, start: int = 0, stop: Optional[int] = None) -> List[List[str]]:
+        """start行目からstop行目の手前までの行（0始まり、ヘッダー行を除く）"""
+        start, stop, _ = slice(start, stop).indices(len(self))
+        if start >= stop:
+            return []
+        data = self._mmap[self.offsets[start]:self.offsets[stop]].decode("utf-8")
+        return list(csv.reader(io.StringIO(data)))
+
+    def _ranges(self, first_day: int, last_day: int) -> List[Tuple[int, int]]:
+        if self.sorted:
+            # 日付順の場合は二分探索で範囲を求める
+            lo = bisect.bisect_left(self._days, first_day)
+            hi = bisect.bisect_right(self._days, last_day)
+            selected = self.day_runs[lo:hi]
+        else:
+            selected = [run for run in self.day_runs if first_day <= run[0] <= last_day]
+        # 連続する範囲はまとめて読み込む
+        ranges: List[Tuple[int, int]] = []
+        for _, start, count in selected:
+            if ranges and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], start + count)
+            else:
+                ranges.append((start, start + count))
+        return ranges
+
+    def date_range(self, start: Optional[str] = None, end: Optional[str] = None) -> List[List[str]]:
+        """回答日がstart以上end以下（日単位）の行（元のファイルの順）"""
+        first_day = day_number(start) if start else 1
+        last_day = day_number(end) if end else 99991231
+        result: List[List[str]] = []
+        for row_start, row_stop in self._ranges(first_day, last_day):
+            result.extend(self.rows(row_start, row_stop))
+        return result
+
+    def last_days(self, days: int) -> List[List[str]]:
+        """最後の回答日から遡ってdays日分の行（例: 直近7日間）"""
+        valid = [day for day in self._days if day]
+        if not valid:
+            return []
+        last = max(valid)
+        last_date = date(last // 10000, last // 100 % 100, last % 100)
+        first_date = last_date - timedelta(days=days - 1)
+        return self.date_range(first_date.strftime("%Y/%m/%d"), last_date.strftime("%Y/%m/%d"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="年毎の分割ファイルの行オフセット索引の作成・確認")
+    parser.add_argument("paths", nargs="+", help="CSVファイル（例: output_merge/merged_survey_2024.csv）")
+    parser.add_argument("--rebuild", action="store_true", help="索引が最新でも作成し直す")
+    args = parser.parse_args()
+
+    for csv_path in args.paths:
+        if args.rebuild or read_index(csv_path) is None:
+            build_index(csv_path)
+            print(f"索引を作成しました: {index_path(csv_path)}")
+        index = read_index(csv_path)
+        print(f"  {csv_path}: {index['rows']:,} 行, 回答日の範囲 {index['runs']:,} 件, "
+              f"{'日付順' if index['sorted'] else '日付順ではない'}, "
+              f"索引 {index_path(csv_path).stat().st_size:,} バイト")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
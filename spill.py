@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+一時ファイル退避モジュール
+メモリ使用量の上限（--max-memory）を指定した場合に、マージ・年毎分割で保持する行データを
+上限を超えた時点で一時ファイル（ラン）に書き出し、読み出すときに元の順番でつなぎ直す機能を提供
+
+RowBufferはリストと同様に append / extend / len / 繰り返し（何度でも可）で使える
+すべてのRowBufferは1つのMemoryBudgetを共有し、合計の見積もりサイズが上限を超えると、
+メモリ上の行が最も多いRowBufferから順にランとして書き出す
+（追加中のバッファだけを書き出すと、書き込み済みの大きなバッファが残って小さなランが大量にできるため）
+"""
+
+import csv
+import itertools
+import shutil
+import tempfile
+import threading
+import weakref
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional
+
+# 行データのメモリ使用量の見積もり（リスト本体と、1項目あたりのstrオブジェクトの大きさ）
+ROW_OVERHEAD = 64
+FIELD_OVERHEAD = 57
+# 見積もりサイズをMemoryBudgetに反映する単位（行ごとのロックを避ける）
+FLUSH_BYTES = 256 * 1024
+
+
+def estimate_row_size(row: List[str]) -> int:
+    """1行の大まかなメモリ使用量（日本語の文字は1文字2バイトで見積もる）"""
+    return ROW_OVERHEAD + FIELD_OVERHEAD * len(row) + 2 * sum(map(len, row))
+
+
+class MemoryBudget:
+    """RowBufferが共有するメモリ使用量の上限と、ランを書き出す一時ディレクトリ"""
+
+    def __init__(self, max_bytes: int, temp_dir: Optional[Path] = None):
+        self.max_bytes = max_bytes
+        self.used = 0
+        self.peak = 0
+        self.spilled_runs = 0
+        self.spilled_bytes = 0
+        self._parent_dir = temp_dir
+        self._temp_dir: Optional[Path] = None
+        self._run_ids = itertools.count(1)
+        self._buffers = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    def reserve(self, size: int):
+        """見積もりサイズを加算し、上限を超えた場合はメモリ上の行が多いバッファから書き出す"""
+        with self._lock:
+            self.used += size
+            self.peak = max(self.peak, self.used)
+        while True:
+            with self._lock:
+                if self.used <= self.max_bytes:
+                    return
+                candidates = [b for b in self._buffers if b.memory_bytes > 0]
+            if not candidates:
+                return
+            # ロックを持たずに書き出す（書き出すバッファのロックだけを取る）
+            max(candidates, key=lambda b: b.memory_bytes).spill()
+
+    def release(self, size: int):
+        with self._lock:
+            self.used -= size
+
+    def spilled(self, size: int):
+        with self._lock:
+            self.spilled_bytes += size
+
+    def new_run_path(self) -> Path:
+        with self._lock:
+            if self._temp_dir is None:
+                self._temp_dir = Path(tempfile.mkdtemp(prefix="survey_spill_", dir=self._parent_dir))
+            self.spilled_runs += 1
+            return self._temp_dir / f"run_{next(self._run_ids):06d}.csv"
+
+    def buffer(self) -> "RowBuffer":
+        buffer = RowBuffer(self)
+        with self._lock:
+            self._buffers.add(buffer)
+        return buffer
+
+    def cleanup(self):
+        """書き出したランをすべて削除"""
+        with self._lock:
+            if self._temp_dir is not None:
+                shutil.rmtree(self._temp_dir, ignore_errors=True)
+                self._temp_dir = None
+
+    def summary(self) -> str:
+        return (f"メモリ上限 {self.max_bytes / 1024 / 1024:,.0f}MB, 見積もりピーク {self.peak / 1024 / 1024:,.1f}MB, "
+                f"一時ファイル {self.spilled_runs} 件（{self.spilled_bytes / 1024 / 1024:,.1f}MB）")
+
+
+class RowBuffer:
+    """上限を超えると一時ファイルに退避する行データのバッファ"""
+
+    def __init__(self, budget: MemoryBudget):
+        self.budget = budget
+        self._runs: List[Path] = []
+        self._rows: List[List[str]] = []
+        self._length = 0
+        # MemoryBudgetに反映済みのサイズと、未反映のサイズ
+        self._reserved = 0
+        self._pending = 0
+        # 他のスレッドのバッファからも書き出されるため、行の追加と書き出しを排他する
+        self._lock = threading.Lock()
+
+    @property
+    def memory_bytes(self) -> int:
+        """MemoryBudgetに反映済みの、メモリ上の行の見積もりサイズ"""
+        return self._reserved
+
+    def __len__(self) -> int:
+        return self._length
+
+    def append(self, row: List[str]):
+        size = estimate_row_size(row)
+        with self._lock:
+            self._rows.append(row)
+            self._length += 1
+            self._pending += size
+            pending = self._pending if self._pending >= FLUSH_BYTES else 0
+            if pending:
+                self._reserved += pending
+                self._pending = 0
+        if pending:
+            # 自分のロックを外してから反映する（上限を超えた場合は他のバッファを書き出すことがある）
+            self.budget.reserve(pending)
+
+    def extend(self, rows: Iterable[List[str]]):
+        for row in rows:
+            self.append(row)
+
+    def spill(self):
+        """メモリ上の行をランとして書き出す"""
+        with self._lock:
+            if not self._rows:
+                return
+            path = self.budget.new_run_path()
+            with open(path, "w", encoding="utf-8", newline="") as f:
+                csv.writer(f).writerows(self._rows)
+            self._runs.append(path)
+            self._rows = []
+            self._pending = 0
+            released, self._reserved = self._reserved, 0
+        self.budget.spilled(path.stat().st_size)
+        self.budget.release(released)
+
+    def __iter__(self) -> Iterator[List[str]]:
+        # 先に書き出したランから順に読み出し、最後にメモリ上の行を返す
+        with self._lock:
+            runs, rows = list(self._runs), self._rows
+        for path in runs:
+            with open(path, "r", encoding="utf-8", newline="") as f:
+                yield from csv.reader(f)
+        yield from rows
+
+    def close(self):
+        """ランを削除してメモリを解放"""
+        with self._lock:
+            for path in self._runs:
+                path.unlink(missing_ok=True)
+            self._runs = []
+            self._rows = []
+            self._length = 0
+            released, self._reserved = self._reserved, 0
+            self._pending = 0
+        self.budget.release(released)
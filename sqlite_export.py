@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQLiteエクスポートモジュール
+マージ後の統一スキーマのデータをインデックス付きのSQLiteデータベースに出力する機能を提供
+行フィンガープリントをキーにした差分更新により、毎日の実行では新しい行だけを挿入する
+"""
+
+import sqlite3
+import time
+from pathlib import Path
+from typing import Iterable, List
+
+from fingerprint import occurrence_fingerprints
+
+TABLE_NAME = "survey"
+FINGERPRINT_COLUMN = "row_fingerprint"
+
+# インデックスを作成する列
+INDEXED_COLUMNS = [
+    "アンケート回答日",
+    "対象県（富山/石川/福井）",
+    "居住都道府県",
+    "年代",
+]
+
+
+def quote_identifier(name: str) -> str:
+    """SQLの識別子としてクォート"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+class SQLiteExporter:
+    """SQLiteエクスポートクラス"""
+
+    def __init__(self, db_path: Path, batch_size: int = 10000):
+        self.db_path = Path(db_path)
+        self.batch_size = batch_size
+
+    def _create_schema(self, conn: sqlite3.Connection, headers: List[str]):
+        """テーブルとインデックスを作成（既存のスキーマと異なる場合は作り直す）"""
+        existing = [row[1] for row in conn.execute(f"PRAGMA table_info({TABLE_NAME})")]
+        expected = [FINGERPRINT_COLUMN] + list(headers)
+        if existing and existing != expected:
+            print("  スキーマが変更されたため、テーブルを作り直します")
+            conn.execute(f"DROP TABLE {TABLE_NAME}")
+            existing = []
+
+        if not existing:
+            column_defs = ", ".join(f"{quote_identifier(h)} TEXT" for h in headers)
+            conn.execute(
+                f"CREATE TABLE {TABLE_NAME} ("
+                f"{FINGERPRINT_COLUMN} TEXT PRIMARY KEY, {column_defs}) WITHOUT ROWID"
+            )
+
+        for index, column in enumerate(INDEXED_COLUMNS):
+            if column in headers:
+                conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_{TABLE_NAME}_{index} "
+                    f"ON {TABLE_NAME} ({quote_identifier(column)})"
+                )
+
+    def export(self, headers: List[str], rows: Iterable[List[str]]) -> dict:
+        """
+        行データをSQLiteに差分更新で書き込み
+        今回のデータに存在しない行（元データで削除・変更された行）は削除する
+        """
+        start = time.perf_counter()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        column_count = len(headers)
+        placeholders = ", ".join("?" * (column_count + 1))
+        insert_sql = f"INSERT OR IGNORE INTO {TABLE_NAME} VALUES ({placeholders})"
+
+        conn = sqlite3.connect(str(self.db_path))
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                self._create_schema(conn, headers)
+                before = conn.execute(f"SELECT COUNT(*) FROM {TABLE_NAME}").fetchone()[0]
+
+                conn.execute("CREATE TEMP TABLE current_fingerprints (fp TEXT PRIMARY KEY) WITHOUT ROWID")
+                total = 0
+                batch = []
+                for fingerprint, row in occurrence_fingerprints(rows):
+                    values = list(row[:column_count])
+                    if len(values) < column_count:
+                        values.extend([""] * (column_count - len(values)))
+                    batch.append([fingerprint] + values)
+                    if len(batch) >= self.batch_size:
+                        self._flush(conn, insert_sql, batch)
+                        total += len(batch)
+                        batch = []
+                if batch:
+                    self._flush(conn, insert_sql, batch)
+                    total += len(batch)
+
+                after_insert = conn.execute(f"SELECT COUNT(*) FROM {TABLE_NAME}").fetchone()[0]
+                deleted = conn.execute(
+                    f"DELETE FROM {TABLE_NAME} WHERE {FINGERPRINT_COLUMN} "
+                    f"NOT IN (SELECT fp FROM current_fingerprints)"
+                ).rowcount
+                conn.execute("DROP TABLE current_fingerprints")
+            conn.execute("PRAGMA optimize")
+        finally:
+            conn.close()
+
+        return {
+            "rows": total,
+            "inserted": after_insert - before,
+            "deleted": deleted,
+            "seconds": time.perf_counter() - start,
+        }
+
+    @staticmethod
+    def _flush(conn: sqlite3.Connection, insert_sql: str, batch: List[list]):
+        """バッチをまとめて挿入"""
+        conn.executemany(insert_sql, batch)
+        conn.executemany(
+            "INSERT INTO current_fingerprints VALUES (?)",
+            ((values[0],) for values in batch),
+        )
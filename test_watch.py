@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+監視モードの条件付きリクエストのテスト
+ETag・Last-Modifiedを返し、一致する場合は304を返すローカルのHTTPサーバーをダウンロード元の代わりに使い、
+DataDownloader.open_url と SourceWatcher の確認（.cache/watch/validators.json への保存）を確認する
+
+  python -m unittest test_watch
+"""
+
+import json
+import os
+import tempfile
+import threading
+import unittest
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+
+from download_data import DataDownloader
+from merge_survey import CONVERSIONS, SurveyMerger
+from watch import SourceWatcher
+
+
+class SourceHandler(BaseHTTPRequestHandler):
+    """server.files（パス → 本文・ETag・Last-Modified）を返し、受信した条件付きリクエストのヘッダーを記録する"""
+
+    def do_GET(self):
+        entry = self.server.files.get(self.path)
+        if entry is None:
+            self.send_error(404)
+            return
+        if_none_match = self.headers.get("If-None-Match")
+        if_modified_since = self.headers.get("If-Modified-Since")
+        self.server.requests.append((self.path, if_none_match, if_modified_since))
+        etag, last_modified = entry.get("etag"), entry.get("last_modified")
+        if (etag and if_none_match == etag) or (not etag and last_modified and if_modified_since == last_modified):
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = entry["body"]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/csv; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        if etag:
+            self.send_header("ETag", etag)
+        if last_modified:
+            self.send_header("Last-Modified", last_modified)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SourceServerTestCase(unittest.TestCase):
+    """テストごとにローカルのHTTPサーバーと作業ディレクトリ（入力・出力・.cacheの置き場）を用意する"""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), SourceHandler)
+        self.server.files = {}
+        self.server.requests = []
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        # ダウンロード先・状態ファイルは作業ディレクトリからの相対パス
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        cwd = os.getcwd()
+        os.chdir(workdir.name)
+        self.addCleanup(os.chdir, cwd)
+        environ = mock.patch.dict(os.environ, {"SURVEY_PROGRESS": "off"})
+        environ.start()
+        self.addCleanup(environ.stop)
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}{path}"
+
+
+class OpenUrlTest(SourceServerTestCase):
+    def open(self, downloader: DataDownloader, path: str, output_path: Path):
+        response = downloader.open_url(urllib.request.Request(self.url(path)), output_path)
+        if response is None:
+            return None
+        with response:
+            return response.read()
+
+    def test_etag(self):
+        self.server.files["/toyama.csv"] = {"body": b"a,b\n1,2\n", "etag": '"v1"'}
+        downloader = DataDownloader(validators={})
+        output_path = Path("toyama.csv")
+
+        self.assertEqual(self.open(downloader, "/toyama.csv", output_path), b"a,b\n1,2\n")
+        self.assertEqual(downloader.validators, {self.url("/toyama.csv"): {"etag": '"v1"', "last_modified": None}})
+        # 出力先がまだない場合は条件付きリクエストにしない
+        self.assertEqual(self.open(downloader, "/toyama.csv", output_path), b"a,b\n1,2\n")
+        self.assertEqual(self.server.requests[-1], ("/toyama.csv", None, None))
+
+        output_path.write_bytes(b"a,b\n1,2\n")
+        self.assertIsNone(self.open(downloader, "/toyama.csv", output_path))
+        self.assertEqual(self.server.requests[-1], ("/toyama.csv", '"v1"', None))
+
+        # 変更された場合は本文と新しいETagを受け取る
+        self.server.files["/toyama.csv"] = {"body": b"a,b\n3,4\n", "etag": '"v2"'}
+        self.assertEqual(self.open(downloader, "/toyama.csv", output_path), b"a,b\n3,4\n")
+        self.assertEqual(downloader.validators[self.url("/toyama.csv")]["etag"], '"v2"')
+
+    def test_last_modified(self):
+        last_modified = "Wed, 01 Oct 2025 00:00:00 GMT"
+        self.server.files["/ishikawa.csv"] = {"body": b"x\n", "last_modified": last_modified}
+        downloader = DataDownloader(validators={})
+        output_path = Path("ishikawa.csv")
+        output_path.write_bytes(b"x\n")
+
+        self.assertEqual(self.open(downloader, "/ishikawa.csv", output_path), b"x\n")
+        self.assertIsNone(self.open(downloader, "/ishikawa.csv", output_path))
+        self.assertEqual(self.server.requests[-1], ("/ishikawa.csv", None, last_modified))
+
+    def test_without_validators(self):
+        # validatorsを指定しない場合は条件付きリクエストにせず、ETagも保存しない
+        self.server.files["/toyama.csv"] = {"body": b"a\n", "etag": '"v1"'}
+        downloader = DataDownloader()
+        output_path = Path("toyama.csv")
+        output_path.write_bytes(b"a\n")
+
+        self.assertEqual(self.open(downloader, "/toyama.csv", output_path), b"a\n")
+        self.assertEqual(self.open(downloader, "/toyama.csv", output_path), b"a\n")
+        self.assertEqual(self.server.requests[-1], ("/toyama.csv", None, None))
+        self.assertIsNone(downloader.validators)
+
+
+class SourceWatcherPollTest(SourceServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.server.files["/toyama.csv"] = {"body": "回答日,年代\n2025/04/01,20代\n".encode("utf-8"), "etag": '"v1"'}
+        self.state_path = Path(".cache/watch/validators.json")
+        self.conversion = next(c for c in CONVERSIONS if c["name"] == "toyama")
+
+    def watcher(self) -> SourceWatcher:
+        merger = SurveyMerger(source_urls={"toyama": self.url("/toyama.csv")})
+        return SourceWatcher(merger, CONVERSIONS, {"toyama": 60.0}, state_path=self.state_path)
+
+    def write_converted(self):
+        """変換済みの状態にする（変換後ファイルがない県は入力が変わっていなくても再処理される）"""
+        output = Path(self.conversion["output"])
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text("", encoding="utf-8")
+
+    def test_poll(self):
+        watcher = self.watcher()
+        self.assertTrue(watcher.poll("toyama"))
+        self.assertEqual(Path(self.conversion["inputs"][0]).read_bytes(), self.server.files["/toyama.csv"]["body"])
+        with open(self.state_path, encoding="utf-8") as f:
+            self.assertEqual(json.load(f), {self.url("/toyama.csv"): {"etag": '"v1"', "last_modified": None}})
+
+        # 変換後ファイルがあり、ダウンロード元が変わっていなければ304で再処理しない
+        self.write_converted()
+        self.assertFalse(watcher.poll("toyama"))
+        self.assertEqual(self.server.requests[-1], ("/toyama.csv", '"v1"', None))
+
+        # 再起動後も保存したETagで条件付きリクエストを続ける
+        self.assertFalse(self.watcher().poll("toyama"))
+        self.assertEqual(self.server.requests[-1], ("/toyama.csv", '"v1"', None))
+
+        self.server.files["/toyama.csv"] = {"body": "回答日,年代\n2025/04/02,30代\n".encode("utf-8"), "etag": '"v2"'}
+        self.assertTrue(watcher.poll("toyama"))
+        with open(self.state_path, encoding="utf-8") as f:
+            self.assertEqual(json.load(f)[self.url("/toyama.csv")]["etag"], '"v2"')
+
+    def test_unchanged_body_without_validators(self):
+        # ETag・Last-Modifiedを返さないダウンロード元は内容のハッシュ値で変更を判定する
+        self.server.files["/toyama.csv"] = {"body": b"a\n"}
+        watcher = self.watcher()
+        self.assertTrue(watcher.poll("toyama"))
+        self.write_converted()
+        self.assertFalse(watcher.poll("toyama"))
+        self.assertEqual(self.server.requests[-1], ("/toyama.csv", None, None))
+        with open(self.state_path, encoding="utf-8") as f:
+            self.assertEqual(json.load(f), {})
+
+    def test_failed_download_drops_validators(self):
+        watcher = self.watcher()
+        self.assertTrue(watcher.poll("toyama"))
+        self.write_converted()
+        # 失敗した場合は保存したETagを破棄し、次回は全体を取得し直す
+        del self.server.files["/toyama.csv"]
+        self.assertFalse(watcher.poll("toyama"))
+        with open(self.state_path, encoding="utf-8") as f:
+            self.assertEqual(json.load(f), {})
+        self.server.files["/toyama.csv"] = {"body": b"a\n", "etag": '"v1"'}
+        self.assertTrue(watcher.poll("toyama"))
+        self.assertEqual(self.server.requests[-1], ("/toyama.csv", None, None))
+
+
+class FukuiPollTest(SourceServerTestCase):
+    """福井県はファイル一覧（GitHub APIと同じ形式）を条件付きで確認し、一覧が変わった場合に各年度のファイルを取得する"""
+
+    def setUp(self):
+        super().setUp()
+        listing = [{"type": "file", "name": f"fukui{year}.csv", "download_url": self.url(f"/fukui{year}.csv")}
+                   for year in (2023, 2024)]
+        self.server.files["/fiscalyearly"] = {"body": json.dumps(listing).encode("utf-8"), "etag": '"list1"'}
+        self.server.files["/fukui2023.csv"] = {"body": "回答日,年代\n2023/04/01,20代\n".encode("utf-8")}
+        self.state_path = Path(".cache/watch/validators.json")
+        self.conversion = next(c for c in CONVERSIONS if c["name"] == "fukui")
+        merger = SurveyMerger(source_urls={"fukui": self.url("/fiscalyearly")})
+        self.watcher = SourceWatcher(merger, CONVERSIONS, {"fukui": 60.0}, state_path=self.state_path)
+        output = Path(self.conversion["output"])
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text("", encoding="utf-8")
+
+    def test_missing_year_is_fetched_again(self):
+        # fukui2024.csv は404（一部の年度だけ取得できた場合も取得できた分で入力ファイルを作る）
+        self.assertTrue(self.watcher.poll("fukui"))
+        input_path = Path(self.conversion["inputs"][0])
+        self.assertNotIn("2024/", input_path.read_text(encoding="utf-8"))
+        # 一覧のETagを保存しないため、次回は一覧が変わっていなくても全年度を取得し直す
+        with open(self.state_path, encoding="utf-8") as f:
+            self.assertNotIn(self.url("/fiscalyearly"), json.load(f))
+
+        self.server.files["/fukui2024.csv"] = {"body": "回答日,年代\n2024/04/01,30代\n".encode("utf-8")}
+        self.assertTrue(self.watcher.poll("fukui"))
+        listing_requests = [request for request in self.server.requests if request[0] == "/fiscalyearly"]
+        self.assertEqual(listing_requests[-1], ("/fiscalyearly", None, None))
+        self.assertIn("2024/04/01", input_path.read_text(encoding="utf-8"))
+
+        # すべての年度を取得できた後は一覧の変更がなければ304で再処理しない
+        with open(self.state_path, encoding="utf-8") as f:
+            self.assertEqual(json.load(f)[self.url("/fiscalyearly")]["etag"], '"list1"')
+        self.assertFalse(self.watcher.poll("fukui"))
+        self.assertEqual(self.server.requests[-1], ("/fiscalyearly", '"list1"', None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+全文索引モジュール
+マージ後のデータの自由記述（自由意見）を文字n-gram（既定: 2文字）に分割した転置索引を作成し、
+CSVファイルをgrepせずに、語句を含む回答を検索する機能を提供（形態素解析器は不要）
+
+  - 行番号: マージ後のファイル（merged_survey.csv）の行番号（0始まり、ヘッダー行を除く）。
+            ビットマップ索引・行オフセット索引と同じ番号のため、検索結果をそのまま結合できる
+  - 本文:   索引には保存せず、検索時に行オフセット索引（row_index.py）でマージ後のファイルから読み込む
+  - 正規化: NFKC（全角・半角の統一）、小文字化、連続する空白を1つにする
+  - 検索:   語句のn-gramをすべて含む行を転置リストの積で絞り込み、語句そのものを含むかを確認（フレーズ確認）
+            空白で区切った複数の語句はすべてを含む行を返す。n文字より短い語句は自由記述のあるすべての行を確認する
+
+マージ後のファイルを同じ県の行が連続する区間に分け、区間ごとに 県・先頭の行番号・行数・行のフィンガープリントを
+連結したハッシュ値 を保存する。次回の実行では各区間の索引済みの行が変わっていなければ、前の区間に追加された
+行数だけ後ろの区間の行番号をずらし、追加された行だけを索引に追加する
+（いずれかの区間の索引済みの行が変わった場合や、区間の並びが変わった場合は作り直す）
+
+ファイルの形式:
+  - マジックナンバー SURVTXT1（8バイト）
+  - ヘッダーJSONの長さ（uint32、リトルエンディアン）とヘッダーJSON
+    （マージ後のファイルのパスと内容の確認用の情報、n-gramの一覧と転置リストの位置、区間ごとの索引状態）
+  - 自由記述のある行の行番号
+  - 転置リスト（行番号の差分を可変長整数で符号化し、n-gramの順に連結）
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import re
+import struct
+import sys
+import time
+import unicodedata
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from atomic_write import AtomicWriter
+from fingerprint import row_fingerprint
+from row_index import IndexedCSV, file_signature, signature_matches
+
+DEFAULT_INDEX_PATH = Path("output_merge/text_index.bin")
+DEFAULT_CSV_PATH = Path("output_merge/merged_survey.csv")
+MAGIC = b"SURVTXT1"
+INDEX_VERSION = 3
+DEFAULT_NGRAM = 2
+TEXT_COLUMN = "自由意見"
+SOURCE_COLUMN = "対象県（富山/石川/福井）"
+DATE_COLUMN = "アンケート回答日"
+WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    return WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip().lower()
+
+
+def ngrams(text: str, n: int) -> set:
+    """正規化済みの文字列のn-gram（空白をまたぐものは除く）"""
+    return {text[i:i + n] for i in range(len(text) - n + 1) if " " not in text[i:i + n]}
+
+
+def encode_postings(ids: Iterable[int]) -> bytes:
+    """昇順の行番号を、前の番号との差分の可変長整数（7ビットずつ、最上位ビットが継続）に符号化"""
+    out = bytearray()
+    previous = 0
+    for row_id in ids:
+        delta = row_id - previous
+        previous = row_id
+        while delta >= 0x80:
+            out.append(delta & 0x7F | 0x80)
+            delta >>= 7
+        out.append(delta)
+    return bytes(out)
+
+
+def decode_postings(data) -> array:
+    ids = array("I")
+    value = shift = previous = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        previous += value
+        ids.append(previous)
+        value = shift = 0
+    return ids
+
+
+def _runs(ids: Iterable[int]) -> Iterator[range]:
+    """昇順の行番号を連続する範囲にまとめる（まとめて読み込むため）"""
+    for _, group in itertools.groupby(enumerate(ids), key=lambda item: item[1] - item[0]):
+        group = list(group)
+        yield range(group[0][1], group[-1][1] + 1)
+
+
+def _insert(postings: array, ids: List[int]) -> array:
+    """昇順の行番号の配列に昇順の行番号を加える（すべて末尾より後ろなら追記、そうでなければ並べ直す）"""
+    if not ids:
+        return postings
+    if not postings or postings[-1] < ids[0]:
+        postings.extend(ids)
+        return postings
+    merged = array("I", sorted(itertools.chain(postings, ids)))
+    postings[:] = merged
+    return postings
+
+
+class TextIndex:
+    """自由記述の転置索引（マージ後のファイルの行番号で引く）"""
+
+    def __init__(self, n: int = DEFAULT_NGRAM, column: str = TEXT_COLUMN, csv_path: Path = DEFAULT_CSV_PATH):
+        self.n = n
+        self.column = column
+        # 本文を読み込むマージ後のファイルと、索引を更新した時点のファイルの内容の確認用の情報
+        self.csv_path = Path(csv_path)
+        self.csv_signature: Optional[dict] = None
+        # 自由記述のある行の行番号
+        self.text_rows = array("I")
+        self.postings: Dict[str, array] = {}
+        # 同じ県の行が連続する区間ごとの [県, 先頭の行番号, 行数, 行のフィンガープリントを連結したハッシュ値]
+        self.segments: List[list] = []
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["TextIndex"]:
+        """保存済みの索引を読み込む（存在しない・形式が異なる場合はNone）"""
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if not data.startswith(MAGIC):
+            return None
+        (length,) = struct.unpack_from("<I", data, len(MAGIC))
+        position = len(MAGIC) + 4
+        header = json.loads(data[position:position + length].decode("utf-8"))
+        if header.get("version") != INDEX_VERSION:
+            return None
+        position += length
+        index = cls(header["n"], header["column"], Path(header["csv"]))
+        index.csv_signature = header["csv_signature"]
+        index.segments = header["segments"]
+        view = memoryview(data)
+        index.text_rows = decode_postings(view[position:position + header["text_rows_size"]])
+        position += header["text_rows_size"]
+        for gram, size in zip(header["grams"], header["sizes"]):
+            index.postings[gram] = decode_postings(view[position:position + size])
+            position += size
+        return index
+
+    def save(self, path: Path) -> bool:
+        """索引を保存（内容が同じ場合は書き込まない）し、書き込んだかを返す"""
+        grams = sorted(self.postings)
+        encoded = [encode_postings(self.postings[gram]) for gram in grams]
+        text_rows = encode_postings(self.text_rows)
+        header = json.dumps({
+            "version": INDEX_VERSION,
+            "n": self.n,
+            "column": self.column,
+            "csv": self.csv_path.as_posix(),
+            "csv_signature": self.csv_signature,
+            "rows": sum(segment[2] for segment in self.segments),
+            "segments": self.segments,
+            "documents": len(self.text_rows),
+            "text_rows_size": len(text_rows),
+            "grams": grams,
+            "sizes": [len(postings) for postings in encoded],
+        }, ensure_ascii=False).encode("utf-8")
+        atomic = AtomicWriter(path, "wb")
+        with atomic as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<I", len(header)))
+            f.write(header)
+            f.write(text_rows)
+            for postings in encoded:
+                f.write(postings)
+        return atomic.changed
+
+    def _add_rows(self, texts: List[Tuple[int, str]]):
+        """行番号の昇順の (行番号, 自由記述) を索引に追加（既存の行番号より前の行は並べ直す）"""
+        added: Dict[str, List[int]] = {}
+        for row_id, text in texts:
+            for gram in ngrams(normalize_text(text), self.n):
+                added.setdefault(gram, []).append(row_id)
+        _insert(self.text_rows, [row_id for row_id, _ in texts])
+        for gram, ids in added.items():
+            postings = self.postings.get(gram)
+            if postings is None:
+                self.postings[gram] = array("I", ids)
+            else:
+                self.postings[gram] = _insert(postings, ids)
+
+    def update(self, headers: List[str], rows: Iterable[List[str]], csv_path: Path = DEFAULT_CSV_PATH) -> dict:
+        """
+        マージ後のデータ（csv_pathに書き出した行と同じ順番）で索引を更新する
+        （作り直す場合はrowsを2回読み出すため、リストやRowBufferのように繰り返し読み出せるものを渡す）
+        各区間の索引済みの行が変わっていなければ、行番号をずらして追加された行だけを索引に追加し、
+        変わった場合は作り直す
+        """
+        if self.column not in headers:
+            raise ValueError(f"'{self.column}' カラムが見つかりません")
+        text_index = headers.index(self.column)
+        source_index = headers.index(SOURCE_COLUMN) if SOURCE_COLUMN in headers else None
+        previous = self.segments
+
+        # 区間ごとの [県, 先頭の行番号, 行数, ハッシュ, 前回の行数, 前回の行数までのハッシュ値]
+        segments: List[list] = []
+        # 前回の区間の行数を超えた行（作り直さない場合に追加する行）
+        pending: List[Tuple[int, str]] = []
+        row_count = 0
+        for row_id, row in enumerate(rows):
+            source = row[source_index] if source_index is not None and source_index < len(row) else ""
+            if not segments or segments[-1][0] != source:
+                old = previous[len(segments)] if len(segments) < len(previous) else None
+                old_rows = old[2] if old and old[0] == source else 0
+                segments.append([source, row_id, 0, hashlib.blake2b(), old_rows, None])
+            segment = segments[-1]
+            segment[3].update(row_fingerprint(row).encode("ascii"))
+            segment[2] += 1
+            if segment[2] == segment[4]:
+                segment[5] = segment[3].hexdigest()
+            if segment[2] > segment[4]:
+                text = row[text_index] if text_index < len(row) else ""
+                if text.strip():
+                    pending.append((row_id, text))
+            row_count = row_id + 1
+
+        unchanged = not previous or (Path(csv_path) == self.csv_path and len(segments) >= len(previous) and all(
+            new[5] == old[3] for new, old in zip(segments, previous)))
+        start = len(self.text_rows)
+        if not unchanged:
+            self.text_rows = array("I")
+            self.postings = {}
+            start = 0
+            pending = []
+            for row_id, row in enumerate(rows):
+                text = row[text_index] if text_index < len(row) else ""
+                if text.strip():
+                    pending.append((row_id, text))
+        elif any(new[1] != old[1] for new, old in zip(segments, previous)):
+            # 前の区間に行が追加された分だけ、後ろの区間の索引済みの行番号をずらす
+            mapping = array("I")
+            for new, old in zip(segments, previous):
+                mapping.extend(range(new[1], new[1] + old[2]))
+            self.text_rows = array("I", (mapping[row_id] for row_id in self.text_rows))
+            self.postings = {gram: array("I", (mapping[row_id] for row_id in postings))
+                             for gram, postings in self.postings.items()}
+        self._add_rows(pending)
+
+        self.csv_path = Path(csv_path)
+        self.csv_signature = file_signature(csv_path) if self.csv_path.exists() else None
+        self.segments = [[source, first, count, digest.hexdigest()]
+                         for source, first, count, digest, _, _ in segments]
+        return {"rows": row_count, "added": len(self.text_rows) - start,
+                "documents": len(self.text_rows), "grams": len(self.postings), "rebuilt": not unchanged}
+
+    def _candidates(self, phrase: str) -> Optional[array]:
+        """フレーズのn-gramをすべて含む行番号（n文字より短い場合はNone = 自由記述のあるすべての行）"""
+        grams = ngrams(phrase, self.n)
+        if not grams:
+            return None
+        lists = sorted((self.postings.get(gram, array("I")) for gram in grams), key=len)
+        if not lists[0]:
+            return array("I")
+        candidates = set(lists[0])
+        for postings in lists[1:]:
+            candidates.intersection_update(postings)
+            if not candidates:
+                break
+        return array("I", sorted(candidates))
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[dict]:
+        """
+        語句を含む回答を返す（空白で区切った語句はすべてを含むもの）
+        各結果は 行番号（マージ後のファイルの行番号）、対象県、回答日、自由記述 を持つ
+        マージ後のファイルが索引の更新後に変更されている場合はValueError
+        """
+        phrases = [phrase for phrase in normalize_text(query).split(" ") if phrase]
+        if not phrases:
+            return []
+        candidates = None
+        for phrase in phrases:
+            ids = self._candidates(phrase)
+            if ids is not None:
+                candidates = ids if candidates is None else array("I", sorted(set(candidates) & set(ids)))
+        if candidates is None:
+            candidates = self.text_rows
+        if not candidates:
+            return []
+
+        if not signature_matches(self.csv_path, self.csv_signature):
+            raise ValueError(f"'{self.csv_path}' が索引の作成後に変更されています。索引を作成し直してください")
+        results = []
+        with IndexedCSV(self.csv_path) as indexed:
+            headers = indexed.headers
+            text_index = headers.index(self.column)
+            source_index = headers.index(SOURCE_COLUMN)
+            date_index = headers.index(DATE_COLUMN)
+            for run in _runs(candidates):
+                for row_id, row in zip(run, indexed.rows(run.start, run.stop)):
+                    text = row[text_index] if text_index < len(row) else ""
+                    # n-gramをすべて含んでも語句として並んでいるとは限らないため、本文で確認する
+                    normalized = normalize_text(text)
+                    if all(phrase in normalized for phrase in phrases):
+                        results.append({"row": row_id, "対象県": row[source_index], "回答日": row[date_index],
+                                        "text": text})
+                        if limit is not None and len(results) >= limit:
+                            return results
+        return results
+
+
+def snippet(text: str, query: str, width: int = 30) -> str:
+    """最初に見つかった語句の前後を切り出す"""
+    normalized = normalize_text(text)
+    phrase = normalize_text(query).split(" ")[0]
+    position = normalized.find(phrase) if phrase else -1
+    if position < 0:
+        return normalized[:width * 2]
+    start = max(position - width, 0)
+    end = min(position + len(phrase) + width, len(normalized))
+    return ("…" if start else "") + normalized[start:end] + ("…" if end < len(normalized) else "")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="自由記述の全文索引から語句を含む回答を検索")
+    parser.add_argument("query", help="検索する語句（空白で区切るとすべてを含む回答）")
+    parser.add_argument("--index", default=str(DEFAULT_INDEX_PATH), metavar="PATH",
+                        help=f"全文索引のファイル（既定: {DEFAULT_INDEX_PATH}）")
+    parser.add_argument("--limit", type=int, default=20, metavar="N", help="表示する件数（既定: 20、0はすべて）")
+    args = parser.parse_args()
+
+    index = TextIndex.load(Path(args.index))
+    if index is None:
+        print(f"エラー: 全文索引 '{args.index}' を読み込めません（merge_survey.py --text-index で作成）", file=sys.stderr)
+        return 1
+    start = time.perf_counter()
+    try:
+        results = index.search(args.query)
+    except (OSError, ValueError) as e:
+        print(f"エラー: {e}（merge_survey.py --text-index で作成）", file=sys.stderr)
+        return 1
+    elapsed = time.perf_counter() - start
+    print(f"該当 {len(results):,} 件 / {len(index.text_rows):,} 件 ({elapsed * 1000:.1f}ミリ秒)")
+    for result in results[:args.limit or None]:
+        print(f"  {result['row']:>7} [{result['対象県']} {result['回答日']}] {snippet(result['text'], args.query)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+未対応の回答の検出モジュール
+変換スクリプトの行ループの中で、変換の対応表・キーワードに当てはまらなかった回答を数え、
+列マッピングやキーワードを更新すべき値を実行ごとのレポートにまとめる機能を提供
+
+  - 満足度:   対応表にない回答（数値に変換されずにそのまま出力された値）
+  - 複数選択: 目的・交通手段・情報源をカンマで区切った選択肢のうち、どのフラグのキーワードにも
+              当てはまらないもの（情報源は「その他」のフラグだけが立つ）
+  - 日付:     解析できなかった回答日の形式（数字を9に置き換えた形）
+
+値ごとの件数はMisra-Gries法（column_stats.HeavyHitters）で上位の値だけを保持するため、
+入力が大きくてもメモリ使用量は一定（件数は実際より最大 error 少ない）。
+選択肢がキーワードに当てはまるかは選択肢ごとに1度だけ判定する
+"""
+
+import re
+from typing import Callable, Dict, Optional
+
+from column_stats import HeavyHitters
+
+DATE_COLUMN = "アンケート回答日"
+DATETIME_PATTERN = re.compile(r"\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2}$")
+DIGITS = re.compile(r"\d")
+# 値ごとに保持する候補の数と、レポートに出力する件数
+CAPACITY = 50
+TOP_K = 20
+# 変換の最後に表示する件数
+SHOW = 3
+CATEGORIES = {"satisfaction": "満足度", "choices": "複数選択", "date_formats": "日付"}
+
+
+class UnmappedCounter:
+    """1つの列の未対応の回答の件数"""
+
+    def __init__(self):
+        self.misses = 0
+        self.values = HeavyHitters(CAPACITY)
+
+    def add(self, value: str):
+        self.misses += 1
+        self.values.add(value)
+
+    def to_dict(self) -> dict:
+        return {"misses": self.misses, "top": self.values.top(TOP_K), "error": self.values.error}
+
+
+class UnmappedTracker:
+    """1県の変換で対応表・キーワードに当てはまらなかった回答"""
+
+    def __init__(self, source: str):
+        self.source = source
+        self.counters: Dict[str, Dict[str, UnmappedCounter]] = {category: {} for category in CATEGORIES}
+        # (列名, 選択肢) → いずれかのフラグのキーワードに当てはまるか
+        self._matched: Dict[tuple, bool] = {}
+
+    def _record(self, category: str, column: str, value: str):
+        counter = self.counters[category].get(column)
+        if counter is None:
+            counter = self.counters[category][column] = UnmappedCounter()
+        counter.add(value)
+
+    def satisfaction(self, column: str, raw: str, converted):
+        """満足度の変換結果が数値でなければ未対応の回答として数える"""
+        if isinstance(converted, str) and converted.strip():
+            self._record("satisfaction", column, raw.strip())
+
+    def date(self, raw: str, formatted: str):
+        """回答日が yyyy/MM/dd hh:mm:ss 形式に変換できなかった場合は形式を数える"""
+        if raw and raw.strip() and not DATETIME_PATTERN.match(formatted):
+            self._record("date_formats", DATE_COLUMN, DIGITS.sub("9", raw.strip()))
+
+    def choices(self, column: str, text: str, parse: Callable[[str], dict], fallback: Optional[str] = None):
+        """
+        複数選択の回答をカンマで区切り、parse（フラグの判定関数）でどのフラグも立たない選択肢を数える
+        fallbackはキーワードに当てはまらない場合に立つフラグ（情報源の「その他」）
+        """
+        if not text:
+            return
+        for choice in text.split(","):
+            choice = choice.strip().strip('"').strip()
+            if not choice:
+                continue
+            key = (column, choice)
+            matched = self._matched.get(key)
+            if matched is None:
+                flags = parse(choice)
+                matched = self._matched[key] = any(value for name, value in flags.items() if name != fallback)
+            if not matched:
+                self._record("choices", column, choice)
+
+    def summary(self) -> dict:
+        """実行レポートに記録する未対応の回答（カテゴリ → 列名 → 件数と上位の値）"""
+        return {category: {column: counter.to_dict() for column, counter in sorted(columns.items())}
+                for category, columns in self.counters.items()}
+
+    def print_summary(self):
+        total = sum(counter.misses for columns in self.counters.values() for counter in columns.values())
+        if not total:
+            print(f"未対応の回答: ありません（{self.source}）")
+            return
+        print(f"未対応の回答: {total} 件（{self.source}）")
+        for category, columns in self.counters.items():
+            for column, counter in columns.items():
+                top = ", ".join(f"{value}（{count}）" for value, count in counter.values.top(SHOW))
+                print(f"  {CATEGORIES[category]} {column}: {counter.misses} 件 例: {top}")
+
+
+def collect_summaries(stages: list) -> Dict[str, dict]:
+    """実行レポートの処理段階（サブ段階を含む）から県ごとの未対応の回答を集める"""
+    summaries = {}
+    for stage in stages:
+        if stage.get("unmapped") is not None:
+            summaries[stage.get("prefecture")] = stage["unmapped"]
+        summaries.update(collect_summaries(stage.get("substages", [])))
+    return summaries
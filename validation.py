@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+行の検証モジュール
+変換スクリプトの行ループの中で、変換後の行が統一スキーマ（列マッピングJSONのキー、126列）の
+宣言に合っているかを検証する機能を提供
+
+  - 列数が統一スキーマの列数と同じ
+  - 対象県が 富山/石川/福井 のいずれか
+  - アンケート回答日が yyyy/MM/dd hh:mm:ss 形式に正規化されている
+  - 満足度が空欄または1〜5（対応表にない回答がそのまま残っていない）
+  - 目的・交通手段・情報源のフラグ列が0または1
+
+列ごとの検証は開始時に列の位置と許容値の集合に変換しておき、行ごとには集合の検索と正規表現の照合だけを行う
+
+モード:
+  count       違反を列・規則ごとに数えて表示する（既定）
+  quarantine  違反した行を変換後ファイルに書かず quarantine/{県名}_quarantine.csv に退避する
+  fail        最初の違反で変換を中止する
+  off         検証しない
+"""
+
+import argparse
+import csv
+import re
+from collections import Counter
+from pathlib import Path
+from typing import List, Optional
+
+from atomic_write import AtomicWriter
+
+VALIDATION_MODES = ("count", "quarantine", "fail", "off")
+DEFAULT_MODE = "count"
+QUARANTINE_DIR = Path("quarantine")
+# 違反の例として表示する件数
+EXAMPLES = 5
+
+# 統一スキーマの列数
+UNIFIED_COLUMN_COUNT = 126
+# 値の種類を宣言する列（宣言にない列は任意の文字列）
+COLUMN_KINDS = {
+    "対象県（富山/石川/福井）": "prefecture",
+    "アンケート回答日": "datetime",
+    "交通の満足度": "score",
+    "満足度（食べ物・料理）": "score",
+    "満足度（宿泊施設）": "score",
+    "満足度（買い物（工芸品・特産品など））": "score",
+    "満足度（観光・体験）": "score",
+    "満足度（旅行全体）": "score",
+    "満足度（商品・サービス）": "score",
+}
+# フラグ列（0/1）の範囲（先頭の列, 末尾の列）
+FLAG_RANGES = (
+    ("自家用車", "県外から訪れていない（福井県在住）"),
+    ("タクシー", "レンタサイクル"),
+    ("宿でのんびり過ごす", "その他の目的"),
+    ("Facebook", "その他"),
+)
+
+# 種類ごとの許容値（変換スクリプトは満足度・フラグを数値で出力するため、数値と文字列の両方を許容する）
+ALLOWED_VALUES = {
+    "prefecture": frozenset(["富山", "石川", "福井"]),
+    "score": frozenset(["", 1, 2, 3, 4, 5, "1", "2", "3", "4", "5"]),
+    "flag": frozenset([0, 1, "0", "1"]),
+}
+DATETIME_PATTERN = re.compile(r"\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2}$")
+RULE_NAMES = {
+    "prefecture": "対象県ではない",
+    "datetime": "日付が正規化されていない",
+    "score": "満足度が1〜5ではない",
+    "flag": "フラグが0/1ではない",
+}
+
+
+class SchemaViolation(ValueError):
+    """failモードで違反を検出した場合の例外"""
+
+
+def column_kinds(headers: List[str]) -> dict:
+    """列名 → 値の種類（宣言された列のみ）"""
+    kinds = {name: kind for name, kind in COLUMN_KINDS.items() if name in headers}
+    for first, last in FLAG_RANGES:
+        if first in headers and last in headers:
+            for name in headers[headers.index(first):headers.index(last) + 1]:
+                kinds[name] = "flag"
+    return kinds
+
+
+def validation_mode(argv: List[str]) -> str:
+    """変換スクリプトの引数から --validate の値を取り出す（指定がない場合は既定のモード）"""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--validate", choices=VALIDATION_MODES, default=DEFAULT_MODE)
+    return parser.parse_known_args(argv)[0].validate
+
+
+class RowValidator:
+    """
+    変換後の行の検証
+    with RowValidator(...) as validator: の中で accept(row) が True を返した行だけを出力する
+    """
+
+    def __init__(self, source: str, headers: List[str], mode: str = DEFAULT_MODE, start_index: int = 0,
+                 quarantine_dir: Path = QUARANTINE_DIR):
+        if mode not in VALIDATION_MODES:
+            raise ValueError(f"未対応の検証モードです: {mode}")
+        self.source = source
+        self.headers = list(headers)
+        self.mode = mode
+        # 差分変換の場合は変換済みのレコード数から数える（違反の位置の表示用）
+        self.record = start_index
+        self.append = start_index > 0
+        self.quarantine_path = Path(quarantine_dir) / f"{source}_quarantine.csv"
+        self.violations: Counter = Counter()
+        self.invalid_rows = 0
+        self.examples: List[str] = []
+        self.quarantined: List[list] = []
+
+        if mode != "off" and len(self.headers) != UNIFIED_COLUMN_COUNT:
+            message = f"{source}: 列マッピングの列数が {len(self.headers)} 列です（統一スキーマは {UNIFIED_COLUMN_COUNT} 列）"
+            if mode == "fail":
+                raise SchemaViolation(message)
+            print(f"警告: {message}")
+        kinds = column_kinds(self.headers)
+        # 列の位置ごとの検証（許容値の集合で判定する列と、日付の列）
+        self._set_checks = [(self.headers.index(name), name, kind, ALLOWED_VALUES[kind])
+                            for name, kind in kinds.items() if kind in ALLOWED_VALUES]
+        self._date_checks = [(self.headers.index(name), name) for name, kind in kinds.items() if kind == "datetime"]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        return False
+
+    def check(self, row: list) -> List[tuple]:
+        """違反した (列名, 種類, 値) の一覧（違反がない場合は空）"""
+        if len(row) != len(self.headers):
+            return [("", "columns", len(row))]
+        problems = []
+        for index, name, kind, allowed in self._set_checks:
+            if row[index] not in allowed:
+                problems.append((name, kind, row[index]))
+        for index, name in self._date_checks:
+            value = row[index]
+            if not (isinstance(value, str) and DATETIME_PATTERN.match(value)):
+                problems.append((name, "datetime", value))
+        return problems
+
+    def accept(self, row: list) -> bool:
+        """行を検証し、変換後ファイルに出力するかを返す（failモードで違反した場合はSchemaViolation）"""
+        self.record += 1
+        if self.mode == "off":
+            return True
+        problems = self.check(row)
+        if not problems:
+            return True
+
+        self.invalid_rows += 1
+        for name, kind, _ in problems:
+            self.violations[(name, kind)] += 1
+        message = "; ".join(self._describe(name, kind, value) for name, kind, value in problems)
+        if self.mode == "fail":
+            raise SchemaViolation(f"{self.source} レコード {self.record}: {message}")
+        if len(self.examples) < EXAMPLES:
+            self.examples.append(f"レコード {self.record}: {message}")
+        if self.mode == "quarantine":
+            self.quarantined.append([self.record, message] + row)
+            return False
+        return True
+
+    @staticmethod
+    def _describe(name: str, kind: str, value) -> str:
+        if kind == "columns":
+            return f"列数が {value} 列"
+        return f"{name} {RULE_NAMES[kind]}（{str(value)[:40]!r}）"
+
+    def close(self):
+        """退避した行を保存し、違反の件数を表示する"""
+        if self.mode == "quarantine":
+            self._write_quarantine()
+        if self.mode == "off":
+            return
+        if not self.invalid_rows:
+            print(f"検証: 違反はありません（{self.source}）")
+            return
+        action = {"count": "出力しました", "quarantine": f"{self.quarantine_path} に退避しました"}[self.mode]
+        print(f"検証: {self.invalid_rows} 件の行が統一スキーマに違反しています（{action}）")
+        for (name, kind), count in self.violations.most_common():
+            label = "列数" if kind == "columns" else f"{name}: {RULE_NAMES[kind]}"
+            print(f"  {label} {count} 件")
+        for example in self.examples:
+            print(f"  例 {example}")
+
+    def _write_quarantine(self):
+        """全件変換の場合は退避ファイルを置き換え（違反がなければ削除）、差分変換の場合は追記する"""
+        headers = ["レコード番号", "違反内容"] + self.headers
+        if not self.append:
+            if not self.quarantined:
+                self.quarantine_path.unlink(missing_ok=True)
+                return
+            with AtomicWriter(self.quarantine_path) as f:
+                writer = csv.writer(f)
+                writer.writerow(headers)
+                writer.writerows(self.quarantined)
+            return
+        if not self.quarantined:
+            return
+        exists = self.quarantine_path.exists()
+        self.quarantine_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.quarantine_path, "a", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            if not exists:
+                writer.writerow(headers)
+            writer.writerows(self.quarantined)
+
+    def summary(self) -> Optional[dict]:
+        """実行レポートに記録する違反の件数（検証しない場合はNone）"""
+        if self.mode == "off":
+            return None
+        return {
+            "mode": self.mode,
+            "invalid_rows": self.invalid_rows,
+            "quarantined": len(self.quarantined),
+            "by_column": {f"{name or '列数'}:{kind}": count for (name, kind), count in self.violations.most_common()},
+        }
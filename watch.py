@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+監視モジュール
+3県のダウンロード元を県ごとの間隔で確認し、入力データが変わった県だけを変換し直して
+マージ後のファイルを更新する常駐処理（merge_survey.py --watch）を提供
+
+  - 確認: 前回の応答のETag・Last-Modifiedを使った条件付きリクエスト（変更がなければ304で本文を受け取らない）。
+          条件付きリクエストに対応していないダウンロード元は、ダウンロードしたファイルの内容のハッシュ値で変更を判定する
+  - 変換: 変わった県だけを差分変換（追加されたレコードだけを変換）し、その県の年毎の分割ファイルを更新する
+  - マージ: 変わっていない県の変換後データはメモリに保持したものを使い、ファイルを読み直さない。
+            マージ後の年毎の分割ファイルは内容が変わった年だけが書き換わる
+
+ETag・Last-Modifiedは .cache/watch/validators.json に保存し、再起動後も条件付きリクエストを続ける
+"""
+
+import json
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from atomic_write import AtomicWriter, file_digest
+from instrumentation import RunReport
+
+DEFAULT_INTERVAL = 300.0
+STATE_PATH = Path(".cache/watch/validators.json")
+
+
+def parse_intervals(values: List[str], names: List[str]) -> Dict[str, float]:
+    """「300」（すべての県）または「fukui=3600」（1県）の指定を県ごとの確認間隔（秒）に変換"""
+    intervals = {name: DEFAULT_INTERVAL for name in names}
+    for value in values or []:
+        name, _, seconds = value.rpartition("=")
+        targets = [name] if name else names
+        if name and name not in intervals:
+            raise ValueError(f"不明な県名です: {name}（{', '.join(names)}）")
+        interval = float(seconds)
+        if interval <= 0:
+            raise ValueError(f"確認間隔は正の秒数で指定してください: {value}")
+        for target in targets:
+            intervals[target] = interval
+    return intervals
+
+
+def input_digest(path: Path) -> Optional[str]:
+    try:
+        return file_digest(path)
+    except OSError:
+        return None
+
+
+class SourceWatcher:
+    """ダウンロード元を監視して変わった県だけを再処理する"""
+
+    def __init__(self, merger, conversions: List[dict], intervals: Dict[str, float], state_path: Path = STATE_PATH):
+        self.merger = merger
+        self.conversions = {conversion["name"]: conversion for conversion in conversions}
+        self.intervals = intervals
+        self.state_path = Path(state_path)
+        self.validators = self.load_validators()
+        merger.downloader.validators = self.validators
+        # 追加されたレコードだけを変換する（変換済みの範囲が変わった場合は変換スクリプトが全件を変換する）
+        merger.incremental = True
+        # 変換後ファイル → (ヘッダー, データ)（メモリ上限を指定した場合は一時ファイルを使うため保持しない）
+        self.loaded: Dict[Path, tuple] = {}
+        self.next_poll = {name: 0.0 for name in self.conversions}
+        self.stopped = threading.Event()
+
+    def load_validators(self) -> Dict[str, dict]:
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_validators(self):
+        with AtomicWriter(self.state_path) as f:
+            json.dump(self.validators, f, ensure_ascii=False, indent=1, sort_keys=True)
+
+    def poll(self, name: str) -> bool:
+        """1県のダウンロード元を確認し、入力データが変わったかを返す"""
+        conversion = self.conversions[name]
+        input_path = Path(conversion["inputs"][0])
+        before = input_digest(input_path)
+        if not self.merger.download_prefecture(conversion):
+            # 途中で失敗した場合は次回に全体を取得し直す
+            self.validators.pop(self.merger.downloader.urls[name], None)
+            print(f"警告: {name} のダウンロードに失敗しました。{self.intervals[name]:g}秒後に再確認します。")
+        self.save_validators()
+        after = input_digest(input_path)
+        return after is not None and (after != before or not Path(conversion["output"]).exists())
+
+    def rebuild(self, changed: List[str]) -> bool:
+        """変わった県を変換し直し、マージ後のファイルと追加の出力を更新"""
+        merger = self.merger
+        for name in changed:
+            conversion = self.conversions[name]
+            output = Path(conversion["output"])
+            self.loaded.pop(output, None)
+            if not merger.convert_prefecture(conversion):
+                print(f"警告: {name} の変換に失敗しました。前回の変換後ファイルでマージします。")
+                continue
+            merger.split_converted_stage(output)
+
+        print("\n=== CSVファイルのマージ ===")
+        if not merger.check_directories():
+            return False
+        csv_files = merger.find_csv_files()
+        if not csv_files:
+            return False
+        if merger.budget is None:
+            for csv_file in csv_files:
+                if csv_file not in self.loaded:
+                    headers, data = merger.read_csv_data(csv_file)
+                    if headers:
+                        self.loaded[csv_file] = (headers, data)
+        merged = merger.merge_stage(csv_files, self.loaded)
+        if merged is None:
+            return False
+        return merger.export_outputs(merged)
+
+    def run_cycle(self, names: List[str]) -> Optional[bool]:
+        """確認の時刻になった県を確認し、変わった県があれば再処理（再処理しなかった場合はNone）"""
+        merger = self.merger
+        # 実行レポートは再処理ごとに作り直す（常駐中に計測結果が増え続けないようにする）
+        profiler = merger.report.profiler
+        merger.report = RunReport(merger.report.trace_memory)
+        merger.report.profiler = profiler
+
+        print(f"\n=== ダウンロード元の確認（{datetime.now():%Y-%m-%d %H:%M:%S}） ===")
+        changed = [name for name in names if self.poll(name)]
+        first = not (merger.output_dir / "merged_survey.csv").exists()
+        if not changed and not first:
+            print("  変更はありません")
+            return None
+
+        print(f"\n=== 再処理: {', '.join(changed) or '（初回のマージ）'} ===")
+        start = time.perf_counter()
+        success = self.rebuild(changed)
+        merger.write_run_report(success, "watch")
+        merger.write_unmapped_report()
+        status = "完了" if success else "エラー"
+        print(f"\n再処理{status}（{time.perf_counter() - start:.1f}秒）")
+        return success
+
+    def run(self, max_cycles: Optional[int] = None) -> bool:
+        """停止するまで（max_cyclesを指定した場合はその回数だけ確認して）監視を続ける"""
+        intervals = ", ".join(f"{name} {interval:g}秒" for name, interval in self.intervals.items())
+        print(f"=== 監視モード（確認間隔: {intervals}、Ctrl+Cで停止） ===")
+        cycles = 0
+        success = True
+        try:
+            while not self.stopped.is_set():
+                now = time.monotonic()
+                due = [name for name, at in self.next_poll.items() if at <= now]
+                if not due:
+                    self.stopped.wait(min(self.next_poll.values()) - now)
+                    continue
+                for name in due:
+                    self.next_poll[name] = now + self.intervals[name]
+                result = self.run_cycle(due)
+                if result is not None:
+                    success = result
+                cycles += 1
+                if max_cycles is not None and cycles >= max_cycles:
+                    break
+        except KeyboardInterrupt:
+            print("\n監視を停止しました")
+        return success
+
+    def stop(self):
+        self.stopped.set()